@@ -0,0 +1,113 @@
+"""
+考勤结果单元格合并工具
+一次性读取 attendance_result 的日期单元格，在内存中合并审批记录后，
+把所有变化的单元格按 (员工ID, 列名, 新值) 写入临时表，再对每个变化的列用一条按 员工ID（有索引）关联的 UPDATE … FROM 写回
+"""
+
+import sys
+from datetime import datetime
+
+from psycopg2 import sql
+
+from bulk_load import bulk_insert
+from employees import EMPLOYEE_KEY
+
+# 每日考勤字段
+DAY_FIELDS = [f'第{i}天' for i in range(1, 32)]
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def expand_days(start_time, end_time):
+    """
+    将审批的开始/结束时间展开为涉及的日期（月内的第几天）
+
+    参数:
+        start_time (str): 开始时间，如 '2025-05-13 08:30' 或 '2025-05-07 上午'
+        end_time (str): 结束时间
+
+    返回:
+        range: 从开始日到结束日（含）的日期序号
+    """
+    start_date = datetime.strptime(start_time.split()[0], '%Y-%m-%d')
+    end_date = datetime.strptime(end_time.split()[0], '%Y-%m-%d')
+    return range(start_date.day, end_date.day + 1)
+
+def load_day_cells(cursor, employee_ids=None):
+    """
+    读取考勤结果的日期单元格
+
+    参数:
+        cursor: 数据库游标
+        employee_ids (iterable): 只读取这些员工，默认读取全部
+
+    返回:
+        dict: {员工ID: {'第N天': 值}}，同一员工有多条记录时以第一条为准
+    """
+    query = sql.SQL("SELECT {} FROM attendance_result").format(
+        sql.SQL(', ').join(map(sql.Identifier, [EMPLOYEE_KEY] + DAY_FIELDS))
+    )
+    if employee_ids is not None:
+        employee_ids = list(employee_ids)
+        if not employee_ids:
+            return {}
+        query = query + sql.SQL(" WHERE {} IN ({})").format(
+            sql.Identifier(EMPLOYEE_KEY), sql.SQL(', ').join(sql.Placeholder() * len(employee_ids))
+        )
+        cursor.execute(query, employee_ids)
+    else:
+        cursor.execute(query)
+
+    cells = {}
+    for row in cursor.fetchall():
+        employee_id = row[0]
+        if employee_id not in cells:
+            cells[employee_id] = dict(zip(DAY_FIELDS, row[1:]))
+    return cells
+
+def write_day_cells(conn, changes):
+    """
+    将变化的单元格一次性写回 attendance_result
+
+    参数:
+        conn: 数据库连接
+        changes (dict): {(员工ID, '第N天'): 新值}
+
+    返回:
+        int: 更新的员工行数
+    """
+    if not changes:
+        return 0
+
+    changed_fields = [field for field in DAY_FIELDS if any(col == field for _, col in changes)]
+
+    cursor = conn.cursor()
+    try:
+        # 每个变化的单元格一行 (员工ID, 列名, 新值)，新值为空时写入空字符串
+        # 出错回滚时临时表随事务一起撤销，正常结束时在下面显式删除
+        cursor.execute(sql.SQL("CREATE TEMP TABLE attendance_changes ({key} INTEGER, 列名 TEXT, 值 TEXT, PRIMARY KEY ({key}, 列名))").format(
+            key=sql.Identifier(EMPLOYEE_KEY)
+        ))
+        bulk_insert(conn, 'attendance_changes', [EMPLOYEE_KEY, '列名', '值'], (
+            (employee_id, col, value) for (employee_id, col), value in changes.items()
+        ), null='', missing_strings=True)
+        for field in changed_fields:
+            cursor.execute(sql.SQL("""
+                UPDATE attendance_result AS a
+                SET {field} = s.值
+                FROM attendance_changes AS s
+                WHERE a.{key} = s.{key} AND s.列名 = %s
+            """).format(field=sql.Identifier(field), key=sql.Identifier(EMPLOYEE_KEY)), (field,))
+        cursor.execute(sql.SQL(
+            "SELECT count(*) FROM attendance_result WHERE {key} IN (SELECT {key} FROM attendance_changes)"
+        ).format(key=sql.Identifier(EMPLOYEE_KEY)))
+        updated = cursor.fetchone()[0]
+        cursor.execute("DROP TABLE attendance_changes")
+    finally:
+        cursor.close()
+
+    flush_print(f"✅ 已写回 {len(changes)} 个单元格，涉及 {updated} 行考勤记录")
+    return updated
@@ -1,12 +1,13 @@
-import psycopg2
+import numpy as np
 import pandas as pd
 import re
 from datetime import datetime
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
-from holidays import HOLIDAYS, MONTH, get_working_days
+from holidays import REST_DAYS, MONTH, get_working_days
 import os
-from config import DB_CONFIG
+import db
+from excel_export import write_sheet
+import day_status
+from employees import EMPLOYEE_KEY
 import sys
 
 # 强制刷新输出缓冲区
@@ -18,17 +19,16 @@ def flush_print(*args, **kwargs):
 # 创建输出目录
 OUTPUT_DIR = "output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+# 报表文件名前缀，批量模式下加上月份
+OUTPUT_PREFIX = "考勤明细及统计"
 
-# 生成带时间戳的输出文件名
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-output_file = os.path.join(OUTPUT_DIR, f"考勤明细及统计_{timestamp}.xlsx")
-
-def get_db_connection():
-    """创建数据库连接"""
-    return psycopg2.connect(**DB_CONFIG)
+def get_output_file():
+    """生成带时间戳的输出文件名（每次导出时生成，同一进程内多次运行不会互相覆盖）"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(OUTPUT_DIR, f"{OUTPUT_PREFIX}_{timestamp}.xlsx")
 
 def count_attendance_status(row):
-    """统计考勤状态，仅对请假排除休息日"""
+    """统计单个员工的考勤状态，仅对请假排除休息日（逐行版本，批量统计使用 count_attendance_statistics）"""
     counts = {
         "正常次数": 0,
         "迟到次数": 0,
@@ -51,9 +51,6 @@ def count_attendance_status(row):
         if not status or status == 'nan':
             continue
         
-        # 获取日期字符串
-        day_str = f"{day:02d}"
-        
         # 统计所有状态（除请假外）
         if "正常" in status:
             counts["正常次数"] += 1
@@ -69,7 +66,7 @@ def count_attendance_status(row):
             counts["出差次数"] += 1
             
         # 请假只在非休息日统计
-        if "请假" in status and day_str not in HOLIDAYS:
+        if "请假" in status and not REST_DAYS[day]:
             counts["请假次数"] += 1
             
         overtime_matches = re.findall(r'(钉钉加班|飞书加班)\((\d+\.?\d*)h\)', status)
@@ -87,8 +84,68 @@ def count_attendance_status(row):
                 continue
     return pd.Series(counts)
 
+# 统计列及对应的状态关键字（请假单独处理，休息日不计）
+STATUS_KEYWORDS = {
+    "正常次数": "正常",
+    "迟到次数": "迟到",
+    "早退次数": "早退",
+    "缺卡次数": "缺卡",
+    "旷工次数": "旷工",
+    "出差次数": "出差",
+}
+LEAVE_KEYWORD = "请假"
+OVERTIME_PATTERN = r'(钉钉加班|飞书加班)\((\d+\.?\d*)h\)'
+OVERTIME_COLUMNS = {
+    "钉钉加班": "钉钉加班时长(h)",
+    "飞书加班": "飞书加班时长(h)",
+}
+
+def count_attendance_statistics(df):
+    """
+    向量化统计考勤状态，结果与逐行调用 count_attendance_status 一致
+    
+    所有日期单元格展开为一列字符串，每种状态只做一次 str.contains，
+    按员工求和；加班时长用 str.extractall 一次提取后按员工累加
+    
+    返回:
+        pd.DataFrame: 与 df 同索引的统计列（float64）
+    """
+    days = [day for day in range(1, 32) if f"第{day}天" in df.columns]
+    n_rows, n_days = len(df), len(days)
+    cells = pd.Series(
+        df[[f"第{day}天" for day in days]].astype(str).to_numpy().ravel(),
+        dtype=object,
+    )
+    valid = ((cells != '') & (cells != 'nan')).to_numpy()
+    
+    def per_employee(mask):
+        return mask.reshape(n_rows, n_days).sum(axis=1).astype(float)
+    
+    stats = {}
+    for column, keyword in STATUS_KEYWORDS.items():
+        stats[column] = per_employee(cells.str.contains(keyword, regex=False).to_numpy() & valid)
+    
+    # 请假只在非休息日统计
+    workday = np.tile(~REST_DAYS[days], n_rows)
+    stats["请假次数"] = per_employee(cells.str.contains(LEAVE_KEYWORD, regex=False).to_numpy() & valid & workday)
+    
+    # 加班时长按出现顺序逐条累加，与逐行统计的浮点结果完全一致
+    for column in list(OVERTIME_COLUMNS.values()) + ["总加班时长(h)"]:
+        stats[column] = np.zeros(n_rows)
+    has_overtime = valid & cells.str.contains('加班', regex=False).to_numpy()
+    matches = cells[has_overtime].str.extractall(OVERTIME_PATTERN)
+    if not matches.empty:
+        rows = matches.index.get_level_values(0).to_numpy() // n_days
+        hours = matches[1].astype(float).to_numpy()
+        for source, column in OVERTIME_COLUMNS.items():
+            is_source = (matches[0] == source).to_numpy()
+            np.add.at(stats[column], rows[is_source], hours[is_source])
+        np.add.at(stats["总加班时长(h)"], rows, hours)
+    
+    return pd.DataFrame(stats, index=df.index)
+
 def format_attendance_status(status, day):
-    """格式化考勤状态，为休息日和其他状态添加标记"""
+    """格式化单个考勤状态，为休息日和其他状态添加标记（批量处理使用 format_attendance_block）"""
     if not status or str(status) == 'nan':
         return ''
         
@@ -96,8 +153,7 @@ def format_attendance_status(status, day):
     formatted = []
     
     # 检查是否为休息日
-    day_str = f"{day:02d}"
-    is_holiday = day_str in HOLIDAYS
+    is_holiday = REST_DAYS[day]
     
     # 如果是休息日，添加休息日标记
     if is_holiday:
@@ -127,25 +183,179 @@ def format_attendance_status(status, day):
             return f"{''.join(formatted)} {status}"
     return status
 
+# 状态关键字及图标，按显示顺序排列
+STATUS_ICONS = [
+    ("正常", "✅"),
+    ("迟到", "⏰"),
+    ("早退", "⚡"),
+    ("缺卡", "❌"),
+    ("旷工", "⛔"),
+    ("出差", "🚗"),
+    ("请假", "📝"),
+]
+HOLIDAY_ICON = "🏠"
+
+def format_attendance_block(df):
+    """
+    向量化格式化全部日期列，结果与逐格调用 format_attendance_status 一致
+    
+    每种状态对整块单元格求一次布尔掩码并拼接为图标前缀，休息日按列统一处理
+    
+    返回:
+        pd.DataFrame: 与 df 同索引的格式化日期列
+    """
+    day_cols = [f"第{day}天" for day in range(1, 32) if f"第{day}天" in df.columns]
+    values = df[day_cols].to_numpy(dtype=object)
+    texts = df[day_cols].astype(str).to_numpy(dtype=object)
+    blank = (values == None) | (texts == '') | (texts == 'nan')  # noqa: E711  逐元素比较
+    
+    cells = pd.Series(texts.ravel(), dtype=object)
+    prefix = np.full(texts.shape, '', dtype=object)
+    for keyword, icon in STATUS_ICONS:
+        mask = cells.str.contains(keyword, regex=False).to_numpy().reshape(texts.shape)
+        prefix = prefix + np.where(mask, icon, '')
+    
+    # 休息日在日历中按列确定：所有非空单元格都带休息日标记
+    holiday = REST_DAYS[[int(col[1:-1]) for col in day_cols]]
+    holiday = np.broadcast_to(holiday, texts.shape)
+    formatted = np.where(
+        holiday,
+        HOLIDAY_ICON + prefix + " 休息日\n" + texts,
+        np.where(prefix != '', prefix + " " + texts, texts),
+    )
+    formatted = np.where(blank, '', formatted)
+    return pd.DataFrame(formatted, index=df.index, columns=day_cols)
+
+# 统计列 / 图标对应的状态位，与 STATUS_KEYWORDS、STATUS_ICONS 的顺序一致
+STATUS_FLAGS = {
+    "正常次数": day_status.FLAG_NORMAL,
+    "迟到次数": day_status.FLAG_LATE,
+    "早退次数": day_status.FLAG_EARLY,
+    "缺卡次数": day_status.FLAG_MISSING,
+    "旷工次数": day_status.FLAG_ABSENT,
+    "出差次数": day_status.FLAG_TRIP,
+    "请假次数": day_status.FLAG_LEAVE,
+}
+
+def match_matrix_rows(employee_ids, matrix):
+    """
+    把数据库中读出的行对应到考勤状态矩阵的行（按 员工ID 及同一员工的出现次序）
+    
+    参数:
+        employee_ids (pd.Series): 数据库中每行的 员工ID
+    
+    返回:
+        np.ndarray: 每行对应的矩阵行号；行数或员工不一致时返回 None
+    """
+    if matrix is None or employee_ids is None or len(matrix.ids) != len(employee_ids):
+        return None
+    ids = pd.Series(matrix.ids)
+    matrix_keys = pd.MultiIndex.from_arrays([ids, ids.groupby(ids).cumcount()])
+    df_ids = employee_ids.astype('int64').reset_index(drop=True)
+    df_keys = pd.MultiIndex.from_arrays([df_ids.to_numpy(), df_ids.groupby(df_ids).cumcount().to_numpy()])
+    rows = matrix_keys.get_indexer(df_keys)
+    if (rows < 0).any():
+        return None
+    return rows
+
+def count_matrix_statistics(df, matrix, rows):
+    """
+    直接由状态位统计考勤状态，不再解析单元格文本
+    
+    返回:
+        pd.DataFrame: 与 df 同索引的统计列（float64），列与 count_attendance_statistics 一致
+    """
+    flags = matrix.flags[rows]
+    n_days = flags.shape[1]
+    stats = {
+        column: ((flags & flag) != 0).sum(axis=1).astype(float)
+        for column, flag in STATUS_FLAGS.items() if column != "请假次数"
+    }
+    
+    # 请假只在非休息日统计
+    workday = ~REST_DAYS[1:n_days + 1]
+    stats["请假次数"] = (((flags & day_status.FLAG_LEAVE) != 0) & workday).sum(axis=1).astype(float)
+    
+    # 加班时长按员工、日期及写入顺序逐条累加，与按文本统计的浮点结果一致
+    for column in list(OVERTIME_COLUMNS.values()) + ["总加班时长(h)"]:
+        stats[column] = np.zeros(len(df))
+    entry_rows, sources, hours = matrix.overtime_entries()
+    if len(entry_rows):
+        position = np.empty(len(matrix.ids), dtype=np.int64)
+        position[rows] = np.arange(len(rows))
+        entry_rows = position[entry_rows]
+        order = np.argsort(entry_rows, kind='stable')
+        entry_rows, hours = entry_rows[order], hours[order]
+        sources = np.array([f"{source}加班" for source in sources], dtype=object)[order]
+        counted = np.isin(sources, list(OVERTIME_COLUMNS))
+        for source, column in OVERTIME_COLUMNS.items():
+            is_source = sources == source
+            np.add.at(stats[column], entry_rows[is_source], hours[is_source])
+        np.add.at(stats["总加班时长(h)"], entry_rows[counted], hours[counted])
+    
+    return pd.DataFrame(stats, index=df.index)
+
+def format_matrix_block(df, matrix, rows):
+    """
+    按状态位为日期列添加图标，显示文本仍使用数据库中的单元格文本
+    
+    返回:
+        pd.DataFrame: 与 df 同索引的格式化日期列，格式与 format_attendance_block 一致
+    """
+    day_cols = [f"第{day}天" for day in range(1, 32) if f"第{day}天" in df.columns]
+    values = df[day_cols].to_numpy(dtype=object)
+    texts = df[day_cols].astype(str).to_numpy(dtype=object)
+    blank = (values == None) | (texts == '') | (texts == 'nan')  # noqa: E711  逐元素比较
+    
+    flags = matrix.flags[rows][:, :len(day_cols)]
+    prefix = np.full(texts.shape, '', dtype=object)
+    for (_, icon), flag in zip(STATUS_ICONS, STATUS_FLAGS.values()):
+        prefix = prefix + np.where((flags & flag) != 0, icon, '')
+    
+    holiday = REST_DAYS[[int(col[1:-1]) for col in day_cols]]
+    holiday = np.broadcast_to(holiday, texts.shape)
+    formatted = np.where(
+        holiday,
+        HOLIDAY_ICON + prefix + " 休息日\n" + texts,
+        np.where(prefix != '', prefix + " " + texts, texts),
+    )
+    formatted = np.where(blank, '', formatted)
+    return pd.DataFrame(formatted, index=df.index, columns=day_cols)
+
 def analyze_attendance():
     """分析考勤数据并添加统计结果"""
-    conn = get_db_connection()
+    conn = db.get_connection()
     try:
-        query = """
-        SELECT * FROM attendance_result
-        """
-        df = pd.read_sql_query(query, conn)
+        # 按 员工ID（即基础考勤表中的顺序）导出，不受写回时行物理位置变化的影响
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT * FROM attendance_result ORDER BY "员工ID"')
+            df = pd.DataFrame(cursor.fetchall(), columns=[desc[0] for desc in cursor.description])
+        finally:
+            cursor.close()
+        
+        # 员工ID 只用于关联，不导出
+        employee_ids = df.pop(EMPLOYEE_KEY) if EMPLOYEE_KEY in df.columns else None
+        
+        # 流水线中有考勤状态矩阵时直接按状态位统计，单独运行时解析单元格文本
+        matrix = day_status.current()
+        rows = match_matrix_rows(employee_ids, matrix)
+        if matrix is not None and rows is None:
+            flush_print("⚠️ 考勤状态矩阵与数据库记录不一致，改为按单元格文本统计")
         
         # 计算统计结果并添加到原DataFrame
-        statistics = df.apply(count_attendance_status, axis=1)
+        if rows is not None:
+            statistics = count_matrix_statistics(df, matrix, rows)
+        else:
+            statistics = count_attendance_statistics(df)
         df = pd.concat([df, statistics], axis=1)
         
-        # 在导出到Excel之前，格式化考勤状态
-        for day in range(1, 32):
-            day_col = f"第{day}天"
-            if day_col in df.columns:
-                # 传入当前日期以判断是否为休息日
-                df[day_col] = df.apply(lambda row: format_attendance_status(row[day_col], day), axis=1)
+        # 在导出到Excel之前，格式化考勤状态（整块日期列一次处理）
+        if rows is not None:
+            formatted = format_matrix_block(df, matrix, rows)
+        else:
+            formatted = format_attendance_block(df)
+        df[formatted.columns] = formatted
         
         # 添加应出勤天数列
         working_days = get_working_days()
@@ -173,70 +383,26 @@ def analyze_attendance():
             49: ('总加班时长(h)', 15)  
         }
         
-        # 导出到Excel时设置更好的格式
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='考勤明细')
-            
-            # 获取工作簿和工作表
-            workbook = writer.book
-            worksheet = writer.sheets['考勤明细']
-            
-            # 导入所需的样式
-            from openpyxl.utils import get_column_letter
-            from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
-            
-            # 设置表头样式
-            header_font = Font(name='微软雅黑', bold=True, size=11, color='000000')
-            header_fill = PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid')
-            border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-            header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-            
-            # 应用表头样式
-            for cell in worksheet[1]:
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.border = border
-                cell.alignment = header_alignment
-            
-            # 冻结首行
-            worksheet.freeze_panes = 'B2'
+        # 设置列宽
+        base_columns = {
+            1: ('姓名', 15),
+            2: ('考勤组', 20),
+            3: ('部门', 25),
+            4: ('工号', 12),
+            5: ('职位', 15),
+            6: ('UserId', 20)
+        }
+        column_widths = {col_num: width for col_num, (_, width) in base_columns.items()}
+        # 每日考勤列（第7列到第37列）
+        for i in range(7, 38):
+            column_widths[i] = 40
+        # 统计列
+        for col_num, (_, width) in stat_columns.items():
+            column_widths[col_num] = width
         
-            
-            # 设置列宽
-            base_columns = {
-                'A': ('姓名', 15),
-                'B': ('考勤组', 20),
-                'C': ('部门', 25),
-                'D': ('工号', 12),
-                'E': ('职位', 15),
-                'F': ('UserId', 20)
-            }
-            
-            # 设置基础列的宽度
-            for col, (_, width) in base_columns.items():
-                worksheet.column_dimensions[col].width = width
-                
-            # 设置每日考勤列宽度（第7列到第37列）
-            for i in range(7, 38):
-                col_letter = get_column_letter(i)
-                worksheet.column_dimensions[col_letter].width = 40  # 增加宽度
-                
-            # 应用统计列设置
-            for col_num, (col_name, width) in stat_columns.items():
-                col_letter = get_column_letter(col_num)
-                worksheet.column_dimensions[col_letter].width = width
-            
-            # 设置数据区域的对齐方式
-            data_alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
-            for row in worksheet.iter_rows(min_row=2):  # 从第二行开始
-                for cell in row:
-                    cell.alignment = data_alignment
-                    cell.border = border
+        # 流式导出到Excel：表头/数据区域使用共享样式，冻结首行首列
+        output_file = get_output_file()
+        write_sheet(output_file, df, '考勤明细', column_widths, freeze_panes='B2')
         
         flush_print(f"✅ 考勤明细及统计已导出到: {output_file}")
         
@@ -270,7 +436,7 @@ def analyze_attendance():
         
     except Exception as e:
         flush_print(f"❌ 处理出错: {e}")
-        return None
+        raise
     finally:
         conn.close()
 
@@ -1,10 +1,20 @@
-import psycopg2
 import re
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from holidays import HOLIDAYS
+import openpyxl
+from holidays import REST_DAYS
 from psycopg2 import sql
-from config import DB_CONFIG
+import db
+from bulk_load import bulk_insert
+import punch_rules
+import shift_rules
+import employees
+from employees import EMPLOYEE_KEY
+import day_status
+from day_status import DayStatusMatrix
+import ingest_cache
+import os
 import sys
 
 # 强制刷新输出缓冲区
@@ -25,17 +35,101 @@ basic_fields = ['姓名', '考勤组', '部门', '工号', '职位', 'UserId']
 # 修改 day_columns 的定义，使用数字格式
 day_columns = [f"{i:02d}" for i in range(1, 32)]
 all_columns = basic_fields + day_columns
+# 空单元格统一用 NaN 表示，与 pd.read_excel 的读取结果保持一致
+EMPTY_CELL = float('nan')
 
-# 打卡时间规则常量
-MORNING_LIMIT = datetime.strptime("08:33", "%H:%M")
-EVENING_LIMIT = datetime.strptime("18:00", "%H:%M")
-HALF_DAY_ABSENT = timedelta(minutes=30)   # 迟到30分钟起算旷工0.5天
-FULL_DAY_ABSENT = timedelta(hours=3)      # 迟到3小时及以上算旷工1天
-EARLY_LEAVE_THRESHOLD = timedelta(minutes=30)  # 早退30分钟判定标准
+# 源数据文件
+BASIC_FILE = "../data/original/basic.xlsx"
+# 批量模式下各月份的基础考勤表，不存在时使用统计日期属于该月的 BASIC_FILE
+BASIC_MONTH_FILE = "../data/original/basic_{year}{month:02d}.xlsx"
 
-def get_db_connection():
-    """创建数据库连接"""
-    return psycopg2.connect(**DB_CONFIG)
+# 打卡时间规则常量：默认班次规则（各考勤组的规则见 shift_rules.py，analyze_day 按默认规则判断）
+MORNING_LIMIT = datetime.strptime(shift_rules.DEFAULT_RULE['morning_limit'], "%H:%M")
+EVENING_LIMIT = datetime.strptime(shift_rules.DEFAULT_RULE['evening_limit'], "%H:%M")
+HALF_DAY_ABSENT = timedelta(minutes=shift_rules.DEFAULT_RULE['half_day_absent'])   # 迟到30分钟起算旷工0.5天
+FULL_DAY_ABSENT = timedelta(minutes=shift_rules.DEFAULT_RULE['full_day_absent'])   # 迟到3小时及以上算旷工1天
+EARLY_LEAVE_THRESHOLD = timedelta(minutes=shift_rules.DEFAULT_RULE['early_leave'])  # 早退30分钟判定标准
+
+def _is_blank_row(values):
+    """整行为空（全部为空值或全部为空字符串）"""
+    return all(v is None for v in values) or all(v == '' for v in values)
+
+def read_period(file_path):
+    """
+    读取考勤表第一行的统计日期（如 "打卡时间 统计日期：2025-05-01 至 2025-05-31"）
+    
+    返回:
+        tuple: (开始日期, 结束日期)，无法识别时返回 None
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        first_row = next(workbook.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+    finally:
+        workbook.close()
+    match = re.search(r'(\d{4}-\d{2}-\d{2})\s*至\s*(\d{4}-\d{2}-\d{2})', str(first_row[0] if first_row else ''))
+    if not match:
+        return None
+    return tuple(datetime.strptime(value, "%Y-%m-%d").date() for value in match.groups())
+
+def iter_excel_batches(file_path, batch_size=500, expected_columns=37):
+    """
+    流式读取钉钉考勤表：以只读模式逐行遍历第一个sheet，从第5行（表头之后）开始，
+    边读边映射为 6 个基础字段 + 日期列、跳过空白行，按批次产出 DataFrame
+    
+    参数:
+        file_path (str): Excel文件路径
+        batch_size (int): 每批行数
+        expected_columns (int): 期望的列数(默认为37)，不足补空、超出截断
+    
+    返回:
+        generator: 每次产出一个列为 all_columns 的 DataFrame
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        batch = []
+        for values in worksheet.iter_rows(min_row=5, values_only=True):
+            if _is_blank_row(values):
+                continue
+            row = list(values[:expected_columns])
+            row.extend([None] * (expected_columns - len(row)))
+            # 空单元格和空字符串与 pd.read_excel 的结果保持一致，统一为 NaN
+            batch.append([EMPTY_CELL if v is None or v == '' else v for v in row])
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=all_columns, dtype=object)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=all_columns, dtype=object)
+    finally:
+        workbook.close()
+
+def iter_basic_batches(file_path, batch_size=500, expected_columns=37):
+    """
+    按批读取钉钉考勤表：源文件内容和解析配置未变化时直接从解析缓存切分批次，
+    否则流式解析，全部读完后写入缓存
+    """
+    key = ingest_cache.cache_key(
+        file_path,
+        'basic_combined',
+        {'expected_columns': expected_columns, 'columns': all_columns},
+        (iter_excel_batches, _is_blank_row),
+    )
+    cached = ingest_cache.preloaded(file_path, 'basic_combined')
+    if cached is None:
+        cached = ingest_cache.load(key)
+        if cached is not None:
+            flush_print(f"⚡ 命中解析缓存: {os.path.basename(file_path)}")
+    if cached is not None:
+        for start in range(0, len(cached), batch_size):
+            yield cached.iloc[start:start + batch_size]
+        return
+    
+    batches = []
+    for batch in iter_excel_batches(file_path, batch_size, expected_columns):
+        batches.append(batch)
+        yield batch
+    if batches:
+        ingest_cache.store(key, pd.concat(batches, ignore_index=True))
 
 def process_excel_file(file_path, expected_columns=37):
     """
@@ -49,73 +143,47 @@ def process_excel_file(file_path, expected_columns=37):
         pd.DataFrame: 处理后的DataFrame
     """
     try:
-        # 读取Excel文件，跳过前3行
-        df = pd.read_excel(file_path, sheet_name=0, skiprows=3)
-        flush_print(f"✅ 原始数据形状: {df.shape} (行×列)")
-        
-        # 设置前6列的列名
-        column_names = ['姓名', '考勤组', '部门', '工号', '职位', 'UserId']
-        # 从第7列开始，列名设置为01,02,03...
-        remaining_columns = [f"{i:02d}" for i in range(1, len(df.columns)-5)]
-        df.columns = column_names + remaining_columns
-        
-        # 删除完全空白的行（更严格的清理）
-        df_cleaned = df.dropna(how='all')
-        # 删除所有列都为NaN或空字符串的行
-        df_cleaned = df_cleaned.loc[~df_cleaned.apply(lambda x: x.isna().all() or (x == '').all(), axis=1)]
-        
-        # 处理列数
-        current_columns = len(df_cleaned.columns)
-        
-        if current_columns < expected_columns:
-            # 如果列数不足，添加空列
-            for i in range(current_columns, expected_columns):
-                df_cleaned[f'空白列_{i+1}'] = None
-            flush_print(f"✅ 已添加 {expected_columns - current_columns} 个空白列")
-        elif current_columns > expected_columns:
-            # 如果列数过多，截断到指定列数
-            df_cleaned = df_cleaned.iloc[:, :expected_columns]
-            flush_print(f"✅ 已截断 {current_columns - expected_columns} 列")
-        
-        # 最终清理
-        # 1. 删除所有完全为空的行
-        df_cleaned = df_cleaned.dropna(how='all')
-        # 2. 重置索引
-        df_cleaned = df_cleaned.reset_index(drop=True)
-        # 3. 删除末尾的空行
-        last_valid_index = df_cleaned.apply(lambda x: x.notna().any() or (x != '').any(), axis=1).values.argmin()
-        if last_valid_index > 0:
-            df_cleaned = df_cleaned.iloc[:last_valid_index]
-        
-        # 找到最后一个非空行的索引
-        last_valid_row = None
-        for idx in range(len(df_cleaned)-1, -1, -1):
-            row = df_cleaned.iloc[idx]
-            if not row.isna().all() and not (row == '').all():
-                last_valid_row = idx
-                break
-        
-        # 只保留到最后一个非空行
-        if last_valid_row is not None:
-            df_cleaned = df_cleaned.iloc[:last_valid_row + 1]
-        
+        batches = list(iter_basic_batches(file_path, expected_columns=expected_columns))
+        if batches:
+            df_cleaned = pd.concat(batches, ignore_index=True)
+        else:
+            df_cleaned = pd.DataFrame(columns=all_columns, dtype=object)
         flush_print(f"✅ 最终数据形状: {df_cleaned.shape} (确保为 {expected_columns} 列)")
         return df_cleaned
     except Exception as e:
         flush_print(f"❌ 处理文件时出错: {e}")
         return None
 
+def clean_field_names(field_names):
+    """将字段名中的特殊字符替换为下划线，确保字段名有效"""
+    cleaned_field_names = []
+    for name in field_names:
+        # 清理字段名
+        cleaned_name = str(name).strip()
+        cleaned_name = cleaned_name.replace(' ', '_')
+        cleaned_name = cleaned_name.replace('/', '_')
+        cleaned_name = cleaned_name.replace('(', '')
+        cleaned_name = cleaned_name.replace(')', '')
+        cleaned_name = cleaned_name.replace('.', '_')
+        cleaned_name = cleaned_name.replace('\n', '_')
+        # 确保字段名以字母开头
+        if cleaned_name[0].isdigit():
+            cleaned_name = 'column_' + cleaned_name  # 修改前缀为 column_
+        cleaned_field_names.append(cleaned_name)
+    return cleaned_field_names
+
 def create_basic_table(conn, field_names):
     """创建基础数据表"""
     cursor = conn.cursor()
     
     try:
-        # 先删除已存在的表
-        cursor.execute("DROP TABLE IF EXISTS basic")
-        conn.commit()
+        # 先建在新表中，全部写入后由 swap_tables 替换旧表
+        stage = db.staging_table('basic')
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(stage)))
         
         # 创建表，使用处理后的字段名
-        create_table_query = sql.SQL("CREATE TABLE basic ({})").format(
+        create_table_query = sql.SQL("CREATE TABLE {} ({})").format(
+            sql.Identifier(stage),
             sql.SQL(', ').join(
                 sql.SQL("{} TEXT").format(sql.Identifier(col))  # 使用TEXT类型而不是VARCHAR
                 for col in field_names
@@ -127,32 +195,20 @@ def create_basic_table(conn, field_names):
     except Exception as e:
         flush_print(f"❌ 创建基础表失败: {e}")
         conn.rollback()
+        raise
     finally:
         cursor.close()
 
 def save_basic_data_to_db(conn, processed_data, field_names):
     """将基础数据保存到数据库"""
-    cursor = conn.cursor()
-    
     try:
-        # 构建INSERT语句
-        insert_query = sql.SQL("INSERT INTO basic ({}) VALUES ({})").format(
-            sql.SQL(', ').join(map(sql.Identifier, field_names)),
-            sql.SQL(', ').join(sql.Placeholder() * len(field_names))
-        )
-        
-        # 插入数据
-        for _, row in processed_data.iterrows():
-            values = [str(val) if pd.notna(val) else None for val in row]  # 使用None代替空字符串
-            cursor.execute(insert_query, values)
-        
+        bulk_insert(conn, db.staging_table('basic'), field_names, processed_data)
         conn.commit()
         flush_print("✅ 基础数据已成功导入PostgreSQL数据库")
     except Exception as e:
         flush_print(f"❌ 保存基础数据失败: {e}")
         conn.rollback()
-    finally:
-        cursor.close()
+        raise
 
 def create_result_table(conn):
     """创建考勤结果表"""
@@ -166,51 +222,54 @@ def create_result_table(conn):
     # 所有字段(移除统计字段)
     all_fields = basic_fields + day_fields
     
-    # 创建表SQL
-    create_table_sql = sql.SQL("CREATE TABLE IF NOT EXISTS attendance_result ({})").format(
+    # 创建表SQL（末尾的 员工ID 关联员工表，审批记录按它写回）
+    stage = db.staging_table('attendance_result')
+    create_table_sql = sql.SQL("CREATE TABLE {} ({}, {} INTEGER)").format(
+        sql.Identifier(stage),
         sql.SQL(', ').join(
             sql.SQL("{} TEXT").format(sql.Identifier(field))
             for field in all_fields
-        )
+        ),
+        sql.Identifier(EMPLOYEE_KEY),
     )
     
     try:
-        cursor.execute("DROP TABLE IF EXISTS attendance_result")
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(stage)))
         cursor.execute(create_table_sql)
         conn.commit()
         flush_print("✅ 考勤结果表创建成功")
     except Exception as e:
         flush_print(f"❌ 创建考勤结果表失败: {e}")
         conn.rollback()
+        raise
     finally:
         cursor.close()
 
 def save_results_to_db(conn, data):
     """将考勤分析结果保存到数据库"""
-    cursor = conn.cursor()
-    
-    # 准备INSERT语句
-    fields = list(data[0].keys())
-    insert_sql = sql.SQL("INSERT INTO attendance_result ({}) VALUES ({})").format(
-        sql.SQL(', ').join(map(sql.Identifier, fields)),
-        sql.SQL(', ').join(sql.Placeholder() * len(fields))
-    )
+    fields = list(data.columns)
     
     try:
-        # 批量插入数据
-        for row in data:
-            # 处理nan值
-            values = [
-                (str(val) if val not in (None, 'nan', 'None', '') else '')
-                for val in row.values()
-            ]
-            cursor.execute(insert_sql, values)
-        
+        # 批量写入数据，空值统一保存为空字符串
+        bulk_insert(conn, db.staging_table('attendance_result'), fields, data, null='', missing_strings=True)
         conn.commit()
         flush_print("✅ 考勤分析结果已保存到数据库")
     except Exception as e:
         flush_print(f"❌ 保存考勤结果失败: {e}")
         conn.rollback()
+        raise
+
+def swap_tables(conn):
+    """全部写入后，在一个事务中用新表替换基础数据表和考勤结果表"""
+    cursor = conn.cursor()
+    try:
+        for table in ('basic', 'attendance_result'):
+            db.swap_table(cursor, table)
+        conn.commit()
+    except Exception as e:
+        flush_print(f"❌ 替换基础数据表和考勤结果表失败: {e}")
+        conn.rollback()
+        raise
     finally:
         cursor.close()
 
@@ -222,11 +281,11 @@ def extract_times(cell):
     return [datetime.strptime(t.strip(), "%H:%M") for t in times]
 
 def analyze_day(cell, day):
-    """分析单日考勤情况"""
+    """分析单日考勤情况（逐格计算的参考实现，批量分析使用 analyze_results 的向量化规则）"""
     times = extract_times(cell)
     
     # 如果是休息日
-    if f"{day:02d}" in HOLIDAYS:
+    if REST_DAYS[day]:
         if not times:
             return ""
         else:
@@ -277,77 +336,110 @@ def analyze_day(cell, day):
     else:
         return f"{'+'.join(reasons)}{times_str}"
 
-def analyze_results(rows):
-    """分析考勤结果"""
-    data = []
-    for row in rows:
-        record = dict(zip(all_columns, row)) if isinstance(row, tuple) else row
-        result_row = {key: record[key] for key in basic_fields}
-        
-        for i, col in enumerate(day_columns, start=1):
-            result = analyze_day(record[col], i)
-            result_row[f"第{i}天"] = result if result else ""
-            
-        data.append(result_row)
-    return data
+def get_holiday_mask():
+    """按日期列顺序返回休息日标记"""
+    return REST_DAYS[[int(day) for day in day_columns]]
 
-def main():
+def build_day_status(df, ids):
+    """
+    按打卡规则对整块日期列计算考勤状态，返回结构化的考勤状态矩阵
+    各行按所属考勤组的班次规则判断，阈值按行取出后与日期列一起广播，全部员工一次计算
+    
+    参数:
+        df (pd.DataFrame): 字段顺序为 all_columns 的考勤数据
+        ids (list): 每行的 员工ID
+    """
+    rules = shift_rules.thresholds(df['考勤组'])
+    values, texts, first, last, codes = punch_rules.evaluate_codes(
+        df[day_columns],
+        get_holiday_mask(),
+        rules['morning_limit'],
+        rules['evening_limit'],
+        rules['half_day_absent'],
+        rules['full_day_absent'],
+        rules['early_leave'],
+    )
+    return DayStatusMatrix.from_punches(df[basic_fields], ids, values, texts, first, last, codes)
+
+def analyze_results(rows, registry=None):
+    """
+    分析考勤结果：整块日期列一次性按打卡规则计算
+    
+    参数:
+        rows: DataFrame，或字典/元组列表（字段顺序为 all_columns）
+        registry (dict): {业务键: 员工ID}，默认按行重新编号
+    
+    返回:
+        pd.DataFrame: 基础字段 + 第1天…第31天 的考勤状态 + 员工ID
+    """
+    if isinstance(rows, pd.DataFrame):
+        df = rows
+    else:
+        df = pd.DataFrame.from_records(rows, columns=all_columns)
+    if df.empty:
+        return pd.DataFrame(columns=basic_fields + [f"第{i}天" for i in range(1, len(day_columns) + 1)] + [EMPLOYEE_KEY])
+    
+    ids, _ = employees.assign_employee_ids(df, {} if registry is None else registry)
+    result = build_day_status(df, ids).to_frame()
+    result.index = df.index
+    return result
+
+def main(batch_size=500):
     flush_print("🔄 开始执行基础数据合并处理...")
     flush_print("📊 正在连接数据库...")
     
     # 连接数据库
-    conn = get_db_connection()
+    conn = db.get_connection()
     
     try:
-        flush_print("📁 正在处理原始Excel文件...")
-        # 1. 处理原始Excel文件
-        input_file = "../data/original/basic.xlsx"
-        processed_data = process_excel_file(input_file)
-        
-        if processed_data is None:
-            raise Exception("Excel处理失败")
-        
         flush_print("🔧 正在处理字段名...")
-        # 2. 处理字段名
-        field_names = processed_data.columns.tolist()
-        
-        # 将字段名中的特殊字符替换为下划线，确保字段名有效
-        cleaned_field_names = []
-        for name in field_names:
-            # 清理字段名
-            cleaned_name = str(name).strip()
-            cleaned_name = cleaned_name.replace(' ', '_')
-            cleaned_name = cleaned_name.replace('/', '_')
-            cleaned_name = cleaned_name.replace('(', '')
-            cleaned_name = cleaned_name.replace(')', '')
-            cleaned_name = cleaned_name.replace('.', '_')
-            cleaned_name = cleaned_name.replace('\n', '_')
-            # 确保字段名以字母开头
-            if cleaned_name[0].isdigit():
-                cleaned_name = 'column_' + cleaned_name  # 修改前缀为 column_
-            cleaned_field_names.append(cleaned_name)
+        # 1. 处理字段名（列结构固定为 6 个基础字段 + 31 个日期列）
+        cleaned_field_names = clean_field_names(all_columns)
         
         flush_print("🗄️ 正在创建基础数据表...")
-        # 3. 创建基础数据表并保存数据
+        # 2. 创建基础数据表和考勤结果表
         create_basic_table(conn, cleaned_field_names)
-        save_basic_data_to_db(conn, processed_data, cleaned_field_names)
         
         flush_print("📋 正在创建考勤结果表...")
-        # 4. 创建考勤结果表
         create_result_table(conn)
+        employees.create_employee_tables(conn)
+        
+        flush_print("📁 正在流式处理原始Excel文件...")
+        # 3. 逐批读取原始Excel，每批依次入库、分析并保存分析结果
+        total_rows = 0
+        matrices = []
+        registry = {}
+        for batch in iter_basic_batches(BASIC_FILE, batch_size=batch_size):
+            save_basic_data_to_db(conn, batch, cleaned_field_names)
+            
+            # 为本批新出现的员工分配 员工ID 并登记姓名别名
+            ids, new_employees = employees.assign_employee_ids(batch, registry)
+            employees.save_employees(conn, new_employees)
+            
+            matrix = build_day_status(batch, ids)
+            data = matrix.to_frame()
+            save_results_to_db(conn, data)
+            matrices.append(matrix)
+            
+            total_rows += len(batch)
+            flush_print(f"🔍 已处理 {total_rows} 行考勤数据")
+        
+        if total_rows == 0:
+            raise Exception("Excel处理失败: 未读取到任何考勤数据")
         
-        flush_print("🔍 正在分析考勤数据...")
-        # 5. 分析考勤数据
-        data = analyze_results(processed_data.to_dict('records'))
+        # 数据全部写入后替换旧表，再建索引
+        swap_tables(conn)
+        employees.create_result_indexes(conn)
+        flush_print(f"👥 已登记员工 {len(registry)} 人，考勤结果表索引已创建")
         
-        flush_print("💾 正在保存考勤分析结果...")
-        # 6. 保存考勤分析结果到数据库
-        save_results_to_db(conn, data)
+        # 登记考勤状态矩阵，后续阶段直接在矩阵上合并审批记录
+        day_status.publish(DayStatusMatrix.concat(matrices))
         
         flush_print("✅ 基础数据合并处理完成！")
         
     except Exception as e:
         flush_print(f"❌ 程序执行出错: {e}")
+        raise
     finally:
         conn.close()
 
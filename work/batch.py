@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多月份批量处理
+一次解析全部源文件（审批表和各月份的基础考勤表），把审批记录按月份拆分，
+再在多个进程中同时运行各月份的流水线，每个月份导出各自的报表。
+各月份的中间表写入独立的存储，互不覆盖：Postgres 中为 m202505 这样的 schema，
+SQLite 为 attendance_202505.db 这样的单独文件
+
+用法:
+    python3 batch.py 2025-04 2025-06                  # 处理 2025 年 4 月至 6 月
+    python3 batch.py 2025-05                          # 只处理一个月
+    python3 batch.py 2025-04 2025-06 --incremental    # 各月份按增量模式重算
+    python3 batch.py 2025-04 2025-06 --backend=sqlite --workers=2
+"""
+
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from psycopg2 import sql
+
+import config
+import db
+import ingest_cache
+import parallel_ingest
+import pipeline
+import work_calendar
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 按月份拆分记录的审批合并模块
+APPROVAL_MODULES = ["business_combine", "freework_combine", "overwork_combine"]
+
+# 各月份中间表所在的 Postgres schema
+MONTH_SCHEMA = "m{year}{month:02d}"
+
+# 报表导出路径（attendance_summary 的输出）
+REPORT_PATTERN = re.compile(r'已导出到: (\S+)')
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def parse_month(text):
+    """把 '2025-05' / '202505' 解析为 (年, 月)"""
+    match = re.fullmatch(r'(\d{4})-?(\d{1,2})', text.strip())
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"无法识别的月份: {text}（格式如 2025-05）")
+    return int(match.group(1)), int(match.group(2))
+
+def month_range(start, end):
+    """start 至 end（含）之间的全部月份"""
+    if end < start:
+        raise ValueError(f"结束月份早于开始月份: {end} < {start}")
+    months = []
+    year, month = start
+    while (year, month) <= end:
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def month_label(year, month):
+    return f"{year}-{month:02d}"
+
+def basic_file_for(year, month, basic_combined):
+    """月份的基础考勤表：优先 basic_YYYYMM.xlsx，其次统计日期属于该月的 basic.xlsx，都没有时返回 None"""
+    path = basic_combined.BASIC_MONTH_FILE.format(year=year, month=month)
+    if os.path.exists(path):
+        return path
+    if os.path.exists(basic_combined.BASIC_FILE):
+        period = basic_combined.read_period(basic_combined.BASIC_FILE)
+        if period and (period[0].year, period[0].month) == (year, month):
+            return basic_combined.BASIC_FILE
+    return None
+
+def month_config(year, month):
+    """月份独立的存储：Postgres 连接的 search_path 指向月份 schema，SQLite 使用单独的数据库文件"""
+    schema = MONTH_SCHEMA.format(year=year, month=month)
+    db_config = dict(config.DB_CONFIG)
+    db_config['options'] = f"{db_config.get('options', '')} -c search_path={schema}".strip()
+    sqlite_path = config.SQLITE_PATH
+    if sqlite_path != ':memory:':
+        root, ext = os.path.splitext(sqlite_path)
+        sqlite_path = f"{root}_{year}{month:02d}{ext}"
+    return {
+        'DB_BACKEND': db.backend(),
+        'DB_CONFIG': db_config,
+        'SQLITE_PATH': sqlite_path,
+        # 源文件已由主进程解析，各月份的流水线不再启动解析进程池
+        'INGEST_WORKERS': 1,
+    }
+
+def month_overrides(year, month, basic_file):
+    """运行单个月份的流水线时覆盖的模块配置（见 pipeline.load_stage_modules），休息日取自工作日历"""
+    return {
+        'config': month_config(year, month),
+        'holidays': {
+            'YEAR': year,
+            'MONTH': f"{month:02d}",
+            'HOLIDAYS': work_calendar.rest_days(year, month),
+            'REST_DAYS': work_calendar.rest_by_day(year, month),
+        },
+        'basic_combined': {'BASIC_FILE': basic_file},
+        'attendance_summary': {'OUTPUT_PREFIX': f"考勤明细及统计_{month_label(year, month)}"},
+    }
+
+def partition_approvals(modules, months):
+    """
+    合并各审批表的两个数据源并按处理日期所在月份拆分
+
+    返回:
+        dict: {(年, 月): [(源文件, 预解析器名称, 该月的记录)]}
+    """
+    partitions = {key: [] for key in months}
+    for name in APPROVAL_MODULES:
+        module = modules[name]
+        merged = module.merge_sources()
+        periods = merged['处理日期'].dt.to_period('M')
+        for (year, month) in months:
+            part = merged[(periods.dt.year == year) & (periods.dt.month == month)]
+            partitions[(year, month)].append((module.FEISHU_FILE, module.MONTH_PARTITION, part))
+        flush_print(f"🗂️ {name}: {len(merged)} 条记录，按月拆分: " + "，".join(
+            f"{month_label(*key)} {len(partitions[key][-1][2])} 条" for key in months
+        ))
+    return partitions
+
+def create_month_schemas(months, history):
+    """
+    Postgres 中建立各月份的 schema 以及历史库各月份的分区（只用本地 SQLite 且不发布时不需要），
+    避免多个月份的进程同时建立同一个对象
+    """
+    if db.is_embedded() and not config.PUBLISH_TO_POSTGRES:
+        return
+    conn = db.postgres_connection()
+    cursor = conn.cursor()
+    try:
+        for year, month in months:
+            cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(
+                sql.Identifier(MONTH_SCHEMA.format(year=year, month=month))
+            ))
+        if not db.is_embedded():
+            history.create_tables(conn, months)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+def _run_month(overrides, preloads, incremental):
+    """在子进程中运行单个月份的流水线，输出收集在结果的 output 中"""
+    os.chdir(BASE_DIR)
+    for file_path, parser, df in preloads:
+        ingest_cache.preload(file_path, parser, df)
+    with open(os.devnull, 'w') as devnull:
+        previous_stdout, sys.stdout = sys.stdout, devnull
+        try:
+            return pipeline.run_pipeline(incremental=incremental, overrides=overrides)
+        finally:
+            sys.stdout = previous_stdout
+            db.close_pool()
+
+def run_batch(months, max_workers=None, incremental=False, backend=None):
+    """
+    批量处理多个月份
+
+    参数:
+        months (list): [(年, 月)]
+        max_workers (int): 同时处理的月份数，默认使用 config.BATCH_WORKERS
+        incremental (bool): 各月份是否按增量模式重算
+        backend (str): 存储后端 postgres / sqlite，None 时使用 config.DB_BACKEND
+
+    返回:
+        dict: {(年, 月): 流水线结果}，缺少基础考勤表的月份结果为 None
+    """
+    started = time.perf_counter()
+    os.chdir(BASE_DIR)
+    modules = pipeline.load_stage_modules()
+    if backend is not None:
+        config.DB_BACKEND = backend
+    basic_combined = modules['basic_combined']
+
+    basic_files = {}
+    for year, month in months:
+        path = basic_file_for(year, month, basic_combined)
+        if path is None:
+            flush_print(f"⚠️ {month_label(year, month)} 没有基础考勤表"
+                        f"（{basic_combined.BASIC_MONTH_FILE.format(year=year, month=month)}），跳过")
+        else:
+            basic_files[(year, month)] = path
+        if not work_calendar.is_configured(year, month):
+            flush_print(f"ℹ️ {month_label(year, month)} 未在工作日历中配置，休息日按周六、周日计算")
+    results = {key: None for key in months}
+    if not basic_files:
+        return results
+
+    # 1. 一次解析全部源文件：审批表和各月份的基础考勤表
+    extra_files = [
+        ('basic_combined', 'process_excel_file', 'basic_combined', path)
+        for path in sorted(set(basic_files.values())) if path != basic_combined.BASIC_FILE
+    ]
+    frames = parallel_ingest.ingest_all(extra_files=extra_files)
+    basic_frames = {path: frames.get(('basic_combined', path)) for path in basic_files.values()}
+    basic_frames[basic_combined.BASIC_FILE] = frames.get(('basic_combined', 'BASIC_FILE'))
+
+    # 2. 审批记录按月份拆分
+    partitions = partition_approvals(modules, list(basic_files))
+    create_month_schemas(list(basic_files), modules['history'])
+
+    # 3. 各月份在独立进程中运行流水线
+    max_workers = max(1, min(max_workers or config.BATCH_WORKERS, len(basic_files)))
+    flush_print(f"🚀 开始批量处理 {len(basic_files)} 个月份，{max_workers} 个进程")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=parallel_ingest.process_context()) as executor:
+        futures = {}
+        for key, path in basic_files.items():
+            preloads = list(partitions[key])
+            if basic_frames.get(path) is not None:
+                preloads.append((path, 'basic_combined', basic_frames[path]))
+            overrides = month_overrides(*key, path)
+            futures[executor.submit(_run_month, overrides, preloads, incremental)] = key
+
+        for future in as_completed(futures):
+            key = futures[future]
+            label = month_label(*key)
+            try:
+                result = future.result()
+            except Exception as e:
+                flush_print(f"❌ {label} 运行失败: {e}")
+                continue
+            results[key] = result
+            if result['success']:
+                reports = REPORT_PATTERN.findall(result['output'])
+                flush_print(f"✅ {label} 完成，耗时 {result['elapsed']:.2f}s"
+                            + (f"，报表: {reports[-1]}" if reports else ""))
+            else:
+                flush_print(f"❌ {label} 部分阶段执行失败，运行输出:\n{result['output']}")
+
+    flush_print(f"\n📋 批量处理摘要 (总耗时 {time.perf_counter() - started:.2f}s):")
+    for key in months:
+        result = results[key]
+        status = '-' if result is None else ('success' if result['success'] else 'failed')
+        elapsed = f"{result['elapsed']:.2f}s" if result is not None else '-'
+        flush_print(f"- {month_label(*key):<8} {status:<8} {elapsed}")
+    return results
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = dict(arg[2:].partition("=")[::2] for arg in sys.argv[1:] if arg.startswith("--"))
+    if not 1 <= len(args) <= 2:
+        flush_print(__doc__)
+        return 2
+    try:
+        start = parse_month(args[0])
+        months = month_range(start, parse_month(args[-1]))
+    except ValueError as e:
+        flush_print(f"❌ {e}")
+        return 2
+
+    results = run_batch(
+        months,
+        max_workers=int(options['workers']) if options.get('workers') else None,
+        incremental='incremental' in options,
+        backend=options.get('backend') or None,
+    )
+    if all(result is not None and result['success'] for result in results.values()):
+        flush_print("🎉 所有月份处理成功!")
+        return 0
+    flush_print("❌ 部分月份未能处理")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
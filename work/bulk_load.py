@@ -0,0 +1,192 @@
+"""
+批量导入工具
+通过 COPY FROM STDIN 将 DataFrame 或记录迭代器流式写入 PostgreSQL，
+COPY 不可用时回退为 execute_values 分页插入；本地 SQLite 使用 executemany 逐批插入
+"""
+
+import sys
+import time
+
+import pandas as pd
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+import progress
+
+# 考勤结果单元格中视为空值的字符串（与原 save_results_to_db 的处理一致）
+MISSING_STRINGS = ('nan', 'None', '')
+
+# 每次从迭代器读取并发送给服务器的行数
+COPY_BATCH_ROWS = 5000
+VALUES_PAGE_SIZE = 1000
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def normalize_value(val, null=None, missing_strings=False):
+    """
+    统一处理空值：None 和 NaN/NaT 视为空值，其余值转换为字符串
+
+    参数:
+        val: 原始值
+        null: 空值的写入值（None 写入 SQL NULL，'' 写入空字符串）
+        missing_strings (bool): 是否同时把 'nan'/'None'/'' 字符串视为空值（只用于考勤结果单元格）
+    """
+    if val is None:
+        return null
+    if not isinstance(val, str):
+        try:
+            if pd.isna(val):
+                return null
+        except (TypeError, ValueError):
+            pass
+        val = str(val)
+    if missing_strings and val in MISSING_STRINGS:
+        return null
+    return val
+
+def verbatim_value(val, null=None):
+    """原样写入：只把 None 写为空值，其余值转换为字符串（用于复制已经规范化过的表）"""
+    if val is None:
+        return null
+    return val if isinstance(val, str) else str(val)
+
+def iter_records(rows, columns=None):
+    """将 DataFrame / 字典列表 / 元组列表统一转换为按列顺序排列的元组迭代器"""
+    if isinstance(rows, pd.DataFrame):
+        return rows.itertuples(index=False, name=None)
+    return (
+        tuple(row[col] for col in columns) if isinstance(row, dict) else row
+        for row in rows
+    )
+
+def _escape_copy_text(val):
+    """按 COPY 文本格式转义单个字段"""
+    if val is None:
+        return '\\N'
+    return (val.replace('\\', '\\\\')
+               .replace('\t', '\\t')
+               .replace('\n', '\\n')
+               .replace('\r', '\\r'))
+
+class _CopyStream:
+    """把记录迭代器包装为 copy_expert 可读取的文件对象，边读边编码，不在内存中拼接整张表"""
+
+    def __init__(self, records, convert):
+        self.records = iter(records)
+        self.convert = convert
+        self.count = 0
+        self._buffer = b''
+        self._exhausted = False
+
+    def _fill(self):
+        lines = []
+        for row in self.records:
+            lines.append('\t'.join(_escape_copy_text(self.convert(v)) for v in row))
+            self.count += 1
+            if len(lines) >= COPY_BATCH_ROWS:
+                break
+        if not lines:
+            self._exhausted = True
+            return
+        self._buffer += ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def read(self, size=-1):
+        while not self._exhausted and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def _copy(cursor, table, columns, records, convert):
+    stream = _CopyStream(records, convert)
+    copy_sql = sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, columns))
+    )
+    cursor.copy_expert(copy_sql, stream, size=65536)
+    return stream.count
+
+def _insert_values(cursor, table, columns, records, convert):
+    insert_sql = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, columns))
+    )
+    values = [tuple(convert(v) for v in row) for row in records]
+    execute_values(cursor, insert_sql, values, page_size=VALUES_PAGE_SIZE)
+    return len(values)
+
+def _insert_many(cursor, table, columns, records, convert):
+    insert_sql = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, columns)),
+        sql.SQL(', ').join(sql.Placeholder() * len(columns))
+    )
+    count = 0
+    def values():
+        nonlocal count
+        for row in records:
+            count += 1
+            yield tuple(convert(v) for v in row)
+    cursor.executemany(insert_sql, values())
+    return count
+
+def bulk_insert(conn, table, columns, rows, null=None, method='copy', verbatim=False, missing_strings=False):
+    """
+    批量写入数据，不提交事务（由调用方决定何时 commit）
+
+    参数:
+        conn: 数据库连接
+        table (str): 表名
+        columns (list): 目标字段名，顺序与每行数据一致
+        rows: DataFrame、字典列表或元组迭代器
+        null: 空值的写入值（None 写入 SQL NULL，'' 写入空字符串）
+        method (str): 'copy' 使用 COPY FROM STDIN，失败时回退；'values' 直接使用 execute_values；
+            本地 SQLite 连接忽略该参数，总是使用 executemany
+        verbatim (bool): 是否原样写入，不把 NaN 视为空值（用于复制已经规范化过的表）
+        missing_strings (bool): 是否把 'nan'/'None'/'' 字符串也视为空值，只用于考勤结果表及由它派生的表
+
+    返回:
+        int: 写入行数
+    """
+    columns = list(columns)
+    if verbatim:
+        convert = lambda val: verbatim_value(val, null)
+    else:
+        convert = lambda val: normalize_value(val, null, missing_strings)
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        used = method
+        if getattr(conn, 'backend', 'postgres') == 'sqlite':
+            used = 'executemany'
+            count = _insert_many(cursor, table, columns, iter_records(rows, columns), convert)
+        elif method == 'copy':
+            cursor.execute("SAVEPOINT bulk_insert")
+            try:
+                count = _copy(cursor, table, columns, iter_records(rows, columns), convert)
+                cursor.execute("RELEASE SAVEPOINT bulk_insert")
+            except psycopg2.Error as e:
+                # 只有可重复遍历的数据源才能回退重试
+                if iter(rows) is rows:
+                    raise
+                cursor.execute("ROLLBACK TO SAVEPOINT bulk_insert")
+                flush_print(f"⚠️ COPY 写入 {table} 失败，改用 execute_values: {e}")
+                used = 'values'
+                count = _insert_values(cursor, table, columns, iter_records(rows, columns), convert)
+        else:
+            count = _insert_values(cursor, table, columns, iter_records(rows, columns), convert)
+    finally:
+        cursor.close()
+
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else float(count)
+    flush_print(f"📦 {table}: 写入 {count} 行，耗时 {elapsed:.2f}s，{rate:.0f} 行/秒 ({used})")
+    progress.rows(table, count, elapsed_ms=round(elapsed * 1000))
+    return count
@@ -1,19 +1,7 @@
-import psycopg2
-from datetime import datetime
-from psycopg2 import sql
-
-# 数据库连接配置
-DB_CONFIG = {
-    "host": "192.168.1.66",
-    "port": "7432",
-    "database": "dingding",
-    "user": "root",
-    "password": "123456"
-}
-
-def get_db_connection():
-    """创建数据库连接"""
-    return psycopg2.connect(**DB_CONFIG)
+import db
+from attendance_merge import expand_days, load_day_cells, write_day_cells
+import day_status
+import employees
 
 def get_business_records(cursor):
     """获取所有出差记录"""
@@ -24,44 +12,72 @@ def get_business_records(cursor):
     cursor.execute(query)
     return cursor.fetchall()
 
-def update_attendance_record(cursor, name, start_date, end_date, business_reason):
-    """更新指定日期范围内的考勤记录"""
-    # 将日期字符串转换为datetime对象
-    start_date = datetime.strptime(start_date.split()[0], '%Y-%m-%d')
-    end_date = datetime.strptime(end_date.split()[0], '%Y-%m-%d')
+def merge_business_records(business_records, cells, aliases):
+    """
+    在内存中把出差记录展开为 (员工ID, 第N天) 单元格，出差覆盖原有考勤状态
     
-    # 获取需要更新的列名（第X天）
-    start_day = int(start_date.strftime('%d'))
-    end_day = int(end_date.strftime('%d'))
+    参数:
+        aliases (employees.AliasIndex): 员工别名索引，把记录中的姓名解析为 员工ID
     
-    # 构建更新语句并直接更新
-    for day in range(start_day, end_day + 1):
-        column_name = f'第{day}天'
+    返回:
+        dict: {(员工ID, '第N天'): 新值}，同一天有多条出差时以最后一条为准
+    """
+    changes = {}
+    for name, start_time, end_time, business_reason in business_records:
+        print(f"正在处理 {name} 的出差记录: {start_time} -> {end_time}")
         
-        # 直接更新考勤状态
-        update_query = sql.SQL("""
-            UPDATE attendance_result 
-            SET {} = %s
-            WHERE 姓名 = %s
-        """).format(sql.Identifier(column_name))
+        employee_ids = [i for i in aliases.resolve(name) if i in cells]
+        if not employee_ids:
+            continue
         
-        cursor.execute(update_query, (f"出差({business_reason})", name))
+        for day in expand_days(start_time, end_time):
+            for employee_id in employee_ids:
+                changes[(employee_id, f'第{day}天')] = f"出差({business_reason})"
+    return changes
+
+def apply_business_to_matrix(business_records, matrix, aliases):
+    """
+    在考勤状态矩阵上合并出差记录，规则与 merge_business_records 一致
+    
+    返回:
+        set: 被修改的 {(员工ID, '第N天')}
+    """
+    touched = set()
+    for name, start_time, end_time, business_reason in business_records:
+        print(f"正在处理 {name} 的出差记录: {start_time} -> {end_time}")
+        
+        employee_ids = [i for i in aliases.resolve(name) if i in matrix]
+        if not employee_ids:
+            continue
+        
+        for day in expand_days(start_time, end_time):
+            for employee_id in employee_ids:
+                touched.add(matrix.set_trip(employee_id, day, business_reason))
+    return touched
 
 def main():
-    conn = get_db_connection()
+    conn = db.get_connection()
     cursor = conn.cursor()
     
     try:
         # 获取所有出差记录
         business_records = get_business_records(cursor)
         print(f"✅ 获取到 {len(business_records)} 条出差记录")
+        aliases = employees.load_aliases(cursor)
+        
+        matrix = day_status.current()
+        if matrix is not None:
+            # 流水线中直接在考勤状态矩阵上合并，只为变化的单元格生成文本
+            touched = apply_business_to_matrix(business_records, matrix, aliases)
+            changes = matrix.render_cells(touched)
+        else:
+            # 一次性读取涉及员工的考勤单元格，在内存中合并
+            employee_ids = {i for record in business_records for i in aliases.resolve(record[0])}
+            cells = load_day_cells(cursor, employee_ids)
+            changes = merge_business_records(business_records, cells, aliases)
         
-        # 处理每条出差记录
-        for record in business_records:
-            name, start_time, end_time, reason = record
-            print(f"正在处理 {name} 的出差记录: {start_time} -> {end_time}")
-            
-            update_attendance_record(cursor, name, start_time, end_time, reason)
+        # 一次性写回所有变化的单元格
+        write_day_cells(conn, changes)
         
         # 提交事务
         conn.commit()
@@ -70,6 +86,7 @@ def main():
     except Exception as e:
         print(f"❌ 处理出错: {e}")
         conn.rollback()
+        raise
     finally:
         cursor.close()
         conn.close()
@@ -1,12 +1,20 @@
 import pandas as pd
 from datetime import datetime
-import psycopg2
+import db
 from psycopg2 import sql
-from holidays import MONTH
+from bulk_load import bulk_insert
+from holidays import MONTH, YEAR
+import ingest_cache
 
-def process_feishu_data():
+# 源数据文件
+FEISHU_FILE = '../data/original/business01.xlsx'
+DINGDING_FILE = '../data/original/business02.xlsx'
+
+# 批量模式下主进程按月拆分好的合并记录（以飞书文件登记预解析结果）
+MONTH_PARTITION = 'business_combine.month'
+
+def parse_feishu_data(file_path=FEISHU_FILE):
     # 处理飞书数据
-    file_path = '../data/original/business01.xlsx'
     df = pd.read_excel(file_path, skiprows=1)
     
     columns = ['发起人姓名',  '开始时间', '结束时间', '出差总时长（天）', '出差事由','申请状态']
@@ -17,11 +25,12 @@ def process_feishu_data():
     
     # 添加数据来源标识
     result_df['数据来源'] = '飞书'
+    # 审批单编号（一张审批单可能有多条明细）
+    result_df['审批编号'] = df['申请编号'].astype(str)
     return result_df
 
-def process_dingding_data():
+def parse_dingding_data(file_path=DINGDING_FILE):
     # 处理钉钉数据
-    file_path = '../data/original/business02.xlsx'
     df = pd.read_excel(file_path, skiprows=1)
     
     columns = ['创建人', '开始时间', '结束时间', '时长', '出差事由','审批结果']
@@ -32,20 +41,24 @@ def process_dingding_data():
     
     # 添加数据来源标识
     result_df['数据来源'] = '钉钉'
+    # 审批单编号（一张审批单可能有多条明细）
+    result_df['审批编号'] = df['审批编号'].astype(str)
     return result_df
 
+def process_feishu_data(file_path=FEISHU_FILE):
+    """读取飞书出差数据，源文件未变化时直接使用解析缓存"""
+    return ingest_cache.load_or_parse(file_path, 'business_combine.feishu', None, parse_feishu_data, file_path)
+
+def process_dingding_data(file_path=DINGDING_FILE):
+    """读取钉钉出差数据，源文件未变化时直接使用解析缓存"""
+    return ingest_cache.load_or_parse(file_path, 'business_combine.dingding', None, parse_dingding_data, file_path)
+
 def save_to_database(df):
     """
     将数据保存到PostgreSQL数据库
     """
     # 连接PostgreSQL数据库
-    conn = psycopg2.connect(
-        host="192.168.1.66",
-        port="7432",
-        database="dingding",
-        user="root",
-        password="123456"
-    )
+    conn = db.get_connection()
     cur = conn.cursor()
     
     try:
@@ -65,12 +78,13 @@ def save_to_database(df):
         # 更新DataFrame的列名
         df.columns = cleaned_field_names
         
-        # 先删除已存在的表
-        cur.execute("DROP TABLE IF EXISTS business")
-        conn.commit()
+        # 先写入新表，写完后再替换旧表，读者不会遇到表不存在
+        stage = db.staging_table('business')
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(stage)))
         
         # 创建新表
-        create_table_query = sql.SQL("CREATE TABLE business ({})").format(
+        create_table_query = sql.SQL("CREATE TABLE {} ({})").format(
+            sql.Identifier(stage),
             sql.SQL(', ').join(
                 sql.SQL("{} TEXT").format(sql.Identifier(col))
                 for col in cleaned_field_names
@@ -78,23 +92,17 @@ def save_to_database(df):
         )
         cur.execute(create_table_query)
         
-        # 构建INSERT语句
-        insert_query = sql.SQL("INSERT INTO business ({}) VALUES ({})").format(
-            sql.SQL(', ').join(map(sql.Identifier, cleaned_field_names)),
-            sql.SQL(', ').join(sql.Placeholder() * len(cleaned_field_names))
-        )
-        
-        # 插入数据
-        for _, row in df.iterrows():
-            values = [str(val) if pd.notna(val) else None for val in row]
-            cur.execute(insert_query, values)
+        # 批量写入数据
+        bulk_insert(conn, stage, cleaned_field_names, df)
         
+        db.swap_table(cur, 'business')
         conn.commit()
         print("数据已成功导入PostgreSQL数据库的business表")
         
     except Exception as e:
         print(f"数据库操作出错: {e}")
         conn.rollback()
+        raise
         
     finally:
         cur.close()
@@ -117,7 +125,12 @@ def clean_datetime(date_str):
         return date_part
     return date_str
 
-def main():
+def merge_sources():
+    """合并两个数据源的出差记录，统一日期格式并计算处理日期（不筛选月份）"""
+    partition = ingest_cache.preloaded(FEISHU_FILE, MONTH_PARTITION)
+    if partition is not None:
+        return partition
+    
     # 处理两个数据源
     feishu_df = process_feishu_data()
     dingding_df = process_dingding_data()
@@ -133,8 +146,16 @@ def main():
     combined_df['处理日期'] = combined_df['开始时间'].apply(clean_datetime)
     combined_df['处理日期'] = pd.to_datetime(combined_df['处理日期'])
     
+    print(f"飞书数据记录数: {len(feishu_df)}")
+    print(f"钉钉数据记录数: {len(dingding_df)}")
+    return combined_df
+
+def load_combined_data():
+    """合并两个数据源的出差记录，筛选指定月份并排序"""
+    combined_df = merge_sources()
+    
     # 筛选指定月份的数据
-    combined_df = combined_df[combined_df['处理日期'].dt.strftime('%m') == MONTH]
+    combined_df = combined_df[combined_df['处理日期'].dt.strftime('%Y-%m') == f"{YEAR}-{MONTH}"]
     
     # 删除临时列
     combined_df = combined_df.drop('处理日期', axis=1)
@@ -142,9 +163,11 @@ def main():
     # 按姓名和开始时间排序
     combined_df = combined_df.sort_values(by=['姓名', '开始时间'])
     
-    print(f"飞书数据记录数: {len(feishu_df)}")
-    print(f"钉钉数据记录数: {len(dingding_df)}")
     print(f"合并后筛选{MONTH}月份总记录数: {len(combined_df)}")
+    return combined_df
+
+def main():
+    combined_df = load_combined_data()
     
     # 保存到数据库
     save_to_database(combined_df)
@@ -7,3 +7,38 @@ DB_CONFIG = {
     "user": "root",
     "password": "123456"
 }
+
+# 解析结果缓存（按源文件内容哈希命中，超过上限时按最近使用时间淘汰）
+INGEST_CACHE_DIR = "../data/cache"
+INGEST_CACHE_MAX_MB = 512
+
+# 并行解析源数据（basic.xlsx 和六个审批表）的进程数，小内存机器可调小，设为 1 时不启用并行解析
+INGEST_WORKERS = 4
+
+# 批量模式（batch.py）同时处理的月份数，每个月份在独立的进程中运行
+BATCH_WORKERS = 4
+
+# 数据库连接池：各阶段和 API 共用，连接数上限需大于流水线同时运行的阶段数
+DB_POOL_MIN = 1
+DB_POOL_MAX = 8
+# 取连接失败（数据库重启、网络抖动、连接池用尽）时的重试次数和间隔（秒，按次数递增）
+DB_CONNECT_RETRIES = 3
+DB_RETRY_DELAY = 1.0
+# 超过该耗时（秒）的语句单独打印
+DB_SLOW_STATEMENT_SECONDS = 1.0
+
+# 中间表存储后端："postgres" 使用 DB_CONFIG 指定的数据库；"sqlite" 使用本地嵌入式数据库，
+# 不需要数据库服务器，各阶段串行运行；也可以用 pipeline.py --backend=sqlite 临时指定
+DB_BACKEND = "postgres"
+# SQLite 数据库文件（相对 work 目录），":memory:" 为纯内存数据库，进程退出后不保留（增量模式不可用）
+SQLITE_PATH = "../data/attendance.db"
+# 使用 SQLite 时，流程结束后是否把结果表发布到 DB_CONFIG 指定的 Postgres
+PUBLISH_TO_POSTGRES = False
+
+# 历史库（history.py）：按月分区长期保存的审批明细和每日考勤，Postgres 中为该 schema，
+# 使用 SQLite 时为附加的数据库文件（相对 work 目录）
+HISTORY_SCHEMA = "history"
+HISTORY_SQLITE_PATH = "../data/attendance_history.db"
+
+# 工作日历（work_calendar.py）：各月份的休息日，由休息日配置接口写入，修改后运行中的服务自动重新加载
+CALENDAR_FILE = "../data/calendar.json"
@@ -0,0 +1,287 @@
+"""
+每日考勤状态矩阵
+以 员工 × 日期 的数组保存结构化的考勤状态：状态位、首末次打卡分钟数、按来源的加班时长、请假天数，
+出差事由、请假说明等文本按单元格稀疏保存。流水线中各阶段直接更新矩阵，
+只在写回数据库和导出报表时生成文本，汇总统计直接读取状态位，不再解析单元格文本
+"""
+
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+import punch_rules
+from employees import EMPLOYEE_KEY
+
+# 每日考勤字段
+DAY_FIELDS = [f'第{i}天' for i in range(1, 32)]
+
+# 状态位
+FLAG_NORMAL = 1 << 0
+FLAG_LATE = 1 << 1
+FLAG_EARLY = 1 << 2
+FLAG_MISSING = 1 << 3
+FLAG_ABSENT = 1 << 4
+FLAG_TRIP = 1 << 5
+FLAG_LEAVE = 1 << 6
+FLAG_OVERTIME = 1 << 7
+
+# 打卡状态编码 → 状态位
+CODE_FLAGS = {
+    punch_rules.CODE_MISSING: FLAG_MISSING,
+    punch_rules.CODE_ABSENT_FULL: FLAG_ABSENT,
+    punch_rules.CODE_ABSENT_HALF: FLAG_ABSENT,
+    punch_rules.CODE_NORMAL: FLAG_NORMAL,
+    punch_rules.CODE_LATE: FLAG_LATE,
+    punch_rules.CODE_EARLY: FLAG_EARLY,
+    punch_rules.CODE_LATE_EARLY: FLAG_LATE | FLAG_EARLY,
+}
+CODE_TO_FLAGS = np.zeros(max(CODE_FLAGS) + 1, dtype=np.uint8)
+for _code, _flag in CODE_FLAGS.items():
+    CODE_TO_FLAGS[_code] = _flag
+
+# 加班时长按来源分列保存
+OVERTIME_SOURCES = ('钉钉', '飞书')
+
+# 请假时长按小时填写时，折算为天数的每日工时
+WORK_HOURS_PER_DAY = 8
+
+# 单元格附加内容的类型
+NOTE_TRIP = 'trip'
+NOTE_LEAVE = 'leave'
+NOTE_OVERTIME = 'overtime'
+
+def leave_fraction(duration):
+    """把 '1天' / '0.5天' / '16小时' 形式的请假时长折算为天数，无法识别时返回 0"""
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(小时|天)?', str(duration))
+    if not match:
+        return 0.0
+    value = float(match.group(1))
+    return value / WORK_HOURS_PER_DAY if match.group(2) == '小时' else value
+
+class DayStatusMatrix:
+    """
+    员工 × 日期 的考勤状态
+
+    属性:
+        names (list): 每行员工姓名
+        ids (np.ndarray[int64]): 每行的 员工ID
+        employees (pd.DataFrame): 每行员工的基础字段
+        codes (np.ndarray[int8]): 打卡规则的状态编码
+        flags (np.ndarray[uint8]): 状态位
+        first, last (np.ndarray[int16]): 首次/末次打卡分钟数，无打卡为 -1
+        overtime (np.ndarray[float32]): 按来源的加班时长，形状 (员工, 日期, 来源)
+        leave_days (np.ndarray[float32]): 请假天数
+        raw_texts (dict): {(行, 列): 原文}，休息日有打卡或缺卡需追加原文的单元格
+        notes (dict): {(行, 列): [附加内容]}，出差、请假、加班按写入顺序保存
+    """
+
+    __slots__ = ('names', 'ids', 'employees', 'codes', 'flags', 'first', 'last',
+                 'overtime', 'leave_days', 'raw_texts', 'notes', '_rows', '_base')
+
+    def __init__(self, employees, ids, codes, first, last, raw_texts):
+        n_rows, n_days = codes.shape
+        self.employees = employees.reset_index(drop=True)
+        self.names = self.employees['姓名'].tolist()
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.codes = codes.astype(np.int8)
+        self.flags = CODE_TO_FLAGS[self.codes]
+        self.first = first.astype(np.int16)
+        self.last = last.astype(np.int16)
+        self.overtime = np.zeros((n_rows, n_days, len(OVERTIME_SOURCES)), dtype=np.float32)
+        self.leave_days = np.zeros((n_rows, n_days), dtype=np.float32)
+        self.raw_texts = raw_texts
+        self.notes = {}
+        # 打卡规则部分的状态文本，首次 render() 时生成
+        self._base = None
+        self._rows = {}
+        for row, employee_id in enumerate(self.ids.tolist()):
+            self._rows.setdefault(employee_id, []).append(row)
+
+    @classmethod
+    def from_punches(cls, employees, ids, values, texts, first, last, codes):
+        """由 punch_rules.evaluate_codes 的结果构建"""
+        keep = (codes == punch_rules.CODE_RAW) | punch_rules.shown_missing_text(codes, values, texts)
+        raw_texts = {(int(i), int(j)): texts[i, j] for i, j in zip(*np.nonzero(keep))}
+        return cls(employees, ids, codes, first, last, raw_texts)
+
+    @classmethod
+    def concat(cls, parts):
+        """按行拼接多个批次的矩阵（只用于尚未合并审批记录的矩阵）"""
+        raw_texts = {}
+        offset = 0
+        for part in parts:
+            for (i, j), text in part.raw_texts.items():
+                raw_texts[(i + offset, j)] = text
+            offset += len(part.names)
+        return cls(
+            pd.concat([part.employees for part in parts], ignore_index=True),
+            np.concatenate([part.ids for part in parts]),
+            np.concatenate([part.codes for part in parts]),
+            np.concatenate([part.first for part in parts]),
+            np.concatenate([part.last for part in parts]),
+            raw_texts,
+        )
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def __contains__(self, employee_id):
+        return employee_id in self._rows
+
+    def __iter__(self):
+        """按首次出现的顺序遍历 员工ID"""
+        return iter(self._rows)
+
+    def _cell(self, employee_id, day):
+        """同一 员工ID 有多条记录时以第一条为准"""
+        return self._rows[employee_id][0], day - 1
+
+    def _mirror(self, employee_id, col):
+        """与按 员工ID UPDATE 的结果一致：同一员工的其他记录复制第一条记录的单元格"""
+        rows = self._rows[employee_id]
+        if len(rows) == 1:
+            return
+        src = rows[0]
+        for row in rows[1:]:
+            for array in (self.codes, self.flags, self.first, self.last, self.overtime, self.leave_days):
+                array[row, col] = array[src, col]
+            for store in (self.raw_texts, self.notes):
+                if (src, col) in store:
+                    store[(row, col)] = list(store[(src, col)]) if store is self.notes else store[(src, col)]
+                else:
+                    store.pop((row, col), None)
+            if self._base is not None:
+                self._base[row, col] = self._base[src, col]
+
+    def set_trip(self, employee_id, day, reason):
+        """出差：覆盖当天原有的考勤状态"""
+        row, col = self._cell(employee_id, day)
+        self.flags[row, col] = FLAG_TRIP
+        self.overtime[row, col] = 0
+        self.leave_days[row, col] = 0
+        self.notes[(row, col)] = [(NOTE_TRIP, reason)]
+        self._mirror(employee_id, col)
+        return employee_id, DAY_FIELDS[col]
+
+    def add_leave(self, employee_id, day, source, duration, reason):
+        """请假：追加到当天已有状态之后"""
+        row, col = self._cell(employee_id, day)
+        self.flags[row, col] |= FLAG_LEAVE
+        self.leave_days[row, col] += leave_fraction(duration)
+        self.notes.setdefault((row, col), []).append((NOTE_LEAVE, source, duration, reason))
+        self._mirror(employee_id, col)
+        return employee_id, DAY_FIELDS[col]
+
+    def add_overtime(self, employee_id, day, source, hours):
+        """加班：按来源追加当天的加班时长（保留两位小数）"""
+        row, col = self._cell(employee_id, day)
+        hours = round(hours, 2)
+        self.flags[row, col] |= FLAG_OVERTIME
+        if source in OVERTIME_SOURCES:
+            self.overtime[row, col, OVERTIME_SOURCES.index(source)] += hours
+        self.notes.setdefault((row, col), []).append((NOTE_OVERTIME, source, hours))
+        self._mirror(employee_id, col)
+        return employee_id, DAY_FIELDS[col]
+
+    def _render_base(self):
+        """打卡规则部分的状态文本（整个矩阵只生成一次）"""
+        if self._base is None:
+            texts = np.full(self.shape, '', dtype=object)
+            shown = np.zeros(self.shape, dtype=bool)
+            for (i, j), text in self.raw_texts.items():
+                texts[i, j] = text
+                shown[i, j] = self.codes[i, j] == punch_rules.CODE_MISSING
+            self._base = punch_rules.render_codes(self.codes, self.first, self.last, texts, shown)
+        return self._base
+
+    def _render_base_cells(self, rows, cols):
+        """只生成指定单元格的打卡规则部分文本（已生成整个矩阵时直接取用）"""
+        if self._base is not None:
+            return self._base[rows, cols]
+        codes = self.codes[rows, cols]
+        texts = np.array([self.raw_texts.get((i, j), '') for i, j in zip(rows.tolist(), cols.tolist())], dtype=object)
+        shown = (codes == punch_rules.CODE_MISSING) & np.array(
+            [(i, j) in self.raw_texts for i, j in zip(rows.tolist(), cols.tolist())], dtype=bool)
+        return punch_rules.render_codes(codes, self.first[rows, cols], self.last[rows, cols], texts, shown)
+
+    @staticmethod
+    def _render_notes(text, notes):
+        """按写入顺序拼接出差、请假、加班信息"""
+        for note in notes:
+            if note[0] == NOTE_TRIP:
+                text = f"出差({note[1]})"
+            elif note[0] == NOTE_LEAVE:
+                _, source, duration, reason = note
+                leave_info = f"{source}请假({duration})({reason})"
+                text = f"{text}\n{leave_info}" if text and text.strip() else leave_info
+            else:
+                _, source, hours = note
+                overtime_info = f"{source}加班({hours}h)"
+                text = f"{text} + {overtime_info}" if text and str(text) != 'nan' else overtime_info
+        return text
+
+    def render(self):
+        """生成全部单元格的状态文本"""
+        result = self._render_base().copy()
+        for (i, j), notes in self.notes.items():
+            result[i, j] = self._render_notes(result[i, j], notes)
+        return result
+
+    def render_cells(self, cells):
+        """
+        生成指定单元格的状态文本
+
+        参数:
+            cells (iterable): {(员工ID, '第N天')}
+
+        返回:
+            dict: {(员工ID, '第N天'): 文本}
+        """
+        cells = list(cells)
+        if not cells:
+            return {}
+        rows = np.array([self._rows[employee_id][0] for employee_id, _ in cells], dtype=np.intp)
+        cols = np.array([DAY_FIELDS.index(column) for _, column in cells], dtype=np.intp)
+        base = self._render_base_cells(rows, cols)
+        return {
+            cell: self._render_notes(base[k], self.notes.get((int(rows[k]), int(cols[k])), ()))
+            for k, cell in enumerate(cells)
+        }
+
+    def to_frame(self):
+        """基础字段 + 第1天…第N天 的状态文本 + 员工ID"""
+        days = pd.DataFrame(self.render(), columns=DAY_FIELDS[:self.shape[1]])
+        days[EMPLOYEE_KEY] = self.ids
+        return pd.concat([self.employees, days], axis=1)
+
+    def overtime_entries(self):
+        """按员工、日期及写入顺序排列的加班记录: (行号数组, 来源列表, 时长数组)"""
+        rows, sources, hours = [], [], []
+        for (i, j) in sorted(self.notes):
+            for note in self.notes[(i, j)]:
+                if note[0] == NOTE_OVERTIME:
+                    rows.append(i)
+                    sources.append(note[1])
+                    hours.append(note[2])
+        return np.array(rows, dtype=np.int64), sources, np.array(hours, dtype=float)
+
+# 流水线运行期间各阶段共享的矩阵
+_current = None
+_lock = threading.Lock()
+
+def publish(matrix):
+    """登记本次运行的考勤状态矩阵，供后续阶段使用"""
+    global _current
+    with _lock:
+        _current = matrix
+
+def current():
+    """本次运行的考勤状态矩阵；单独运行某个阶段时为 None，各阶段改为读写数据库中的文本"""
+    with _lock:
+        return _current
+
+def reset():
+    publish(None)
@@ -0,0 +1,343 @@
+"""
+数据库访问
+各阶段和 API 共用一个线程安全的连接池：get_connection() 从池中取连接，close() 时归还；
+取连接时遇到连接失败等临时错误自动重试，每条语句记录耗时，慢语句单独打印。
+transaction() 让整条流水线在同一连接、同一事务中运行，全部成功才提交
+
+config.DB_BACKEND 为 "sqlite" 时，中间表改为存放在本地 SQLite 文件（或内存）中，
+所有阶段共用同一个本地连接，Postgres 只作为可选的发布目标（见 publish.py）
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions, sql
+from psycopg2 import pool as pg_pool
+
+import config
+from sqlite_backend import SQLiteConnection, SQLiteCursor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 取连接时视为临时错误、可以重试的异常
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, pg_pool.PoolError)
+
+_pool = None
+_pool_config = None
+_lock = threading.Lock()
+
+# 已从连接池取出、尚未归还的连接: {id(连接): (连接, 所属连接池)}
+_checked_out = {}
+
+# 本地 SQLite 连接（所有阶段共用）
+_local = None
+
+# 流水线事务: 共享连接及事务中是否有阶段回滚
+_shared = None
+_shared_failed = False
+
+# 语句耗时统计
+_stats = {'statements': 0, 'seconds': 0.0}
+_stats_lock = threading.Lock()
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def _summarize(query):
+    """慢语句日志中显示的语句摘要"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        query = str(query)
+    return ' '.join(query.split())[:120]
+
+def _record(query, elapsed):
+    with _stats_lock:
+        _stats['statements'] += 1
+        _stats['seconds'] += elapsed
+    if elapsed >= config.DB_SLOW_STATEMENT_SECONDS:
+        flush_print(f"🐢 慢语句 {elapsed:.2f}s: {_summarize(query)}")
+
+class TimedCursor(extensions.cursor):
+    """记录每条语句耗时的游标"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record(query, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record(query, time.perf_counter() - started)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _record(sql, time.perf_counter() - started)
+
+class PooledConnection(extensions.connection):
+    """
+    连接池中的连接: close() 归还到池中而不是断开；
+    作为流水线事务的共享连接时，各阶段的 commit() 不提交，rollback() 使整个事务回滚
+    """
+
+    _pooled = False
+
+    def close(self):
+        if self._pooled and _release(self):
+            return
+        super().close()
+
+    def commit(self):
+        if self is _shared:
+            return
+        super().commit()
+
+    def rollback(self):
+        global _shared_failed
+        if self is _shared:
+            _shared_failed = True
+        super().rollback()
+
+class TimedLocalCursor(SQLiteCursor):
+    """记录每条语句耗时的本地游标"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record(query, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record(query, time.perf_counter() - started)
+
+class LocalConnection(SQLiteConnection):
+    """
+    本地 SQLite 连接: close() 只回滚未提交的修改，连接保持打开供后续阶段使用；
+    流水线事务中 commit()/rollback() 的处理与 PooledConnection 相同
+    """
+
+    def cursor(self):
+        return TimedLocalCursor(self)
+
+    def close(self):
+        if self is _shared:
+            return
+        self.rollback()
+
+    def commit(self):
+        if self is _shared:
+            return
+        super().commit()
+
+    def rollback(self):
+        global _shared_failed
+        if self is _shared:
+            _shared_failed = True
+        super().rollback()
+
+    def disconnect(self):
+        SQLiteConnection.close(self)
+
+def backend():
+    """当前的存储后端: postgres 或 sqlite"""
+    return getattr(config, 'DB_BACKEND', 'postgres')
+
+def is_embedded():
+    """是否使用本地嵌入式数据库（各阶段共用一个连接，不能并发运行）"""
+    return backend() == 'sqlite'
+
+def sqlite_path():
+    path = config.SQLITE_PATH
+    return path if path == ':memory:' else os.path.join(BASE_DIR, path)
+
+def history_sqlite_path():
+    return os.path.join(BASE_DIR, config.HISTORY_SQLITE_PATH)
+
+def _local_connection():
+    """取本地 SQLite 连接，数据库文件配置变化时重新打开"""
+    global _local
+    with _lock:
+        if _local is None or _local.path != sqlite_path():
+            if _local is not None:
+                _local.disconnect()
+            _local = LocalConnection(sqlite_path())
+            # 历史库是单独的数据库文件，各月份共用（见 history.py）
+            _local.attach(config.HISTORY_SCHEMA, history_sqlite_path())
+        return _local
+
+def _get_pool():
+    """按当前 config.DB_CONFIG 取连接池，配置变化时重建"""
+    global _pool, _pool_config
+    with _lock:
+        if _pool is None or _pool_config != config.DB_CONFIG:
+            if _pool is not None:
+                _close_pool(_pool)
+            _pool = pg_pool.ThreadedConnectionPool(
+                config.DB_POOL_MIN,
+                config.DB_POOL_MAX,
+                connection_factory=PooledConnection,
+                cursor_factory=TimedCursor,
+                **config.DB_CONFIG,
+            )
+            _pool_config = dict(config.DB_CONFIG)
+        return _pool
+
+def _close_pool(pool):
+    """断开连接池中的全部连接（调用方持有 _lock），已取出的连接之后 close() 时直接断开"""
+    for key, (conn, owner) in list(_checked_out.items()):
+        if owner is pool:
+            conn._pooled = False
+            del _checked_out[key]
+    pool.closeall()
+
+def _release(conn):
+    """把连接归还到取出它的连接池；连接不是从池中取出的或池已关闭时返回 False，由调用方直接断开"""
+    if conn is _shared:
+        return True
+    with _lock:
+        entry = _checked_out.pop(id(conn), None)
+    if entry is None or entry[0] is not conn:
+        return False
+    pool = entry[1]
+    conn._pooled = False
+    if not conn.closed and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        # 调用方未提交的修改不能带到下一次使用
+        extensions.connection.rollback(conn)
+    try:
+        pool.putconn(conn, close=bool(conn.closed))
+    except pg_pool.PoolError:
+        # 归还前连接池已被关闭（配置变化后重建）
+        return False
+    return True
+
+def _checkout():
+    """从池中取一个可用的连接，连接失败或池已用尽时按配置重试"""
+    attempts = max(1, config.DB_CONNECT_RETRIES)
+    for attempt in range(1, attempts + 1):
+        pool = conn = None
+        try:
+            # 新建连接池时会立即建立 DB_POOL_MIN 个连接，同样可能失败
+            pool = _get_pool()
+            conn = pool.getconn()
+            # 池中的空闲连接可能已被服务器断开，取出时先检查
+            with extensions.cursor(conn) as cursor:
+                cursor.execute("SELECT 1")
+            conn._pooled = True
+            with _lock:
+                _checked_out[id(conn)] = (conn, pool)
+            return conn
+        except TRANSIENT_ERRORS as e:
+            if conn is not None:
+                pool.putconn(conn, close=True)
+            if attempt == attempts:
+                raise
+            delay = config.DB_RETRY_DELAY * attempt
+            flush_print(f"⚠️ 数据库连接失败（第 {attempt} 次），{delay:.1f}s 后重试: {e}")
+            time.sleep(delay)
+
+def get_connection():
+    """
+    取得数据库连接，用完调用 close() 归还
+
+    处于 transaction() 中时返回流水线共享的连接；使用本地 SQLite 时返回本地连接
+    """
+    if _shared is not None:
+        return _shared
+    if is_embedded():
+        return _local_connection()
+    return _checkout()
+
+def postgres_connection():
+    """取得 Postgres 连接（不受 DB_BACKEND 影响，用于发布结果）"""
+    return _checkout()
+
+def _base(conn):
+    """连接类型覆盖 commit/rollback 之前的实现"""
+    return super(type(conn), conn)
+
+def table_exists(cursor, table):
+    """判断表是否存在"""
+    if getattr(cursor.connection, 'backend', 'postgres') == 'sqlite':
+        cursor.execute("SELECT count(*) > 0 FROM sqlite_master WHERE type = 'table' AND name = %s", (table,))
+    else:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    return bool(cursor.fetchone()[0])
+
+def staging_table(table):
+    """重建工作表时先写入的表，写完后由 swap_table 换入"""
+    return f"{table}__new"
+
+def swap_table(cursor, table):
+    """
+    用写好的 staging_table(table) 替换 table：删除旧表和改名随调用方的事务一起提交，
+    其他连接看到的始终是完整的旧表或新表，不会遇到表不存在或只写了一半的表
+    """
+    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table)))
+    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+        sql.Identifier(staging_table(table)), sql.Identifier(table)
+    ))
+
+@contextlib.contextmanager
+def transaction():
+    """
+    整条流水线在同一个连接、同一个事务中运行：正常结束时提交，
+    任一阶段回滚或抛出异常时整体回滚，数据库中不会留下只完成一半的结果
+
+    共享连接不能被多个线程同时使用，事务中的阶段需要串行运行
+    """
+    global _shared, _shared_failed
+    conn = _local_connection() if is_embedded() else _checkout()
+    _shared, _shared_failed = conn, False
+    try:
+        yield conn
+        if _shared_failed:
+            raise psycopg2.DatabaseError("流水线中有阶段回滚了事务")
+        _base(conn).commit()
+        flush_print("✅ 流水线事务已提交")
+    except BaseException:
+        _base(conn).rollback()
+        flush_print("❌ 流水线事务已回滚")
+        raise
+    finally:
+        _shared, _shared_failed = None, False
+        conn.close()
+
+def statement_stats():
+    """返回 {'statements': 语句数, 'seconds': 累计耗时}"""
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_statement_stats():
+    with _stats_lock:
+        _stats['statements'] = 0
+        _stats['seconds'] = 0.0
+
+def close_pool():
+    """断开连接池中的全部连接及本地连接（服务退出时调用）"""
+    global _pool, _pool_config, _local
+    with _lock:
+        if _pool is not None:
+            _close_pool(_pool)
+        if _local is not None:
+            _local.disconnect()
+        _pool, _pool_config, _local = None, None, None
@@ -2,177 +2,474 @@
 # -*- coding: utf-8 -*-
 """
 考勤分析系统 API 接口
-使用 FastAPI 构建，提供调用 run_all_scripts.sh 脚本的功能
+使用 FastAPI 构建，提供在进程内运行考勤分析流水线（pipeline.py）的功能
 """
 
+import asyncio
+import contextlib
+import itertools
+import json
+import mimetypes
 import os
-import subprocess
+import threading
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, List
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, FastAPI, HTTPException, Header, Query, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, DEFAULT_EXCLUDED_CONTENT_TYPES
 import uvicorn
-import glob
 
-app = FastAPI(
-    title="考勤分析系统 API",
-    description="提供考勤分析脚本调用功能",
-    version="1.0.0"
-)
+import db
+import pipeline
 
-# 全局变量存储脚本执行状态
-script_status = {
-    'is_running': False,
-    'start_time': None,
-    'end_time': None,
-    'exit_code': None,
-    'output': '',
-    'error': ''
+# SelectiveGZipMiddleware 的参数：已经压缩过的文件（xlsx 本身是 zip 包）不再 gzip，其余响应（文件列表等 JSON）超过 1KB 时按需压缩
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+GZIP_OPTIONS = {
+    'minimum_size': 1024,
+    'exclude_content_types': DEFAULT_EXCLUDED_CONTENT_TYPES + (XLSX_MEDIA_TYPE,)
 }
 
-def run_script():
-    """执行脚本并返回结果"""
-    global script_status
-    
-    script_status['is_running'] = True
-    script_status['start_time'] = datetime.now().isoformat()
-    script_status['output'] = ''
-    script_status['error'] = ''
+class SelectiveGZipMiddleware:
+    """
+    GZipMiddleware 的包装：Content-Type 属于 exclude_content_types 的响应（xlsx 下载、事件流）
+    不经过 gzip 原样发送，其余响应交给 GZipMiddleware 按需压缩
+    """
+
+    def __init__(self, app, minimum_size=500, compresslevel=9, exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.exclude_content_types = tuple(exclude_content_types)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def route(scope, receive, gzip_send):
+            bypass = False
+
+            # 响应头决定整条响应走哪一路：不压缩的响应直接发给客户端，GZipMiddleware 收不到任何消息
+            async def route_send(message):
+                nonlocal bypass
+                if message["type"] == "http.response.start":
+                    content_type = Headers(raw=message["headers"]).get("content-type", "")
+                    bypass = content_type.startswith(self.exclude_content_types)
+                await (send if bypass else gzip_send)(message)
+
+            await self.app(scope, receive, route_send)
+
+        await GZipMiddleware(route, minimum_size=self.minimum_size, compresslevel=self.compresslevel)(scope, receive, send)
+
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
+
+# /api/files 每页文件数的默认值和上限
+FILES_PAGE_SIZE = 100
+FILES_MAX_PAGE_SIZE = 1000
+
+# 同时运行的流水线数：各次运行读写同一组中间表，pipeline 在进程内也是逐次运行，默认 1
+JOB_WORKERS = 1
+# 排队等待的任务数上限，超出时拒绝新的任务
+MAX_QUEUED_JOBS = 20
+# 保留的已结束任务记录数，超出时删除最早的记录
+MAX_FINISHED_JOBS = 100
+# 每个任务保留的最近事件数，更早的事件被丢弃，事件流中以 truncated 事件说明
+MAX_JOB_EVENTS = 2000
+
+# 任务记录 {任务ID: 记录}，按提交顺序排列；记录在工作线程中更新，读写都在 _jobs_lock 下进行
+_jobs = OrderedDict()
+_futures = {}
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="pipeline-job")
+
+# 已结束的任务状态
+FINISHED_STATES = ('success', 'failed', 'cancelled')
+# 事件流在没有新事件时发送保活注释的间隔（秒），避免代理断开空闲连接
+EVENT_KEEPALIVE_SECONDS = 15
+
+# 事件循环及各任务的事件等待者：工作线程追加事件后通过 call_soon_threadsafe 唤醒事件流
+_loop = None
+_event_waiters = {}
+
+# 输出目录索引：目录 mtime 变化或任务结束时重新扫描，其余请求直接使用内存中的列表
+_output_index = {'mtime_ns': None, 'files': [], 'by_name': {}}
+_output_index_lock = threading.Lock()
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """启动时记下事件循环；退出时取消排队中的任务，并断开连接池中的数据库连接"""
+    global _loop
+    _loop = asyncio.get_running_loop()
+    yield
+    _executor.shutdown(wait=False, cancel_futures=True)
+    db.close_pool()
+
+# 接口路由，由本模块的 app 和 service.py 的合并服务共同挂载
+router = APIRouter(lifespan=lifespan)
+
+def _new_job(incremental, transaction):
+    return {
+        'job_id': uuid.uuid4().hex,
+        'state': 'queued',
+        'incremental': incremental,
+        'transaction': transaction,
+        'submitted_time': datetime.now().isoformat(),
+        'is_running': False,
+        'start_time': None,
+        'end_time': None,
+        'exit_code': None,
+        'output': '',
+        'error': '',
+        'stages': [],
+        'sql': None,
+        'events': deque(maxlen=MAX_JOB_EVENTS),
+        'event_count': 0
+    }
+
+def _job_view(job):
+    """任务记录的副本（事件通过 /api/jobs/{job_id}/events 获取），排队中的任务附带排队位置（从 1 开始）"""
+    view = dict(job)
+    del view['events']
+    if job['state'] == 'queued':
+        queued = [j['job_id'] for j in _jobs.values() if j['state'] == 'queued']
+        view['queue_position'] = queued.index(job['job_id']) + 1
+    return view
+
+def _prune_jobs():
+    """只保留最近 MAX_FINISHED_JOBS 条已结束的任务记录"""
+    finished = [job_id for job_id, job in _jobs.items() if job['state'] in FINISHED_STATES]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+def _wake_event_waiters(job_id):
+    """在事件循环中唤醒等待该任务新事件的事件流"""
+    waiter = _event_waiters.pop(job_id, None)
+    if waiter is not None:
+        waiter.set()
+
+def _add_event(job, event):
+    """追加任务事件（可在任意线程中调用）"""
+    with _jobs_lock:
+        job['events'].append(event)
+        job['event_count'] += 1
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wake_event_waiters, job['job_id'])
+
+def run_script(job):
+    """在工作线程中执行考勤分析流水线，结果和运行期间的进度事件写入任务记录"""
+    with _jobs_lock:
+        if job['state'] != 'queued':
+            return
+        job['state'] = 'running'
+        job['is_running'] = True
+        job['start_time'] = datetime.now().isoformat()
     
     try:
-        # 获取脚本的绝对路径
-        script_path = os.path.join(os.path.dirname(__file__), 'run_all_scripts.sh')
-        
-        # 确保脚本有执行权限
-        os.chmod(script_path, 0o755)
-        
-        # 执行脚本
-        process = subprocess.Popen(
-            ['bash', script_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=os.path.dirname(__file__)
+        result = pipeline.run_pipeline(
+            incremental=job['incremental'],
+            transaction=job['transaction'],
+            on_event=lambda event: _add_event(job, event)
         )
-        
-        # 获取输出
-        stdout, stderr = process.communicate()
-        
-        script_status['output'] = stdout
-        if stderr:
-            script_status['error'] = stderr
-        
-        # 获取退出代码
-        exit_code = process.returncode
-        script_status['exit_code'] = exit_code
-        script_status['end_time'] = datetime.now().isoformat()
-        script_status['is_running'] = False
-        
-        if exit_code == 0:
-            return True, "脚本执行成功"
-        else:
-            return False, f"脚本执行失败，退出代码: {exit_code}"
+        failed = [r for r in result['stages'] if r['error']]
+        with _jobs_lock:
+            job['output'] = result['output']
+            job['stages'] = result['stages']
+            job['sql'] = result['sql']
+            if failed:
+                job['error'] = '\n'.join(f"{r['stage']}: {r['error']}" for r in failed)
+            job['exit_code'] = 0 if result['success'] else 1
             
     except Exception as e:
-        script_status['error'] = str(e)
-        script_status['end_time'] = datetime.now().isoformat()
-        script_status['is_running'] = False
-        script_status['exit_code'] = -1
-        return False, f"执行脚本时发生异常: {e}"
-
-@app.post("/api/run-script")
-async def run_basic_combined() -> Dict[str, Any]:
-    """启动 run_all_scripts.sh 脚本并等待执行完成"""
-    global script_status
+        with _jobs_lock:
+            job['error'] = str(e)
+            job['exit_code'] = -1
+    
+    finally:
+        with _jobs_lock:
+            job['state'] = 'success' if job['exit_code'] == 0 else 'failed'
+            job['is_running'] = False
+            job['end_time'] = datetime.now().isoformat()
+        # 报表在原文件上重写时目录 mtime 不变，任务结束后总是重新扫描
+        invalidate_output_index()
+        _add_event(job, {'event': 'job_finished', 'time': job['end_time'], 'stage': None,
+                         'state': job['state'], 'exit_code': job['exit_code']})
+
+def submit_job(incremental=False, transaction=False):
+    """提交一次流水线运行，返回 (任务记录, Future)；排队任务已满时返回 429"""
+    with _jobs_lock:
+        queued = sum(1 for job in _jobs.values() if job['state'] == 'queued')
+        if queued >= MAX_QUEUED_JOBS:
+            raise HTTPException(
+                status_code=429,
+                detail=f"排队中的任务已达上限（{MAX_QUEUED_JOBS}），请稍后再试"
+            )
+        job = _new_job(incremental, transaction)
+        _jobs[job['job_id']] = job
+        future = _executor.submit(run_script, job)
+        _futures[job['job_id']] = future
+        _prune_jobs()
+    future.add_done_callback(lambda _: _futures.pop(job['job_id'], None))
+    return job, future
+
+def submit_background(fn, *args):
+    """
+    在任务工作线程中执行 fn(*args)（如上传后的预解析），不产生任务记录；
+    与流水线任务共用队列，之后提交的任务在它完成后才开始
+    """
+    return _executor.submit(fn, *args)
+
+def _get_job(job_id):
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"任务 {job_id} 不存在"
+        )
+    return job
+
+@router.post("/api/run-script")
+async def run_basic_combined(incremental: bool = False, transaction: bool = False) -> Dict[str, Any]:
+    """运行考勤分析流水线并等待执行完成（incremental=true 时只重算审批变化涉及的单元格，
+    transaction=true 时所有阶段在同一个数据库事务中运行）；
+    已有任务在运行时排队等待，等待期间不占用事件循环"""
+    job, future = submit_job(incremental, transaction)
+    # 等待任务结束（包括在排队时被取消），不抛出取消异常
+    await asyncio.wait([asyncio.wrap_future(future)])
     
-    if script_status['is_running']:
+    with _jobs_lock:
+        status = _job_view(job)
+    if status['state'] == 'cancelled':
         raise HTTPException(
             status_code=409,
-            detail="脚本正在运行中，请稍后再试"
+            detail="任务在排队时已被取消"
         )
-    
-    # 同步执行脚本并等待完成
-    success, message = run_script()
-    
-    if success:
+    if status['exit_code'] == 0:
         return {
             "success": True,
-            "message": message,
-            "status": script_status
+            "message": "脚本执行成功",
+            "job_id": job['job_id'],
+            "status": status
         }
-    else:
+    elif status['exit_code'] == -1:
         raise HTTPException(
             status_code=500,
-            detail=message
+            detail=f"执行脚本时发生异常: {status['error']}"
         )
-
-@app.post("/api/run-script-async")
-async def run_script_async() -> Dict[str, Any]:
-    """在后台异步启动 run_all_scripts.sh 脚本"""
-    global script_status
-    
-    if script_status['is_running']:
+    else:
         raise HTTPException(
-            status_code=409,
-            detail="脚本正在运行中，请稍后再试"
+            status_code=500,
+            detail=f"脚本执行失败，退出代码: {status['exit_code']}"
         )
+
+@router.post("/api/run-script-async")
+async def run_script_async(incremental: bool = False, transaction: bool = False) -> Dict[str, Any]:
+    """提交考勤分析流水线任务并立即返回任务ID（incremental=true 时只重算审批变化涉及的单元格，
+    transaction=true 时所有阶段在同一个数据库事务中运行）；已有任务在运行时排队等待"""
+    job, _ = submit_job(incremental, transaction)
     
-    # 启动后台线程执行脚本
-    import threading
-    thread = threading.Thread(target=run_script)
-    thread.daemon = True
-    thread.start()
-    
+    with _jobs_lock:
+        status = _job_view(job)
+    return {
+        "success": True,
+        "message": "脚本已启动，正在后台执行" if status['state'] == 'running' else "任务已加入队列",
+        "job_id": job['job_id'],
+        "status": status
+    }
+
+@router.get("/api/jobs")
+async def list_jobs() -> Dict[str, Any]:
+    """获取全部任务记录（不含运行输出），最新提交的在前"""
+    with _jobs_lock:
+        jobs = [_job_view(job) for job in reversed(_jobs.values())]
+    for job in jobs:
+        del job['output']
+    return {
+        "success": True,
+        "jobs": jobs,
+        "total_count": len(jobs)
+    }
+
+@router.get("/api/jobs/{job_id}")
+async def get_job(job_id: str) -> Dict[str, Any]:
+    """获取单个任务的状态和运行结果"""
+    with _jobs_lock:
+        status = _job_view(_get_job(job_id))
     return {
         "success": True,
-        "message": "脚本已启动，正在后台执行",
-        "status": script_status
+        "status": status
     }
 
-@app.get("/api/script-status")
+@router.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str) -> Dict[str, Any]:
+    """取消排队中的任务（正在运行的任务不能取消）"""
+    with _jobs_lock:
+        job = _get_job(job_id)
+        future = _futures.get(job_id)
+        if job['state'] != 'queued' or future is None or not future.cancel():
+            raise HTTPException(
+                status_code=409,
+                detail=f"任务 {job_id} 不在排队中，无法取消"
+            )
+        job['state'] = 'cancelled'
+        job['end_time'] = datetime.now().isoformat()
+        status = _job_view(job)
+    _add_event(job, {'event': 'job_finished', 'time': job['end_time'], 'stage': None,
+                     'state': 'cancelled', 'exit_code': None})
+    return {
+        "success": True,
+        "message": "任务已取消",
+        "status": status
+    }
+
+async def _event_stream(job, after):
+    """
+    以 Server-Sent Events 格式依次输出任务的事件，事件 id 为序号（从 1 开始），
+    任务结束且事件全部发出后结束；要发送的事件已被丢弃时先发送一条 truncated 事件
+    """
+    sent = after
+    while True:
+        with _jobs_lock:
+            # 保留的事件中第一条的序号为 dropped + 1
+            dropped = job['event_count'] - len(job['events'])
+            events = list(itertools.islice(job['events'], max(0, sent - dropped), None))
+            finished = job['state'] in FINISHED_STATES
+        if sent < dropped:
+            data = json.dumps({'event': 'truncated', 'skipped': dropped - sent}, ensure_ascii=False)
+            yield f"id: {dropped}\nevent: truncated\ndata: {data}\n\n"
+            sent = dropped
+        for event in events:
+            sent += 1
+            data = json.dumps(event, ensure_ascii=False, default=str)
+            yield f"id: {sent}\nevent: {event['event']}\ndata: {data}\n\n"
+        if finished and not events:
+            return
+        if events:
+            continue
+        # 读取事件和登记等待者之间没有 await，工作线程的唤醒不会丢失
+        waiter = _event_waiters.setdefault(job['job_id'], asyncio.Event())
+        try:
+            await asyncio.wait_for(waiter.wait(), EVENT_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
+
+@router.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, after: int = 0, last_event_id: Optional[int] = Header(None)):
+    """
+    以 Server-Sent Events 推送任务的进度事件：stage_started / stage_finished（状态、耗时 elapsed_ms、写入行数 rows）、
+    rows（每次批量写入的表和行数）、log（运行输出的每一行）、pipeline_finished、job_finished 等；
+    先补发已有事件（after 或断线重连时的 Last-Event-ID 之后的事件），任务结束后关闭连接
+    """
+    with _jobs_lock:
+        job = _get_job(job_id)
+    return StreamingResponse(
+        _event_stream(job, max(after, last_event_id or 0)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/api/script-status")
 async def get_script_status() -> Dict[str, Any]:
-    """获取脚本执行状态"""
+    """获取脚本执行状态：正在运行的任务，没有时为最近提交的任务"""
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+        current = next((job for job in jobs if job['state'] == 'running'), jobs[-1] if jobs else None)
+        status = _job_view(current) if current is not None else {'is_running': False}
+        queued = sum(1 for job in jobs if job['state'] == 'queued')
     return {
         "success": True,
-        "status": script_status
+        "status": status,
+        "queued_count": queued
     }
 
-@app.get("/api/files")
-async def get_output_files() -> Dict[str, Any]:
-    """获取输出目录中的所有文件"""
+def _etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+def _scan_output_dir():
+    """扫描输出目录，返回按修改时间排序（最新的在前）的文件信息列表"""
+    files = []
+    with os.scandir(OUTPUT_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            files.append({
+                "name": entry.name,
+                "size": stat.st_size,
+                "size_mb": round(stat.st_size / (1024 * 1024), 2),
+                "modified_time": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                "download_url": f"/api/download/{entry.name}",
+                "etag": _etag(stat),
+                "_stat": stat
+            })
+    files.sort(key=lambda f: f['_stat'].st_mtime_ns, reverse=True)
+    return files
+
+def invalidate_output_index():
+    """下次读取索引时重新扫描输出目录"""
+    with _output_index_lock:
+        _output_index['mtime_ns'] = None
+
+def output_index():
+    """输出目录的文件列表（最新的在前），目录不存在时返回 None"""
     try:
-        output_dir = os.path.join(os.path.dirname(__file__), 'output')
+        mtime_ns = os.stat(OUTPUT_DIR).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _output_index_lock:
+        if _output_index['mtime_ns'] != mtime_ns:
+            files = _scan_output_dir()
+            _output_index.update(mtime_ns=mtime_ns, files=files, by_name={f['name']: f for f in files})
+        return _output_index['files']
+
+def _find_output_file(filename):
+    if output_index() is None:
+        return None
+    with _output_index_lock:
+        return _output_index['by_name'].get(filename)
+
+def _public(entry):
+    return {key: value for key, value in entry.items() if not key.startswith('_')}
+
+def _etag_matches(if_none_match, etag):
+    """If-None-Match 是否命中（弱比较）"""
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in [tag[2:] if tag.startswith('W/') else tag for tag in candidates]
+
+@router.get("/api/files")
+async def get_output_files(
+    offset: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=FILES_MAX_PAGE_SIZE)
+) -> Dict[str, Any]:
+    """获取输出目录中的文件（按修改时间排序，最新的在前）；指定 offset 或 limit 时分页返回"""
+    try:
+        files = output_index()
         
-        if not os.path.exists(output_dir):
+        if files is None:
             return {
                 "success": True,
                 "files": [],
                 "message": "输出目录不存在"
             }
         
-        # 获取所有文件
-        files = []
-        for file_path in glob.glob(os.path.join(output_dir, '*')):
-            if os.path.isfile(file_path):
-                file_name = os.path.basename(file_path)
-                file_size = os.path.getsize(file_path)
-                file_time = datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
-                
-                files.append({
-                    "name": file_name,
-                    "size": file_size,
-                    "size_mb": round(file_size / (1024 * 1024), 2),
-                    "modified_time": file_time,
-                    "download_url": f"/api/download/{file_name}"
-                })
-        
-        # 按修改时间排序，最新的在前
-        files.sort(key=lambda x: x['modified_time'], reverse=True)
+        if offset is None and limit is None:
+            return {
+                "success": True,
+                "files": [_public(f) for f in files],
+                "total_count": len(files)
+            }
         
+        offset = offset or 0
+        limit = limit or FILES_PAGE_SIZE
         return {
             "success": True,
-            "files": files,
-            "total_count": len(files)
+            "files": [_public(f) for f in files[offset:offset + limit]],
+            "total_count": len(files),
+            "offset": offset,
+            "limit": limit
         }
         
     except Exception as e:
@@ -181,30 +478,33 @@ async def get_output_files() -> Dict[str, Any]:
             detail=f"获取文件列表失败: {str(e)}"
         )
 
-@app.get("/api/download/{filename}")
-async def download_file(filename: str):
-    """下载指定的输出文件"""
+@router.get("/api/download/{filename}")
+async def download_file(filename: str, request: Request):
+    """
+    下载指定的输出文件：响应带 ETag，If-None-Match 命中时返回 304；
+    支持 Range 断点续传（If-Range 与 ETag 不一致时返回完整文件）
+    """
     try:
-        output_dir = os.path.join(os.path.dirname(__file__), 'output')
-        file_path = os.path.join(output_dir, filename)
-        
-        # 安全检查：确保文件在输出目录内
-        if not os.path.abspath(file_path).startswith(os.path.abspath(output_dir)):
-            raise HTTPException(
-                status_code=400,
-                detail="无效的文件路径"
-            )
+        # 只接受输出目录中的文件名，索引中不存在的名称（包括 ../ 等路径）一律视为不存在
+        entry = _find_output_file(filename)
         
-        if not os.path.exists(file_path):
+        if entry is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"文件 {filename} 不存在"
             )
         
+        etag = entry['etag']
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        
         return FileResponse(
-            path=file_path,
+            path=os.path.join(OUTPUT_DIR, filename),
             filename=filename,
-            media_type='application/octet-stream'
+            media_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            stat_result=entry['_stat'],
+            headers={"ETag": etag, "Cache-Control": "no-cache"}
         )
         
     except HTTPException:
@@ -215,41 +515,31 @@ async def download_file(filename: str):
             detail=f"下载文件失败: {str(e)}"
         )
 
-@app.get("/api/latest-file")
+@router.get("/api/latest-file")
 async def get_latest_file() -> Dict[str, Any]:
     """获取最新的输出文件"""
     try:
-        output_dir = os.path.join(os.path.dirname(__file__), 'output')
+        files = output_index()
         
-        if not os.path.exists(output_dir):
+        if files is None:
             return {
                 "success": False,
                 "message": "输出目录不存在"
             }
         
-        # 获取所有文件
-        files = []
-        for file_path in glob.glob(os.path.join(output_dir, '*')):
-            if os.path.isfile(file_path):
-                file_name = os.path.basename(file_path)
-                file_time = os.path.getmtime(file_path)
-                files.append((file_name, file_time))
-        
         if not files:
             return {
                 "success": False,
                 "message": "没有找到输出文件"
             }
         
-        # 获取最新的文件
-        latest_file, latest_time = max(files, key=lambda x: x[1])
-        
+        latest = files[0]
         return {
             "success": True,
             "file": {
-                "name": latest_file,
-                "modified_time": datetime.fromtimestamp(latest_time).isoformat(),
-                "download_url": f"/api/download/{latest_file}"
+                "name": latest['name'],
+                "modified_time": latest['modified_time'],
+                "download_url": latest['download_url']
             }
         }
         
@@ -259,20 +549,34 @@ async def get_latest_file() -> Dict[str, Any]:
             detail=f"获取最新文件失败: {str(e)}"
         )
 
+ENDPOINTS = {
+    "POST /api/run-script": "启动考勤分析脚本（同步执行，等待完成）",
+    "POST /api/run-script-async": "提交考勤分析任务（后台排队执行，返回任务ID）",
+    "GET /api/jobs": "获取全部任务记录",
+    "GET /api/jobs/{job_id}": "获取指定任务的状态和结果",
+    "DELETE /api/jobs/{job_id}": "取消排队中的任务",
+    "GET /api/jobs/{job_id}/events": "任务进度事件流（Server-Sent Events）",
+    "GET /api/script-status": "获取脚本执行状态",
+    "GET /api/files": "获取输出文件列表（可用 offset、limit 分页）",
+    "GET /api/download/{filename}": "下载指定的输出文件",
+    "GET /api/latest-file": "获取最新的输出文件"
+}
+
+app = FastAPI(
+    title="考勤分析系统 API",
+    description="提供考勤分析脚本调用功能",
+    version="1.0.0"
+)
+app.add_middleware(SelectiveGZipMiddleware, **GZIP_OPTIONS)
+app.include_router(router)
+
 @app.get("/")
 async def root():
     """根路径，返回API信息"""
     return {
         "message": "考勤分析系统 API",
         "version": "1.0.0",
-        "endpoints": {
-            "POST /api/run-script": "启动考勤分析脚本（同步执行，等待完成）",
-            "POST /api/run-script-async": "启动考勤分析脚本（异步执行，后台运行）",
-            "GET /api/script-status": "获取脚本执行状态",
-            "GET /api/files": "获取所有输出文件列表",
-            "GET /api/download/{filename}": "下载指定的输出文件",
-            "GET /api/latest-file": "获取最新的输出文件"
-        }
+        "endpoints": ENDPOINTS
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+"""
+员工维度
+导入基础考勤数据时为每位员工分配整数 员工ID（按 UserId 识别，缺失时依次使用 工号、姓名），
+并把姓名及其变体（去掉 / 加上 CDTL 等后缀）登记到别名表。
+审批记录先按别名解析为 员工ID，再与考勤结果按 员工ID 关联，不再逐条按姓名扫描考勤结果
+"""
+
+import bisect
+import itertools
+import sys
+
+from psycopg2 import sql
+
+from bulk_load import bulk_insert
+
+# 考勤结果中的员工键字段
+EMPLOYEE_KEY = '员工ID'
+
+# 审批系统中姓名可能带有的后缀
+NAME_SUFFIXES = ('CDTL',)
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def _text(value):
+    """空值统一为空字符串"""
+    if value is None or value != value:
+        return ''
+    return str(value).strip()
+
+def normalize_name(name):
+    """去掉首尾空白及 CDTL 等后缀"""
+    name = _text(name)
+    for suffix in NAME_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def name_aliases(name):
+    """姓名的全部别名：原姓名、规范化姓名及其加后缀的形式"""
+    base = normalize_name(name)
+    if not base:
+        return set()
+    return {_text(name), base} | {base + suffix for suffix in NAME_SUFFIXES}
+
+def natural_key(name, job_number, user_id):
+    """员工的业务键：优先 UserId，其次 工号，最后 姓名"""
+    for field, value in (('UserId', user_id), ('工号', job_number), ('姓名', name)):
+        value = _text(value)
+        if value:
+            return field, value
+    return None
+
+def create_employee_tables(conn):
+    """重建员工表和别名表"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DROP TABLE IF EXISTS employee_alias")
+        cursor.execute("DROP TABLE IF EXISTS employee")
+        cursor.execute("""
+            CREATE TABLE employee (
+                "员工ID" INTEGER PRIMARY KEY,
+                姓名 TEXT,
+                工号 TEXT,
+                "UserId" TEXT
+            )
+        """)
+        # 主键 (别名, 员工ID) 同时作为按别名查找的索引
+        cursor.execute("""
+            CREATE TABLE employee_alias (
+                别名 TEXT NOT NULL,
+                "员工ID" INTEGER NOT NULL REFERENCES employee ("员工ID"),
+                PRIMARY KEY (别名, "员工ID")
+            )
+        """)
+        conn.commit()
+        flush_print("✅ 员工表创建成功")
+    except Exception as e:
+        flush_print(f"❌ 创建员工表失败: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def assign_employee_ids(df, registry):
+    """
+    为 DataFrame 的每行分配 员工ID，业务键相同的行使用同一个 员工ID
+
+    参数:
+        df (pd.DataFrame): 含 姓名、工号、UserId 字段的数据
+        registry (dict): {业务键: 员工ID}，新员工会被登记进去
+
+    返回:
+        tuple: (每行的 员工ID 列表, 新登记的员工 [(员工ID, 姓名, 工号, UserId)])
+    """
+    ids = []
+    new_employees = []
+    for name, job_number, user_id in df[['姓名', '工号', 'UserId']].itertuples(index=False, name=None):
+        key = natural_key(name, job_number, user_id)
+        employee_id = registry.get(key)
+        if employee_id is None:
+            employee_id = len(registry) + 1
+            registry[key] = employee_id
+            new_employees.append((employee_id, _text(name), _text(job_number), _text(user_id)))
+        ids.append(employee_id)
+    return ids, new_employees
+
+def save_employees(conn, new_employees):
+    """写入新登记的员工及其姓名别名"""
+    if not new_employees:
+        return
+    bulk_insert(conn, 'employee', ['员工ID', '姓名', '工号', 'UserId'], new_employees)
+    bulk_insert(conn, 'employee_alias', ['别名', '员工ID'], (
+        (alias, employee_id)
+        for employee_id, name, _, _ in new_employees
+        for alias in sorted(name_aliases(name))
+    ))
+
+def load_registry(cursor):
+    """从员工表读取 {业务键: 员工ID}"""
+    cursor.execute('SELECT "员工ID", 姓名, 工号, "UserId" FROM employee')
+    return {natural_key(name, job_number, user_id): employee_id
+            for employee_id, name, job_number, user_id in cursor.fetchall()}
+
+class AliasIndex:
+    """
+    姓名别名索引: {别名: [员工ID]} 加上排好序的别名列表，
+    精确匹配为字典查找，前缀匹配为有序列表上的区间查找
+    """
+
+    def __init__(self, rows):
+        self.aliases = {}
+        for alias, employee_id in rows:
+            self.aliases.setdefault(alias, []).append(employee_id)
+        self.sorted_aliases = sorted(self.aliases)
+
+    def resolve(self, name, prefix=False):
+        """
+        把审批记录中的姓名解析为 员工ID 列表，找不到时返回空列表
+
+        参数:
+            name (str): 审批记录中的姓名（可带 CDTL 等后缀）
+            prefix (bool): 是否按姓名前缀匹配（如 "张三" 匹配 "张三（离职）"）
+        """
+        name = normalize_name(name)
+        if not name:
+            return []
+        if not prefix:
+            return list(self.aliases.get(name, []))
+
+        matched = []
+        start = bisect.bisect_left(self.sorted_aliases, name)
+        for alias in itertools.islice(self.sorted_aliases, start, None):
+            if not alias.startswith(name):
+                break
+            matched.extend(i for i in self.aliases[alias] if i not in matched)
+        return sorted(matched)
+
+def load_aliases(cursor):
+    """读取别名表，返回 AliasIndex"""
+    cursor.execute('SELECT 别名, "员工ID" FROM employee_alias ORDER BY "员工ID"')
+    return AliasIndex(cursor.fetchall())
+
+def load_names(cursor, employee_ids):
+    """读取 {员工ID: 姓名}"""
+    employee_ids = list(employee_ids)
+    if not employee_ids:
+        return {}
+    cursor.execute(sql.SQL('SELECT "员工ID", 姓名 FROM employee WHERE "员工ID" IN ({})').format(
+        sql.SQL(', ').join(sql.Placeholder() * len(employee_ids))
+    ), employee_ids)
+    return dict(cursor.fetchall())
+
+def create_result_indexes(conn):
+    """考勤结果表按 员工ID 和 姓名 建立索引"""
+    cursor = conn.cursor()
+    try:
+        for column in (EMPLOYEE_KEY, '姓名'):
+            cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON attendance_result ({})").format(
+                sql.Identifier(f"attendance_result_{column}_idx"), sql.Identifier(column)
+            ))
+        cursor.execute("ANALYZE attendance_result")
+        conn.commit()
+    finally:
+        cursor.close()
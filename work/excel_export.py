@@ -0,0 +1,88 @@
+"""
+流式 Excel 导出
+使用 openpyxl 只写模式逐行写出工作表：表头和数据区域各使用一个登记在工作簿中的命名样式（字体、填充、边框、对齐），
+列宽、冻结窗格在写入数据前设置，内存占用与行数无关
+"""
+
+import math
+from copy import copy
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+
+HEADER_STYLE = 'attendance_header'
+DATA_STYLE = 'attendance_data'
+
+def _thin_border():
+    side = Side(style='thin')
+    return Border(left=side, right=side, top=side, bottom=side)
+
+def build_styles():
+    """返回 (表头样式, 数据样式)，使用前需用 Workbook.add_named_style 登记到工作簿"""
+    header = NamedStyle(name=HEADER_STYLE)
+    header.font = Font(name='微软雅黑', bold=True, size=11, color='000000')
+    header.fill = PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid')
+    header.border = _thin_border()
+    header.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+
+    data = NamedStyle(name=DATA_STYLE)
+    data.font = copy(DEFAULT_FONT)
+    data.border = _thin_border()
+    data.alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
+    return header, data
+
+def _cell_value(value):
+    """空值写为空单元格，numpy 数值转换为 Python 数值"""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        return None if math.isnan(value) else float(value)
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def write_sheet(output_file, df, sheet_name, column_widths=None, freeze_panes='B2'):
+    """
+    以只写模式导出 DataFrame
+
+    参数:
+        output_file (str): 输出文件路径
+        df (pd.DataFrame): 要导出的数据，列名作为表头
+        sheet_name (str): 工作表名称
+        column_widths (dict): {列序号(从1开始): 列宽}
+        freeze_panes (str): 冻结窗格位置
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    # 只写模式下列宽和冻结窗格必须在写入第一行之前设置
+    for col_num, width in (column_widths or {}).items():
+        worksheet.column_dimensions[get_column_letter(col_num)].width = width
+    worksheet.freeze_panes = freeze_panes
+
+    # 每列一个设置好样式的单元格，样式只设置一次（逐格设置时每次都要在工作簿的样式表中查找）；
+    # 只写模式下 append 时整行立即写出，之后各行复用这些单元格，只替换值
+    def styled_cells(style):
+        cells = []
+        for _ in df.columns:
+            cell = WriteOnlyCell(worksheet)
+            cell.style = style.name
+            cells.append(cell)
+        return cells
+
+    def append_row(cells, values):
+        for cell, value in zip(cells, values):
+            cell.value = _cell_value(value)
+        worksheet.append(cells)
+
+    header_style, data_style = build_styles()
+    workbook.add_named_style(header_style)
+    workbook.add_named_style(data_style)
+    append_row(styled_cells(header_style), df.columns)
+    data_cells = styled_cells(data_style)
+    for values in df.itertuples(index=False, name=None):
+        append_row(data_cells, values)
+
+    workbook.save(output_file)
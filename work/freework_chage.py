@@ -1,21 +1,13 @@
-import psycopg2
-from datetime import datetime
-from psycopg2 import sql
-from config import DB_CONFIG
-
-
-def get_db_connection():
-    """创建数据库连接"""
-    return psycopg2.connect(**DB_CONFIG)
+import db
+from attendance_merge import expand_days, load_day_cells, write_day_cells
+import day_status
+import employees
 
 def get_freework_records(cursor):
-    """获取所有请假记录，并处理特殊姓名标识"""
+    """获取所有请假记录（带 CDTL 等后缀的姓名由员工别名表解析）"""
     query = """
     SELECT 
-        CASE 
-            WHEN 姓名 LIKE '%CDTL' THEN LEFT(姓名, LENGTH(姓名)-4)
-            ELSE 姓名
-        END as 姓名,
+        姓名,
         开始时间, 
         结束时间, 
         请假说明, 
@@ -26,77 +18,102 @@ def get_freework_records(cursor):
     cursor.execute(query)
     return cursor.fetchall()
 
-def update_attendance_record(cursor, name, start_date, end_date, leave_reason, duration, source):
-    """更新指定日期范围内的考勤记录，将请假信息追加到现有记录后"""
-    try:
-        # 将日期字符串转换为datetime对象
-        start_date = datetime.strptime(start_date.split()[0], '%Y-%m-%d')
-        end_date = datetime.strptime(end_date.split()[0], '%Y-%m-%d')
+def merge_freework_records(freework_records, cells, aliases):
+    """
+    在内存中把请假记录展开为 (员工ID, 第N天) 单元格，请假信息追加到现有记录之后
+    
+    参数:
+        freework_records (list): 请假记录
+        cells (dict): {员工ID: {'第N天': 值}}，合并过程中会被原地更新
+        aliases (employees.AliasIndex): 员工别名索引
+    
+    返回:
+        dict: {(员工ID, '第N天'): 新值}
+    """
+    changes = {}
+    for name, start_time, end_time, leave_reason, duration, source in freework_records:
+        print(f"正在处理 {name} 的请假记录: {start_time} -> {end_time}")
+        
+        try:
+            days = expand_days(start_time, end_time)
+        except Exception as e:
+            print(f"❌ 处理失败: 处理 {name} 的请假记录时出错: {e}")
+            continue
         
-        # 获取需要更新的列名（第X天）
-        start_day = int(start_date.strftime('%d'))
-        end_day = int(end_date.strftime('%d'))
+        # 按别名索引解析 员工ID：去掉 CDTL 后缀后按姓名前缀匹配（与原先的 姓名 LIKE name || '%' 一致）
+        matched = [i for i in aliases.resolve(name, prefix=True) if i in cells]
+        if not matched:
+            print(f"警告: 未找到员工 {name} 的记录")
+            continue
         
-        # 构建更新语句并追加更新
-        for day in range(start_day, end_day + 1):
+        # 生成请假信息
+        leave_info = f"\n{source}请假({duration})({leave_reason})"
+        
+        for day in days:
             column_name = f'第{day}天'
-            
-            # 修改查询语句，使用 LIKE 进行模糊匹配
-            check_query = sql.SQL("""
-                SELECT {} FROM attendance_result 
-                WHERE 姓名 LIKE %s || '%%'
-            """).format(sql.Identifier(column_name))
-            
-            cursor.execute(check_query, (name,))
-            result = cursor.fetchone()
-            
-            if not result:
-                print(f"警告: 未找到员工 {name} 的记录")
-                continue
+            for employee_id in matched:
+                current_value = cells[employee_id][column_name]
                 
-            current_value = result[0]
-            
-            # 生成请假信息
-            leave_info = f"\n{source}请假({duration})({leave_reason})"
-            
-            # 如果当前值存在，则追加；否则直接设置（移除开头的换行符）
-            if current_value and current_value.strip():
-                new_value = f"{current_value}{leave_info}"
-            else:
-                new_value = leave_info.lstrip('\n')
-            
-            # 更新记录时也使用模糊匹配
-            update_query = sql.SQL("""
-                UPDATE attendance_result 
-                SET {} = %s
-                WHERE 姓名 LIKE %s || '%%'
-            """).format(sql.Identifier(column_name))
-            
-            cursor.execute(update_query, (new_value, name))
-            
-    except Exception as e:
-        print(f"处理 {name} 的请假记录时出错: {e}")
-        raise e
+                # 如果当前值存在，则追加；否则直接设置（移除开头的换行符）
+                if current_value and current_value.strip():
+                    new_value = f"{current_value}{leave_info}"
+                else:
+                    new_value = leave_info.lstrip('\n')
+                
+                cells[employee_id][column_name] = new_value
+                changes[(employee_id, column_name)] = new_value
+    return changes
+
+def apply_freework_to_matrix(freework_records, matrix, aliases):
+    """
+    在考勤状态矩阵上合并请假记录，规则与 merge_freework_records 一致
+    
+    返回:
+        set: 被修改的 {(员工ID, '第N天')}
+    """
+    touched = set()
+    for name, start_time, end_time, leave_reason, duration, source in freework_records:
+        print(f"正在处理 {name} 的请假记录: {start_time} -> {end_time}")
+        
+        try:
+            days = expand_days(start_time, end_time)
+        except Exception as e:
+            print(f"❌ 处理失败: 处理 {name} 的请假记录时出错: {e}")
+            continue
+        
+        matched = [i for i in aliases.resolve(name, prefix=True) if i in matrix]
+        if not matched:
+            print(f"警告: 未找到员工 {name} 的记录")
+            continue
+        
+        for day in days:
+            for employee_id in matched:
+                touched.add(matrix.add_leave(employee_id, day, source, duration, leave_reason))
+    return touched
 
 def main():
-    conn = get_db_connection()
+    conn = db.get_connection()
     cursor = conn.cursor()
     
     try:
         # 获取所有请假记录
         freework_records = get_freework_records(cursor)
         print(f"✅ 获取到 {len(freework_records)} 条请假记录")
+        aliases = employees.load_aliases(cursor)
+        
+        matrix = day_status.current()
+        if matrix is not None:
+            # 流水线中直接在考勤状态矩阵上合并，只为变化的单元格生成文本
+            touched = apply_freework_to_matrix(freework_records, matrix, aliases)
+            changes = matrix.render_cells(touched)
+        else:
+            # 一次性读取涉及员工的考勤单元格，在内存中合并
+            employee_ids = {i for record in freework_records for i in aliases.resolve(record[0], prefix=True)}
+            cells = load_day_cells(cursor, employee_ids)
+            changes = merge_freework_records(freework_records, cells, aliases)
         
-        # 处理每条请假记录
-        for record in freework_records:
-            name, start_time, end_time, reason, duration, source = record
-            print(f"正在处理 {name} 的请假记录: {start_time} -> {end_time}")
-            
-            try:
-                update_attendance_record(cursor, name, start_time, end_time, reason, duration, source)
-            except Exception as e:
-                print(f"❌ 处理失败: {e}")
-                continue
+        # 一次性写回所有变化的单元格
+        write_day_cells(conn, changes)
         
         # 提交事务
         conn.commit()
@@ -105,6 +122,7 @@ def main():
     except Exception as e:
         print(f"❌ 程序执行出错: {e}")
         conn.rollback()
+        raise
     finally:
         cursor.close()
         conn.close()
@@ -1,11 +1,19 @@
 import pandas as pd
 from datetime import datetime
-import psycopg2
+import db
 from psycopg2 import sql
+from bulk_load import bulk_insert
+import ingest_cache
 
-def process_feishu_data():
+# 源数据文件
+FEISHU_FILE = '../data/original/freework01.xlsx'
+DINGDING_FILE = '../data/original/freework02.xlsx'
+
+# 批量模式下主进程按月拆分好的合并记录（以飞书文件登记预解析结果）
+MONTH_PARTITION = 'freework_combine.month'
+
+def parse_feishu_data(file_path=FEISHU_FILE):
     # 处理飞书数据
-    file_path = '../data/original/freework01.xlsx'
     df = pd.read_excel(file_path, skiprows=1)
     
     # 打印列名，用于调试
@@ -37,11 +45,12 @@ def process_feishu_data():
     
     # 添加数据来源标识
     result_df['数据来源'] = '飞书'
+    # 审批单编号（一张审批单可能有多条明细）
+    result_df['审批编号'] = df['申请编号'].astype(str)
     return result_df
 
-def process_dingding_data():
+def parse_dingding_data(file_path=DINGDING_FILE):
     # 处理钉钉数据
-    file_path = '../data/original/freework02.xlsx'
     df = pd.read_excel(file_path)
     
     
@@ -74,20 +83,24 @@ def process_dingding_data():
     
     # 添加数据来源标识
     result_df['数据来源'] = '钉钉'
+    # 审批单编号（一张审批单可能有多条明细）
+    result_df['审批编号'] = df['审批编号'].astype(str)
     return result_df
 
+def process_feishu_data(file_path=FEISHU_FILE):
+    """读取飞书请假数据，源文件未变化时直接使用解析缓存"""
+    return ingest_cache.load_or_parse(file_path, 'freework_combine.feishu', None, parse_feishu_data, file_path)
+
+def process_dingding_data(file_path=DINGDING_FILE):
+    """读取钉钉请假数据，源文件未变化时直接使用解析缓存"""
+    return ingest_cache.load_or_parse(file_path, 'freework_combine.dingding', None, parse_dingding_data, file_path)
+
 def save_to_database(df):
     """
     将数据保存到PostgreSQL数据库
     """
     # 连接PostgreSQL数据库
-    conn = psycopg2.connect(
-        host="192.168.1.66",
-        port="7432",
-        database="dingding",
-        user="root",
-        password="123456"
-    )
+    conn = db.get_connection()
     cur = conn.cursor()
     
     try:
@@ -107,12 +120,13 @@ def save_to_database(df):
         # 更新DataFrame的列名
         df.columns = cleaned_field_names
         
-        # 先删除已存在的表
-        cur.execute("DROP TABLE IF EXISTS freework")
-        conn.commit()
+        # 先写入新表，写完后再替换旧表，读者不会遇到表不存在
+        stage = db.staging_table('freework')
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(stage)))
         
         # 创建新表
-        create_table_query = sql.SQL("CREATE TABLE freework ({})").format(
+        create_table_query = sql.SQL("CREATE TABLE {} ({})").format(
+            sql.Identifier(stage),
             sql.SQL(', ').join(
                 sql.SQL("{} TEXT").format(sql.Identifier(col))
                 for col in cleaned_field_names
@@ -120,33 +134,27 @@ def save_to_database(df):
         )
         cur.execute(create_table_query)
         
-        # 构建INSERT语句
-        insert_query = sql.SQL("INSERT INTO freework ({}) VALUES ({})").format(
-            sql.SQL(', ').join(map(sql.Identifier, cleaned_field_names)),
-            sql.SQL(', ').join(sql.Placeholder() * len(cleaned_field_names))
-        )
-        
-        # 插入数据
-        for _, row in df.iterrows():
-            values = [str(val) if pd.notna(val) else None for val in row]
-            cur.execute(insert_query, values)
+        # 批量写入数据
+        bulk_insert(conn, stage, cleaned_field_names, df)
         
+        db.swap_table(cur, 'freework')
         conn.commit()
         print("数据已成功导入PostgreSQL数据库的freework表")
         
     except Exception as e:
         print(f"数据库操作出错: {e}")
         conn.rollback()
+        raise
         
     finally:
         cur.close()
         conn.close()
 
-def main():
-    print("🔄 开始执行自由工作数据合并处理...")
-    
-    # 导入月份配置
-    from holidays import MONTH
+def merge_sources():
+    """合并两个数据源的请假记录并计算处理日期（不筛选月份）"""
+    partition = ingest_cache.preloaded(FEISHU_FILE, MONTH_PARTITION)
+    if partition is not None:
+        return partition
     
     print("📁 正在处理飞书数据...")
     # 处理两个数据源
@@ -162,10 +170,18 @@ def main():
     print("📅 正在处理日期格式...")
     # 将日期时间字符串转换为datetime对象进行筛选
     combined_df['处理日期'] = combined_df['开始时间'].apply(lambda x: pd.to_datetime(x.split()[0] if pd.notna(x) else None))
+    return combined_df
+
+def load_combined_data():
+    """合并两个数据源的请假记录，筛选指定月份并排序"""
+    # 导入月份配置
+    from holidays import MONTH, YEAR
+    
+    combined_df = merge_sources()
     
     print(f"📊 正在筛选{MONTH}月份数据...")
     # 筛选指定月份的数据
-    combined_df = combined_df[combined_df['处理日期'].dt.strftime('%m') == MONTH]
+    combined_df = combined_df[combined_df['处理日期'].dt.strftime('%Y-%m') == f"{YEAR}-{MONTH}"]
     
     # 删除临时列
     combined_df = combined_df.drop('处理日期', axis=1)
@@ -173,6 +189,11 @@ def main():
     print("📋 正在排序数据...")
     # 按姓名和开始时间排序
     combined_df = combined_df.sort_values(by=['姓名', '开始时间'])
+    return combined_df
+
+def main():
+    print("🔄 开始执行自由工作数据合并处理...")
+    combined_df = load_combined_data()
     
     print("💾 正在保存到数据库...")
     # 保存到数据库
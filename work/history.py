@@ -0,0 +1,339 @@
+"""
+考勤历史库
+basic、business、attendance_result 等工作表每次运行都会重建，只保存当前月份的文本结果；
+历史库长期保存带类型的数据：每条审批明细一行（approval），每位员工每天一行（attendance_day），
+按 日期 所在月份分区，以主键 upsert 写入。重跑某个月份只替换该月分区中有变化的行，
+读者始终能查到其他月份和本月上一次的结果。
+
+Postgres 中为 config.HISTORY_SCHEMA 下按 日期 范围分区的表（每月一个分区）；
+本地 SQLite 中为附加的 HISTORY_SQLITE_PATH 数据库，主键以 日期 开头，按月的读写是主键上的区间查找
+"""
+
+import calendar
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from psycopg2 import sql
+
+import config
+import db
+import day_status
+import employees
+from bulk_load import bulk_insert
+from holidays import REST_DAYS, MONTH, YEAR
+
+# 表结构: {表名: ([(列名, 类型)], 主键)}，主键以分区键 日期 开头
+TABLES = {
+    "approval": ([
+        ("日期", "DATE NOT NULL"),          # 开始日期
+        ("姓名", "TEXT NOT NULL"),
+        ("数据来源", "TEXT NOT NULL"),
+        ("审批编号", "TEXT NOT NULL"),
+        ("序号", "SMALLINT NOT NULL"),      # 同一审批单中的第几条明细
+        ("类型", "TEXT NOT NULL"),
+        ("开始时间", "TIMESTAMP"),
+        ("结束时间", "TIMESTAMP"),
+        ("时长", "NUMERIC(8, 2)"),
+        ("单位", "TEXT"),
+        ("说明", "TEXT"),
+    ], ("日期", "姓名", "数据来源", "审批编号", "序号")),
+    "attendance_day": ([
+        ("日期", "DATE NOT NULL"),
+        ("员工键", "TEXT NOT NULL"),        # UserId / 工号 / 姓名，见 employees.natural_key
+        ("姓名", "TEXT"),
+        ("考勤组", "TEXT"),
+        ("部门", "TEXT"),
+        ("休息日", "BOOLEAN NOT NULL"),
+        ("状态", "TEXT"),
+        ("状态位", "SMALLINT"),             # day_status 的 FLAG_*
+        ("首次打卡", "TIME"),
+        ("末次打卡", "TIME"),
+        ("加班时长", "NUMERIC(6, 2)"),
+        ("请假天数", "NUMERIC(5, 2)"),
+    ], ("日期", "员工键")),
+}
+
+# 只有状态文本可用时（增量重算、单独运行阶段）写入的列，已有行的结构化列保持不变
+TEXT_COLUMNS = ("姓名", "考勤组", "部门", "休息日", "状态")
+
+# 审批工作表: (表名, 类型, 默认单位)，列顺序为 姓名、开始时间、结束时间、时长、说明、申请状态、数据来源、审批编号
+APPROVAL_TABLES = [
+    ("business", "出差", "天"),
+    ("freework", "请假", "天"),
+    ("overwork", "加班", "小时"),
+]
+
+# 上午 / 下午 的起止时刻: 半天区间 [00:00, 12:00) / [12:00, 24:00)
+HALF_DAYS = {
+    "上午": (timedelta(0), timedelta(hours=12)),
+    "下午": (timedelta(hours=12), timedelta(days=1)),
+}
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def month_bounds(year, month):
+    """月份的日期区间 [第一天, 下月第一天)"""
+    first = date(year, month, 1)
+    return first, first + timedelta(days=calendar.monthrange(year, month)[1])
+
+def parse_moment(text, end=False):
+    """
+    把审批记录中的时间解析为 datetime，无法识别时返回 None
+
+    支持 '2025-06-03 08:30'、'2025-05-15'（整天）和 '2025-05-09 上午'（半天），
+    整天和半天按区间取起点（end=False）或终点（end=True）
+    """
+    parts = str(text).split()
+    try:
+        day = datetime.strptime(parts[0], "%Y-%m-%d")
+        if len(parts) == 1:
+            return day + timedelta(days=1) if end else day
+        if parts[1] in HALF_DAYS:
+            return day + HALF_DAYS[parts[1]][end]
+        return datetime.fromisoformat(f"{parts[0]} {parts[1]}")
+    except (ValueError, IndexError):
+        return None
+
+def parse_duration(value, default_unit):
+    """'1.0天' / '5小时' / 3.0 → (数值, 单位)，无法识别时返回 (None, None)"""
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*(小时|天)?", str(value))
+    if not match:
+        return None, None
+    return round(float(match.group(1)), 2), match.group(2) or default_unit
+
+def _text(value):
+    return None if value is None or value != value or value == '' else str(value)
+
+def approval_frame(cursor):
+    """读取三个审批工作表并转换为带类型的审批明细"""
+    records = []
+    for table, kind, default_unit in APPROVAL_TABLES:
+        if not db.table_exists(cursor, table):
+            flush_print(f"⚠️ 数据库中没有 {table} 表，跳过")
+            continue
+        cursor.execute(sql.SQL("SELECT * FROM {}").format(sql.Identifier(table)))
+        sequence = {}
+        for row in cursor.fetchall():
+            name, start_text, end_text, duration, note, _, source, approval_id = row[:8]
+            start = parse_moment(start_text)
+            if not name or start is None:
+                flush_print(f"⚠️ 无法解析 {name} 的{kind}记录日期: {start_text}")
+                continue
+            approval_id = _text(approval_id) or ''
+            key = (source, approval_id)
+            sequence[key] = sequence.get(key, 0) + 1
+            value, unit = parse_duration(duration, default_unit)
+            end = parse_moment(end_text, end=True)
+            records.append((
+                start.date().isoformat(), name, source or '', approval_id, sequence[key], kind,
+                start.isoformat(sep=' '), end.isoformat(sep=' ') if end else None, value, unit, _text(note),
+            ))
+    return pd.DataFrame(records, columns=[name for name, _ in TABLES["approval"][0]])
+
+def _minutes_to_time(minutes):
+    """首末次打卡分钟数 → 'HH:MM'，-1（无打卡）为空"""
+    return np.where(
+        minutes >= 0,
+        np.char.add(np.char.add(np.char.zfill((minutes // 60).astype(str), 2), ':'),
+                    np.char.zfill((minutes % 60).astype(str), 2)),
+        None,
+    )
+
+def attendance_day_frame(cursor, year, month):
+    """
+    每位员工每天一行的考勤结果：流水线中有考勤状态矩阵时带上状态位、打卡时间、加班和请假时长，
+    否则（增量重算、单独运行）只有考勤结果表中的状态文本
+
+    返回:
+        tuple: (DataFrame, 是否包含结构化的列)
+    """
+    matrix = day_status.current()
+    if matrix is not None:
+        employees_df = matrix.employees
+        texts = matrix.render()
+    else:
+        cursor.execute(f'SELECT * FROM attendance_result ORDER BY "{employees.EMPLOYEE_KEY}"')
+        columns = [desc[0] for desc in cursor.description]
+        employees_df = pd.DataFrame(cursor.fetchall(), columns=columns)
+        texts = employees_df[day_status.DAY_FIELDS].to_numpy(dtype=object)
+
+    # 同一员工有多条记录时以第一条为准（与按 员工ID 更新考勤结果一致）
+    keys = [
+        "{}:{}".format(*(employees.natural_key(name, job_number, user_id) or ('姓名', name)))
+        for name, job_number, user_id in employees_df[['姓名', '工号', 'UserId']].itertuples(index=False, name=None)
+    ]
+    first_rows = {}
+    for i, key in enumerate(keys):
+        first_rows.setdefault(key, i)
+    rows = np.fromiter(first_rows.values(), dtype=np.int64)
+    n_days = min(texts.shape[1], calendar.monthrange(year, month)[1])
+    days = np.arange(n_days)
+
+    row_index = np.repeat(rows, n_days)
+    day_index = np.tile(days, len(rows))
+    first_day, _ = month_bounds(year, month)
+    frame = pd.DataFrame({
+        "日期": [(first_day + timedelta(days=int(d))).isoformat() for d in days] * len(rows),
+        "员工键": np.array(keys, dtype=object)[row_index],
+        "姓名": employees_df['姓名'].to_numpy(dtype=object)[row_index],
+        "考勤组": employees_df['考勤组'].to_numpy(dtype=object)[row_index],
+        "部门": employees_df['部门'].to_numpy(dtype=object)[row_index],
+        "休息日": np.tile(REST_DAYS[np.asarray(days) + 1].astype(np.int8), len(rows)),
+        "状态": texts[row_index, day_index],
+    })
+    if matrix is None:
+        for column in ("状态位", "首次打卡", "末次打卡", "加班时长", "请假天数"):
+            frame[column] = None
+        return frame, False
+
+    frame["状态位"] = matrix.flags[row_index, day_index].astype(np.int16)
+    frame["首次打卡"] = _minutes_to_time(matrix.first[row_index, day_index].astype(np.int64))
+    frame["末次打卡"] = _minutes_to_time(matrix.last[row_index, day_index].astype(np.int64))
+    frame["加班时长"] = matrix.overtime.sum(axis=2)[row_index, day_index].astype(float).round(2)
+    frame["请假天数"] = matrix.leave_days[row_index, day_index].astype(float).round(2)
+    return frame, True
+
+def _target(conn, table, year, month):
+    """写入目标：Postgres 为该月分区，SQLite 为整张表（按连接判断，发布时本地运行也写入 Postgres 的分区）"""
+    if getattr(conn, 'backend', 'postgres') == 'sqlite':
+        return table
+    return f"{table}_{year}{month:02d}"
+
+def create_tables(conn, months):
+    """建立历史库的表及各月份的分区（已存在时保持不变）"""
+    schema = config.HISTORY_SCHEMA
+    embedded = getattr(conn, 'backend', 'postgres') == 'sqlite'
+    cursor = conn.cursor()
+    try:
+        if not embedded:
+            cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(schema)))
+        for table, (columns, key) in TABLES.items():
+            cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} ({}, PRIMARY KEY ({})){}").format(
+                sql.Identifier(schema, table),
+                sql.SQL(', ').join(sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(column_type))
+                                   for name, column_type in columns),
+                sql.SQL(', ').join(map(sql.Identifier, key)),
+                sql.SQL("") if embedded else sql.SQL(" PARTITION BY RANGE ({})").format(sql.Identifier(key[0])),
+            ))
+            if embedded:
+                continue
+            for year, month in months:
+                first, last = month_bounds(year, month)
+                cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)").format(
+                    sql.Identifier(schema, f"{table}_{year}{month:02d}"), sql.Identifier(schema, table),
+                ), (first.isoformat(), last.isoformat()))
+    finally:
+        cursor.close()
+
+def replace_month(conn, table, frame, year, month, update_columns=None):
+    """
+    用 frame 替换历史表中该月份的数据：按主键 upsert（值未变化的行不更新），
+    再删除该月份中不在 frame 里的行
+
+    参数:
+        update_columns (tuple): 已有行要更新（并据此判断是否变化）的列，默认为全部非主键列；
+            其余列只在插入新行时写入
+
+    返回:
+        tuple: (写入或更新的行数, 删除的行数)
+    """
+    columns, key = TABLES[table]
+    names = [name for name, _ in columns]
+    values = [name for name in names if name not in key]
+    update_columns = update_columns or values
+    target_name = _target(conn, table, year, month)
+    target = sql.Identifier(config.HISTORY_SCHEMA, target_name)
+    stage = sql.Identifier(f"history_stage_{table}")
+    first, last = month_bounds(year, month)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(stage))
+        # 临时表带与目标表相同的主键，upsert 和删除时按主键查找 frame 中的行
+        cursor.execute(sql.SQL("CREATE TEMP TABLE {} ({}, PRIMARY KEY ({}))").format(
+            stage,
+            sql.SQL(', ').join(sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(column_type.replace(" NOT NULL", "")))
+                               for name, column_type in columns),
+            sql.SQL(', ').join(map(sql.Identifier, key)),
+        ))
+        bulk_insert(conn, f"history_stage_{table}", names, frame, missing_strings=True)
+
+        # WHERE true: SQLite 中 INSERT … SELECT 后接 ON CONFLICT 时需要
+        cursor.execute(sql.SQL(
+            "INSERT INTO {target} ({names}) SELECT {names} FROM {stage} WHERE true "
+            "ON CONFLICT ({key}) DO UPDATE SET {updates} WHERE {changed}"
+        ).format(
+            target=target,
+            names=sql.SQL(', ').join(map(sql.Identifier, names)),
+            stage=stage,
+            key=sql.SQL(', ').join(map(sql.Identifier, key)),
+            updates=sql.SQL(', ').join(
+                sql.SQL("{0} = excluded.{0}").format(sql.Identifier(name)) for name in update_columns
+            ),
+            changed=sql.SQL(' OR ').join(
+                sql.SQL("{}.{} IS DISTINCT FROM excluded.{}").format(
+                    sql.Identifier(target_name), sql.Identifier(name), sql.Identifier(name))
+                for name in update_columns
+            ),
+        ))
+        upserted = cursor.rowcount
+
+        cursor.execute(sql.SQL(
+            "DELETE FROM {target} WHERE {date} >= %s AND {date} < %s "
+            "AND NOT EXISTS (SELECT 1 FROM {stage} s WHERE {match})"
+        ).format(
+            target=target,
+            date=sql.Identifier(key[0]),
+            stage=stage,
+            match=sql.SQL(' AND ').join(
+                sql.SQL("s.{0} = {1}.{0}").format(sql.Identifier(name), sql.Identifier(target_name))
+                for name in key
+            ),
+        ), (first.isoformat(), last.isoformat()))
+        deleted = cursor.rowcount
+        cursor.execute(sql.SQL("DROP TABLE {}").format(stage))
+        return upserted, deleted
+    finally:
+        cursor.close()
+
+def main():
+    year, month = int(YEAR), int(MONTH)
+    label = f"{year}-{month:02d}"
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    try:
+        create_tables(conn, [(year, month)])
+
+        approvals = approval_frame(cursor)
+        first, last = month_bounds(year, month)
+        outside = (approvals["日期"] < first.isoformat()) | (approvals["日期"] >= last.isoformat())
+        if outside.any():
+            flush_print(f"⚠️ {int(outside.sum())} 条审批明细不在 {label}，不写入历史库")
+            approvals = approvals[~outside]
+        upserted, deleted = replace_month(conn, "approval", approvals, year, month)
+        flush_print(f"📚 approval {label}: {len(approvals)} 条明细，写入/更新 {upserted} 行，删除 {deleted} 行")
+
+        days, structured = attendance_day_frame(cursor, year, month)
+        upserted, deleted = replace_month(conn, "attendance_day", days, year, month,
+                                          None if structured else TEXT_COLUMNS)
+        flush_print(f"📚 attendance_day {label}: {len(days)} 行，写入/更新 {upserted} 行，删除 {deleted} 行"
+                    + ("" if structured else "（只有状态文本）"))
+        conn.commit()
+        flush_print("✅ 历史库写入完成")
+    except Exception as e:
+        flush_print(f"❌ 写入历史库失败: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
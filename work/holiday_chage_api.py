@@ -1,48 +1,56 @@
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI, HTTPException
 from pydantic import BaseModel
-import re
-import os
 
-app = FastAPI()
+import work_calendar
+
+# 休息日配置接口路由，由本模块的 app 和 service.py 的合并服务共同挂载
+router = APIRouter()
 
 class ConfigUpdate(BaseModel):
     holidays: list[str]  # 休息日列表，如 ["01", "05"]
     month: int           # 月份，如 6 (注意现在是整数类型)
     year: int            # 年份，如 2025
 
-@app.post("/update_config")
+@router.post("/update_config")
 def update_config(request: ConfigUpdate):
-    file_path = "holidays.py"
-    
-    # 读取原文件
-    with open(file_path, "r", encoding="utf-8") as f:
-        content = f.read()
-    
-    # 更新HOLIDAYS部分（保留原格式）
-    new_holidays = 'HOLIDAYS = [\n' + \
-                   ',\n'.join(f'    "{day}"' for day in request.holidays) + \
-                   '\n]'
-    content = re.sub(r'HOLIDAYS\s*=\s*\[[\s\S]*?\]', new_holidays, content)
-    
-    # 更新MONTH（匹配字符串格式，如 '05'）
-    content = re.sub(r"MONTH\s*=\s*'?\d+'?", f"MONTH='{request.month:02d}'", content)
-    
-    # 更新YEAR
-    content = re.sub(r'YEAR\s*=\s*\d+', f'YEAR={request.year}', content)
-    
-    # 写入新内容
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-    
+    """保存该月的全部休息日并设为当前处理的月份，写入工作日历后下次运行即生效"""
+    try:
+        work_calendar.set_month(request.year, request.month, request.holidays)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     return {
         "status": "success",
         "updated_values": {
-            "holidays": request.holidays,
+            "holidays": work_calendar.rest_days(request.year, request.month),
             "month": request.month,
             "year": request.year
-        }
+        },
+        "working_days": work_calendar.working_days(request.year, request.month)
+    }
+
+@router.get("/calendar/{year}/{month}")
+def get_calendar(year: int, month: int):
+    """查询某月每天的标记（工作日 / 休息日 / 调休上班），未配置的月份按周六、周日休息"""
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail=f"无效的月份: {month}")
+    flags = work_calendar.day_flags(year, month)
+    return {
+        "year": year,
+        "month": month,
+        "configured": work_calendar.is_configured(year, month),
+        "current": work_calendar.current_month() == (year, month),
+        "holidays": work_calendar.rest_days(year, month),
+        "working_days": work_calendar.working_days(year, month),
+        "days": [
+            {"day": f"{day:02d}", "flag": work_calendar.FLAG_NAMES[int(flag)]}
+            for day, flag in enumerate(flags, start=1)
+        ]
     }
 
+app = FastAPI()
+app.include_router(router)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8911)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8911)
@@ -1,27 +1,15 @@
-# 休息日配置 (格式: "DD")
-HOLIDAYS = [
-    "01",
-    "02",
-    "03",
-    "04",
-    "11",
-    "18",
-    "24",
-    "25",
-    "31"
-]
-MONTH='05'
-YEAR=2025  # 修改为整数类型
+# 休息日配置：当前处理月份的日历视图
+# 数据来自工作日历（work_calendar.py，保存在 config.CALENDAR_FILE 中），通过休息日配置接口修改；
+# 流水线每次运行前重新加载本模块，批量模式按月份覆盖 YEAR / MONTH / HOLIDAYS / REST_DAYS
+import work_calendar
+
+YEAR, _month = work_calendar.current_month()
+MONTH = f"{_month:02d}"
+# 休息日 (格式: "DD")
+HOLIDAYS = work_calendar.rest_days(YEAR, _month)
+# 按日期下标的休息日标记：REST_DAYS[day] 为 True 表示 day 日休息（超出月末的日期为 False）
+REST_DAYS = work_calendar.rest_by_day(YEAR, _month)
+
 def get_working_days():
     """计算应出勤天数（总天数减去休息日）"""
-    import calendar
-    
-    # 获取当前月份的总天数
-    year = YEAR  # 可以根据实际需求修改
-    month = int(MONTH)
-    total_days = calendar.monthrange(year, month)[1]
-    
-    # 计算应出勤天数
-    working_days = total_days - len(HOLIDAYS)
-    return working_days
-    
\ No newline at end of file
+    return work_calendar.working_days(YEAR, int(MONTH))
@@ -0,0 +1,206 @@
+"""
+增量重算
+重新上传部分审批表后，把新的审批记录与数据库中上次导入的记录逐行比较，
+只重算受影响的 (员工, 日期) 单元格并写回 attendance_result，其余数据保持不变
+
+基础考勤表有变化、或数据库中缺少上次导入的表时无法增量处理，需要全量重建；
+修改节假日、月份等配置后同样需要全量运行
+"""
+
+import sys
+from collections import Counter
+
+from psycopg2 import sql
+
+import db
+from bulk_load import normalize_value
+from attendance_merge import DAY_FIELDS, expand_days, load_day_cells, write_day_cells
+import basic_combined
+import employees
+import business_combine
+import freework_combine
+import overwork_combine
+import business_chage
+import freework_chage
+import overwork_chage
+
+# 审批表: (表名, 合并模块)
+APPROVAL_TABLES = [
+    ("business", business_combine),
+    ("freework", freework_combine),
+    ("overwork", overwork_combine),
+]
+
+# 审批记录的前三列依次为 姓名、开始时间、结束时间
+NAME_INDEX, START_INDEX, END_INDEX = 0, 1, 2
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def load_table_rows(cursor, table):
+    """按列顺序读取整张表，返回行计数 Counter；表不存在时返回 None"""
+    if not db.table_exists(cursor, table):
+        return None
+    cursor.execute(sql.SQL("SELECT * FROM {}").format(sql.Identifier(table)))
+    return Counter(cursor.fetchall())
+
+def frame_rows(df):
+    """按入库时的规则把 DataFrame 转为文本行计数，便于与数据库中的行比较"""
+    return Counter(
+        tuple(normalize_value(v) for v in row)
+        for row in df.itertuples(index=False, name=None)
+    )
+
+def diff_rows(old_rows, new_rows):
+    """返回 (新增的行, 删除的行)，重复行按出现次数比较"""
+    return list((new_rows - old_rows).elements()), list((old_rows - new_rows).elements())
+
+def record_cells(table, row, aliases):
+    """
+    计算一条审批记录涉及的考勤单元格，姓名按员工别名表解析，与各 *_chage 阶段一致
+
+    返回:
+        set: {(员工ID, '第N天')}
+    """
+    name, start_time, end_time = row[NAME_INDEX], row[START_INDEX], row[END_INDEX]
+    if not name or not start_time:
+        return set()
+
+    try:
+        if table == "overwork":
+            days = [int(start_time.split()[0].split('-')[2])]
+        else:
+            days = expand_days(start_time, end_time)
+    except Exception as e:
+        flush_print(f"⚠️ 无法解析 {name} 的{table}记录日期: {e}")
+        return set()
+
+    # 与 freework_chage 一致：请假记录按姓名前缀匹配
+    employee_ids = aliases.resolve(name, prefix=(table == "freework"))
+    return {(employee_id, f'第{day}天') for employee_id in employee_ids for day in days}
+
+def recompute_cells(cursor, basic_df, employee_ids, aliases):
+    """
+    从原始打卡数据重新计算指定员工的考勤单元格，并依次合并 出差 → 请假 → 加班
+
+    返回:
+        dict: {员工ID: {'第N天': 值}}
+    """
+    # 沿用员工表中已分配的 员工ID
+    registry = employees.load_registry(cursor)
+    ids, _ = employees.assign_employee_ids(basic_df, registry)
+    rows = basic_df[[employee_id in employee_ids for employee_id in ids]]
+    result = basic_combined.analyze_results(rows, registry)
+    # 与 load_day_cells 一致：同一员工有多条记录时以第一条为准
+    result = result.drop_duplicates(subset=employees.EMPLOYEE_KEY, keep='first')
+    cells = {
+        row[employees.EMPLOYEE_KEY]: {field: normalize_value(row[field], '', missing_strings=True) for field in DAY_FIELDS}
+        for _, row in result.iterrows()
+    }
+
+    def related(records, prefix=False):
+        return [r for r in records if any(i in cells for i in aliases.resolve(r[0], prefix=prefix))]
+
+    # 出差覆盖原有状态
+    business_records = related(business_chage.get_business_records(cursor))
+    for (employee_id, column), value in business_chage.merge_business_records(business_records, cells, aliases).items():
+        cells[employee_id][column] = value
+
+    # 请假追加到已有状态之后
+    freework_chage.merge_freework_records(related(freework_chage.get_freework_records(cursor), prefix=True), cells, aliases)
+
+    # 加班按员工、日期、来源汇总后追加
+    overwork_records = related(overwork_chage.get_overwork_records(cursor.connection))
+    overwork_chage.merge_overtime(overwork_chage.aggregate_overtime(overwork_records), cells, aliases)
+    return cells
+
+def run_incremental():
+    """
+    执行增量重算
+
+    返回:
+        bool: True 表示已完成增量更新（或无需更新），False 表示需要全量重建
+    """
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    try:
+        for table in ("attendance_result", "employee", "employee_alias"):
+            if not db.table_exists(cursor, table):
+                flush_print(f"⚠️ 数据库中没有{table}表，需要全量重建")
+                return False
+
+        # 1. 基础考勤表必须与上次导入一致
+        basic_df = basic_combined.process_excel_file(basic_combined.BASIC_FILE)
+        if basic_df is None:
+            raise Exception("Excel处理失败: 未读取到任何考勤数据")
+        basic_rows = load_table_rows(cursor, "basic")
+        if basic_rows is None or basic_rows != frame_rows(basic_df):
+            flush_print("⚠️ 基础考勤数据有变化，需要全量重建")
+            return False
+
+        # 2. 逐个审批表与上次导入的记录比较
+        changed = []
+        for table, module in APPROVAL_TABLES:
+            flush_print(f"🔍 正在比较{table}审批记录...")
+            new_df = module.load_combined_data()
+            old_rows = load_table_rows(cursor, table)
+            if old_rows is None:
+                flush_print(f"⚠️ 数据库中没有{table}表，需要全量重建")
+                return False
+            added, removed = diff_rows(old_rows, frame_rows(new_df))
+            flush_print(f"📊 {table}: 新增 {len(added)} 条，删除 {len(removed)} 条")
+            if added or removed:
+                changed.append((table, module, new_df, added + removed))
+
+        if not changed:
+            flush_print("✅ 审批记录没有变化，无需重算")
+            return True
+
+        # 3. 计算受影响的单元格
+        aliases = employees.load_aliases(cursor)
+        affected = set()
+        for table, _, _, rows in changed:
+            for row in rows:
+                affected |= record_cells(table, row, aliases)
+        employee_ids = sorted({employee_id for employee_id, _ in affected})
+        names = employees.load_names(cursor, employee_ids)
+        flush_print(f"🎯 受影响单元格 {len(affected)} 个，涉及员工 {len(employee_ids)} 人: "
+                    f"{', '.join(names[i] for i in employee_ids)}")
+
+        # 4. 替换有变化的审批表（先结束读事务，避免持有的表锁阻塞 DROP TABLE）
+        conn.commit()
+        for table, module, new_df, _ in changed:
+            module.save_to_database(new_df)
+
+        if not affected:
+            return True
+
+        # 5. 重算受影响员工的单元格，只写回受影响且值有变化的单元格
+        cells = recompute_cells(cursor, basic_df, set(employee_ids), aliases)
+        current = load_day_cells(cursor, employee_ids)
+        changes = {
+            (employee_id, column): cells[employee_id][column]
+            for employee_id, column in affected
+            if employee_id in cells and cells[employee_id][column] != current.get(employee_id, {}).get(column)
+        }
+        write_day_cells(conn, changes)
+        conn.commit()
+        flush_print(f"✅ 增量重算完成，更新单元格 {len(changes)} 个")
+        return True
+
+    except Exception as e:
+        flush_print(f"❌ 增量重算出错，需要全量重建: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+def main():
+    return run_incremental()
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,232 @@
+"""
+源数据解析缓存
+以 Excel 文件内容的 SHA-256 加上解析配置作为键，缓存解析后的 DataFrame，
+输入文件未变化时直接读取缓存，跳过 Excel 解析
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+
+import pandas as pd
+
+from config import INGEST_CACHE_DIR, INGEST_CACHE_MAX_MB
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, INGEST_CACHE_DIR)
+CACHE_SUFFIX = '.pkl'
+
+# 缓存格式版本，修改存储方式时递增
+CACHE_VERSION = 1
+
+# 进程内记录已计算过的文件哈希: {绝对路径: (mtime_ns, size, sha256)}
+_digest_memo = {}
+# 并行预解析得到的结果: {(绝对路径, 解析器名称): (sha256, DataFrame)}
+_preloaded = {}
+_lock = threading.Lock()
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def file_digest(file_path):
+    """计算文件内容的 SHA-256（文件未修改时复用进程内已计算的结果）"""
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    with _lock:
+        memo = _digest_memo.get(path)
+    if memo and memo[0] == stat.st_mtime_ns and memo[1] == stat.st_size:
+        return memo[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _lock:
+        _digest_memo[path] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
+
+def remember_digest(file_path, digest):
+    """登记已在写入时算好的文件哈希（如上传接口边接收边计算的结果），之后不再重新读取文件"""
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    with _lock:
+        _digest_memo[path] = (stat.st_mtime_ns, stat.st_size, digest)
+
+def _source_of(fn):
+    """取函数源码，无法获取时退回函数名"""
+    try:
+        return inspect.getsource(fn)
+    except (OSError, TypeError):
+        return getattr(fn, '__qualname__', repr(fn))
+
+def cache_key(file_path, parser, params=None, code=()):
+    """
+    生成缓存键
+
+    参数:
+        file_path (str): 源文件路径
+        parser (str): 解析器名称
+        params: 影响解析结果的配置（如列映射、期望列数），需可 JSON 序列化
+        code (tuple): 解析用到的函数，其源码参与计算，修改解析逻辑后旧缓存自动失效
+    """
+    payload = json.dumps({
+        'version': CACHE_VERSION,
+        'pandas': pd.__version__,
+        'file': file_digest(file_path),
+        'parser': parser,
+        'params': params,
+        'code': [_source_of(fn) for fn in code],
+    }, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, key + CACHE_SUFFIX)
+
+def load(key):
+    """读取缓存，未命中返回 None；命中时更新访问时间用于 LRU 淘汰"""
+    path = _cache_path(key)
+    try:
+        df = pd.read_pickle(path)
+        os.utime(path)
+        return df
+    except (FileNotFoundError, EOFError):
+        return None
+    except Exception as e:
+        flush_print(f"⚠️ 读取解析缓存失败，重新解析: {e}")
+        return None
+
+def store(key, df):
+    """写入缓存（先写临时文件再原子替换），并按容量上限淘汰最久未使用的条目"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        flush_print(f"⚠️ 写入解析缓存失败: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    evict(keep=path)
+
+def evict(max_bytes=None, keep=None):
+    """
+    缓存总大小超过上限时，按最近访问时间从旧到新删除
+
+    参数:
+        keep (str): 不删除的条目（刚写入的缓存），即使它本身已超过上限
+    """
+    if max_bytes is None:
+        max_bytes = INGEST_CACHE_MAX_MB * 1024 * 1024
+    entries = []
+    with os.scandir(CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(CACHE_SUFFIX) and entry.path != keep:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    if keep is not None:
+        try:
+            total += os.stat(keep).st_size
+        except FileNotFoundError:
+            pass
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+def preload(file_path, parser, df, digest=None):
+    """
+    登记已在其他进程解析好的结果，本进程内读取同一文件时直接使用
+
+    参数:
+        digest (str): 解析时文件内容的 SHA-256，应在开始解析前取得，避免解析期间文件被替换；
+            默认为登记时的文件哈希
+    """
+    if digest is None:
+        digest = file_digest(file_path)
+    with _lock:
+        _preloaded[(os.path.abspath(file_path), parser)] = (digest, df)
+
+def preloaded_frame(file_path, parser):
+    """预解析结果本身（不复制），没有或源文件在登记之后被修改过时返回 None（过期的结果同时从登记中移除）"""
+    key = (os.path.abspath(file_path), parser)
+    with _lock:
+        entry = _preloaded.get(key)
+    if entry is None:
+        return None
+    try:
+        current = entry[0] == file_digest(file_path)
+    except OSError:
+        current = False
+    if not current:
+        with _lock:
+            if _preloaded.get(key) is entry:
+                del _preloaded[key]
+        return None
+    return entry[1]
+
+def preloaded(file_path, parser):
+    """
+    取出预解析结果供阶段使用，取出后即从登记中移除、释放内存（之后再读取同一文件时使用解析缓存）；
+    源文件在登记之后被修改过时视为未命中
+    """
+    df = preloaded_frame(file_path, parser)
+    if df is None:
+        return None
+    with _lock:
+        _preloaded.pop((os.path.abspath(file_path), parser), None)
+    flush_print(f"⚡ 使用预解析结果: {os.path.basename(file_path)}")
+    return df
+
+def discard_preloaded(file_path):
+    """源文件被替换时移除由它解析出的全部预解析结果"""
+    path = os.path.abspath(file_path)
+    with _lock:
+        for key in [key for key in _preloaded if key[0] == path]:
+            del _preloaded[key]
+
+def clear_preloaded():
+    with _lock:
+        _preloaded.clear()
+
+def load_or_parse(file_path, parser, params, parse_fn, *args, code=None):
+    """
+    优先使用预解析结果或读取缓存，未命中时调用 parse_fn(*args) 解析并写入缓存
+
+    参数:
+        code (tuple): 参与缓存键计算的函数，默认为 (parse_fn,)
+
+    返回:
+        pd.DataFrame: 解析结果（parse_fn 返回 None 时不缓存）
+    """
+    df = preloaded(file_path, parser)
+    if df is not None:
+        return df
+
+    key = cache_key(file_path, parser, params, code or (parse_fn,))
+    df = load(key)
+    if df is not None:
+        flush_print(f"⚡ 命中解析缓存: {os.path.basename(file_path)}")
+        return df
+
+    df = parse_fn(*args)
+    if df is not None:
+        store(key, df)
+    return df
@@ -1,7 +1,8 @@
-import psycopg2
-from datetime import datetime, timedelta
-import pandas as pd
-from config import DB_CONFIG
+from datetime import datetime
+import db
+from attendance_merge import load_day_cells, write_day_cells
+import day_status
+import employees
 import sys
 
 # 强制刷新输出缓冲区
@@ -10,10 +11,6 @@ def flush_print(*args, **kwargs):
     print(*args, **kwargs)
     sys.stdout.flush()
 
-def get_db_connection():
-    """创建数据库连接"""
-    return psycopg2.connect(**DB_CONFIG)
-
 def get_overwork_records(conn):
     """获取加班记录"""
     cursor = conn.cursor()
@@ -36,80 +33,128 @@ def get_overwork_records(conn):
     finally:
         cursor.close()
 
-def update_attendance_for_overtime(cursor, name, date, overtime_hours, source):
-    """更新考勤记录中的加班信息"""
-    try:
-        # 获取该员工在该日期的考勤记录
-        cursor.execute("SELECT * FROM attendance_result WHERE 姓名 = %s", (name,))
-        employee_record = cursor.fetchone()
-        
-        if not employee_record:
-            flush_print(f"❌ 未找到员工 {name} 的记录")
-            return
-        
-        # 获取列名
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'attendance_result' ORDER BY ordinal_position")
-        columns = [col[0] for col in cursor.fetchall()]
-        
-        # 创建列名到索引的映射
-        col_index_map = {col: i for i, col in enumerate(columns)}
+def aggregate_overtime(records):
+    """
+    解析加班记录并按 (员工, 日期, 数据来源) 汇总时长，同一天的多条审批合并为一条
+    
+    参数:
+        records (list): get_overwork_records 的查询结果
+    
+    返回:
+        dict: {(姓名, 日期序号, 数据来源): 加班时长}，按记录出现顺序排列
+    """
+    overtime = {}
+    for name, overtime_date, start_time, end_time, duration, reason, status, source in records:
+        try:
+            # 解析时间
+            date = datetime.strptime(overtime_date, '%Y-%m-%d')
+            
+            # 解析时长
+            overtime_hours = float(duration.replace('小时', '').replace('h', ''))
+            
+            key = (name, date.day, source)
+            overtime[key] = overtime.get(key, 0.0) + overtime_hours
+            
+        except Exception as e:
+            flush_print(f"❌ 处理加班记录时出错: {e}")
+    return overtime
+
+def merge_overtime(overtime, cells, aliases):
+    """
+    在内存中把汇总后的加班时长追加到考勤单元格
+    
+    参数:
+        overtime (dict): aggregate_overtime 的结果
+        cells (dict): {员工ID: {'第N天': 值}}，合并过程中会被原地更新
+        aliases (employees.AliasIndex): 员工别名索引
+    
+    返回:
+        tuple: (变化的单元格 {(员工ID, '第N天'): 新值}, 匹配到的员工集合, 未匹配的员工集合)
+    """
+    changes = {}
+    matched = set()
+    unmatched = set()
+    for (name, day, source), hours in overtime.items():
+        employee_ids = [i for i in aliases.resolve(name) if i in cells]
+        if not employee_ids:
+            unmatched.add(name)
+            continue
+        matched.add(name)
         
-        # 构建更新语句
-        day_column = f"第{date.day}天"
-        if day_column in col_index_map:
-            # 获取当前值
-            current_value = employee_record[col_index_map[day_column]]
+        day_column = f"第{day}天"
+        hours = round(hours, 2)
+        for employee_id in employee_ids:
+            current_value = cells[employee_id][day_column]
             
             # 构建新的值
             if current_value and str(current_value) != 'nan':
-                new_value = f"{current_value} + {source}加班({overtime_hours}h)"
+                new_value = f"{current_value} + {source}加班({hours}h)"
             else:
-                new_value = f"{source}加班({overtime_hours}h)"
-            
-            # 更新记录
-            update_query = f"UPDATE attendance_result SET \"{day_column}\" = %s WHERE 姓名 = %s"
-            cursor.execute(update_query, (new_value, name))
-            flush_print(f"✅ 已更新 {name} 在 {date.date()} 的考勤记录：{new_value}")
-        else:
-            flush_print(f"❌ 未找到 {name} 在 {date.date()} 的考勤记录")
+                new_value = f"{source}加班({hours}h)"
             
-    except Exception as e:
-        flush_print(f"❌ 更新考勤记录时出错: {e}")
+            cells[employee_id][day_column] = new_value
+            changes[(employee_id, day_column)] = new_value
+    return changes, matched, unmatched
+
+def apply_overtime_to_matrix(overtime, matrix, aliases):
+    """
+    在考勤状态矩阵上追加汇总后的加班时长，规则与 merge_overtime 一致
+    
+    返回:
+        tuple: (被修改的 {(员工ID, '第N天')}, 匹配到的员工集合, 未匹配的员工集合)
+    """
+    touched = set()
+    matched = set()
+    unmatched = set()
+    for (name, day, source), hours in overtime.items():
+        employee_ids = [i for i in aliases.resolve(name) if i in matrix]
+        if not employee_ids:
+            unmatched.add(name)
+            continue
+        matched.add(name)
+        for employee_id in employee_ids:
+            touched.add(matrix.add_overtime(employee_id, day, source, hours))
+    return touched, matched, unmatched
 
 def process_overtime_records():
     """处理加班记录，更新考勤结果"""
-    conn = psycopg2.connect(**DB_CONFIG)
+    conn = db.get_connection()
     cursor = conn.cursor()
     
     try:
-        # 获取所有加班记录
-        cursor.execute("SELECT 姓名, 开始时间, 结束时间, 加班时长小时, 数据来源 FROM overwork")
-        overwork_records = cursor.fetchall()
-        
+        # 一次性获取所有加班记录
+        overwork_records = get_overwork_records(conn)
         flush_print(f"✅ 获取到 {len(overwork_records)} 条加班记录")
         
-        # 处理每条加班记录
-        for name, start_time, end_time, duration, source in overwork_records:
-            try:
-                # 解析时间
-                start_date = datetime.strptime(start_time.split()[0], '%Y-%m-%d')
-                end_date = datetime.strptime(end_time.split()[0], '%Y-%m-%d')
-                
-                # 解析时长
-                overtime_hours = float(duration.replace('小时', '').replace('h', ''))
-                
-                # 更新考勤记录
-                update_attendance_for_overtime(cursor, name, start_date, overtime_hours, source)
-                
-            except Exception as e:
-                flush_print(f"❌ 处理加班记录时出错: {e}")
+        # 按员工、日期、来源汇总加班时长
+        overtime = aggregate_overtime(overwork_records)
+        aliases = employees.load_aliases(cursor)
+        
+        matrix = day_status.current()
+        if matrix is not None:
+            # 流水线中直接在考勤状态矩阵上合并，只为变化的单元格生成文本
+            touched, matched, unmatched = apply_overtime_to_matrix(overtime, matrix, aliases)
+            changes = matrix.render_cells(touched)
+        else:
+            # 一次性读取涉及员工的考勤单元格，在内存中合并
+            employee_ids = {i for name, _, _ in overtime for i in aliases.resolve(name)}
+            cells = load_day_cells(cursor, employee_ids)
+            changes, matched, unmatched = merge_overtime(overtime, cells, aliases)
+        
+        for name in sorted(unmatched):
+            flush_print(f"❌ 未找到员工 {name} 的记录")
+        
+        # 一次性写回所有变化的单元格
+        write_day_cells(conn, changes)
         
         conn.commit()
         flush_print("✅ 考勤记录更新完成")
+        flush_print(f"📊 匹配员工 {len(matched)} 人，未匹配员工 {len(unmatched)} 人，更新单元格 {len(changes)} 个")
         
     except Exception as e:
         flush_print(f"❌ 程序执行出错: {e}")
         conn.rollback()
+        raise
     finally:
         cursor.close()
         conn.close()
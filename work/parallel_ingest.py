@@ -0,0 +1,178 @@
+"""
+源数据并行解析
+在进程池中同时解析 basic.xlsx 和六个审批表，把解析结果传回主进程并登记到 ingest_cache，
+随后各阶段读取同一文件时直接使用，不再逐个解析。
+本进程中已有最新预解析结果的文件（如服务在上传后已解析过，见 service.py）不再重复解析
+"""
+
+import importlib
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, as_completed
+
+from config import INGEST_WORKERS
+import ingest_cache
+
+# 解析任务: (模块名, 源文件常量, 解析函数, 解析器名称)
+# 解析器名称与各模块读取时使用的 ingest_cache 解析器名称一致
+INGEST_JOBS = [
+    ("basic_combined", "BASIC_FILE", "process_excel_file", "basic_combined"),
+    ("business_combine", "FEISHU_FILE", "process_feishu_data", "business_combine.feishu"),
+    ("business_combine", "DINGDING_FILE", "process_dingding_data", "business_combine.dingding"),
+    ("freework_combine", "FEISHU_FILE", "process_feishu_data", "freework_combine.feishu"),
+    ("freework_combine", "DINGDING_FILE", "process_dingding_data", "freework_combine.dingding"),
+    ("overwork_combine", "FEISHU_FILE", "process_feishu_data", "overwork_combine.feishu"),
+    ("overwork_combine", "DINGDING_FILE", "process_dingding_data", "overwork_combine.dingding"),
+]
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def _parse(module_name, func_name, file_path):
+    """在子进程中解析单个文件，返回 (DataFrame, 耗时)"""
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    df = getattr(module, func_name)(file_path)
+    return df, time.perf_counter() - started
+
+def process_context():
+    """
+    子进程由预先导入 pandas 的 forkserver 进程创建，避免在多线程的服务进程中直接 fork，
+    也省去每个子进程重新导入的时间；不支持 forkserver 的平台使用 spawn
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["pandas", "openpyxl"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+def source_jobs(extra_files=()):
+    """解析任务列表 [(结果键, 模块名, 解析函数, 解析器名称, 文件路径)]"""
+    jobs = []
+    for module_name, file_attr, func_name, parser in INGEST_JOBS:
+        module = importlib.import_module(module_name)
+        jobs.append(((module_name, file_attr), module_name, func_name, parser, getattr(module, file_attr)))
+    for module_name, func_name, parser, file_path in extra_files:
+        jobs.append(((module_name, file_path), module_name, func_name, parser, file_path))
+    return jobs
+
+def _parse_jobs(jobs, max_workers):
+    """
+    在进程池中执行解析任务，结果登记到 ingest_cache，返回 {结果键: DataFrame}
+    预解析只用于加速：文件缺失、解析失败或进程池异常（如子进程被杀导致 BrokenProcessPool）时
+    只跳过对应的文件，由各阶段照常自行解析
+    """
+    frames = {}
+    if not jobs:
+        return frames
+    max_workers = max(1, min(max_workers, len(jobs)))
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=process_context()) as executor:
+            _collect(executor, jobs, frames)
+    except Exception as e:
+        flush_print(f"⚠️ 并行解析中止，其余文件由对应阶段自行解析: {type(e).__name__}: {e}")
+    return frames
+
+def _collect(executor, jobs, frames):
+    """提交解析任务并把成功的结果登记、写入 frames"""
+    futures = {}
+    for key, module_name, func_name, parser, file_path in jobs:
+        # 子进程的工作目录不一定与本进程相同，统一传绝对路径
+        file_path = os.path.abspath(file_path)
+        try:
+            # 解析前取得文件哈希，解析期间文件被替换时登记的结果随即失效
+            digest = ingest_cache.file_digest(file_path)
+        except OSError as e:
+            flush_print(f"⚠️ 无法读取 {os.path.basename(file_path)}，跳过并行解析: {e}")
+            continue
+        try:
+            future = executor.submit(_parse, module_name, func_name, file_path)
+        except BrokenExecutor as e:
+            flush_print(f"⚠️ 解析进程池已不可用，其余文件由对应阶段自行解析: {e}")
+            break
+        futures[future] = (key, parser, file_path, digest)
+    for future in as_completed(futures):
+        key, parser, file_path, digest = futures[future]
+        name = os.path.basename(file_path)
+        try:
+            df, elapsed = future.result()
+        except Exception as e:
+            flush_print(f"⚠️ 并行解析 {name} 失败，将由对应阶段重新解析: {type(e).__name__}: {e}")
+            continue
+        if df is None:
+            flush_print(f"⚠️ 并行解析 {name} 未得到数据，将由对应阶段重新解析")
+            continue
+        ingest_cache.preload(file_path, parser, df, digest)
+        frames[key] = df
+        flush_print(f"📄 {name}: {len(df)} 行，解析耗时 {elapsed:.2f}s")
+
+def ingest_all(max_workers=None, extra_files=()):
+    """
+    并行解析所有源文件
+
+    参数:
+        max_workers (int): 进程数上限，默认使用 config.INGEST_WORKERS
+        extra_files (iterable): 额外解析的文件 [(模块名, 解析函数, 解析器名称, 文件路径)]，
+            如批量模式下各月份的基础考勤表，结果以 (模块名, 文件路径) 为键
+
+    返回:
+        dict: {(模块名, 源文件常量): DataFrame}，解析失败的文件不在结果中
+    """
+    if max_workers is None:
+        max_workers = INGEST_WORKERS
+
+    jobs = source_jobs(extra_files)
+    started = time.perf_counter()
+    frames = {}
+    pending = []
+    for job in jobs:
+        key, _, _, parser, file_path = job
+        df = ingest_cache.preloaded_frame(file_path, parser)
+        if df is None:
+            pending.append(job)
+            continue
+        frames[key] = df
+        flush_print(f"♻️ {os.path.basename(file_path)}: {len(df)} 行，已预先解析")
+    frames.update(_parse_jobs(pending, max_workers))
+
+    flush_print(f"✅ 并行解析完成: {len(frames)}/{len(jobs)} 个文件（其中 {len(jobs) - len(pending)} 个已预先解析），"
+                f"{min(max_workers, len(pending))} 个进程，总耗时 {time.perf_counter() - started:.2f}s")
+    return frames
+
+def ingest_files(paths, max_workers=None):
+    """
+    只解析指定的源文件（如刚上传的文件），已有最新预解析结果的文件跳过
+
+    返回:
+        dict: {文件绝对路径: 行数}，解析失败的文件行数为 None，不属于源文件的路径不在结果中
+    """
+    if max_workers is None:
+        max_workers = INGEST_WORKERS
+    wanted = {os.path.abspath(path) for path in paths}
+    jobs = [job for job in source_jobs() if os.path.abspath(job[4]) in wanted]
+    counts = {}
+    pending = []
+    for job in jobs:
+        df = ingest_cache.preloaded_frame(job[4], job[3])
+        if df is None:
+            pending.append(job)
+        else:
+            counts[os.path.abspath(job[4])] = len(df)
+    frames = _parse_jobs(pending, max_workers)
+    for key, _, _, _, file_path in pending:
+        counts[os.path.abspath(file_path)] = len(frames[key]) if key in frames else None
+    return counts
+
+def main():
+    if INGEST_WORKERS <= 1:
+        flush_print("⏭️ 未启用并行解析（INGEST_WORKERS <= 1），由各阶段自行解析")
+        return
+    ingest_all()
+
+if __name__ == "__main__":
+    main()
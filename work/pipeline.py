@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+考勤分析流水线编排
+在同一个进程内按依赖关系运行各处理阶段，替代 run_all_scripts.sh 逐个启动解释器的方式
+
+用法:
+    python3 pipeline.py                # 全量重建
+    python3 pipeline.py --incremental  # 只重算审批记录变化涉及的单元格
+    python3 pipeline.py --transaction  # 所有阶段在同一个数据库事务中串行运行，全部成功才提交
+    python3 pipeline.py --backend=sqlite  # 中间表存放在本地 SQLite 中（覆盖 config.DB_BACKEND）
+"""
+
+import contextlib
+import importlib
+import io
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+import config
+import day_status
+import db
+import progress
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 同时运行的阶段数上限
+MAX_WORKERS = 4
+
+# 阶段定义: (模块名, 阶段说明, 依赖的阶段)
+# parallel_ingest 先在进程池中解析全部源文件，之后各阶段直接使用解析结果；
+# 三个 *_combine 阶段各自写入独立的表，互不依赖；
+# *_chage 阶段按 出差(覆盖) → 请假(追加) → 加班(追加) 的顺序修改同一张 attendance_result 表，必须串行
+STAGES = [
+    ("parallel_ingest", "源数据并行解析", ()),
+    ("basic_combined", "基础数据合并", ("parallel_ingest",)),
+    ("business_combine", "业务数据合并", ("parallel_ingest",)),
+    ("freework_combine", "自由工作数据合并", ("parallel_ingest",)),
+    ("overwork_combine", "加班数据合并", ("parallel_ingest",)),
+    ("business_chage", "业务数据变更", ("basic_combined", "business_combine")),
+    ("freework_chage", "自由工作数据变更", ("business_chage", "freework_combine")),
+    ("overwork_chage", "加班数据变更", ("freework_chage", "overwork_combine")),
+    ("attendance_summary", "考勤汇总", ("overwork_chage",)),
+    ("history", "写入历史库", ("overwork_chage",)),
+    ("publish", "发布到Postgres", ("attendance_summary", "history")),
+]
+
+# 增量模式：只重算审批记录变化涉及的单元格，再重新导出汇总；
+# 增量阶段返回 False（无法增量处理）时改为运行完整的 STAGES
+INCREMENTAL_STAGES = [
+    ("parallel_ingest", "源数据并行解析", ()),
+    ("incremental", "增量重算", ("parallel_ingest",)),
+    ("attendance_summary", "考勤汇总", ("incremental",)),
+    ("history", "写入历史库", ("incremental",)),
+    ("publish", "发布到Postgres", ("attendance_summary", "history")),
+]
+
+# 各阶段依赖的配置模块，每次运行前重新加载，保证配置修改立即生效
+CONFIG_MODULES = ["config", "holidays", "shift_rules"]
+
+_run_lock = threading.Lock()
+
+
+class _TeeStream(io.TextIOBase):
+    """同时写入原输出流和内存缓冲区，每个完整的输出行同时作为 log 事件发出"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = io.StringIO()
+        self._lock = threading.Lock()
+        self._partial = threading.local()
+
+    def write(self, text):
+        with self._lock:
+            self.buffer.write(text)
+            if self.stream is not None:
+                self.stream.write(text)
+        # 各阶段线程的输出分别按行拼接，事件中的阶段即输出该行的阶段
+        lines = (getattr(self._partial, 'text', '') + text).split('\n')
+        self._partial.text = lines.pop()
+        for line in lines:
+            if line.strip():
+                progress.emit('log', text=line)
+        return len(text)
+
+    def flush(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+
+class _ThreadOutput(io.TextIOBase):
+    """
+    按线程分发的标准输出：登记了运行输出的线程（流水线线程及各阶段的工作线程）写入该次运行的输出，
+    其他线程（如同一进程中处理 API 请求的线程）直接写入原输出流，不会混入运行输出
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def _target(self):
+        return getattr(self.local, 'output', None) or self.stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def isatty(self):
+        return self.stream.isatty()
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    @property
+    def encoding(self):
+        return getattr(self.stream, 'encoding', 'utf-8')
+
+
+def _thread_output():
+    """安装按线程分发的标准输出（只替换一次 sys.stdout，之后各次运行只登记各自的线程）"""
+    if not isinstance(sys.stdout, _ThreadOutput):
+        sys.stdout = _ThreadOutput(sys.stdout)
+    return sys.stdout
+
+
+@contextlib.contextmanager
+def _capture(output):
+    """当前线程的输出写入 output（_TeeStream），output 为 None 时不收集"""
+    if output is None:
+        yield
+        return
+    router = _thread_output()
+    previous = getattr(router.local, 'output', None)
+    router.local.output = output
+    try:
+        yield
+    finally:
+        router.local.output = previous
+
+
+def _apply_overrides(module, overrides):
+    for attr, value in (overrides or {}).get(module.__name__, {}).items():
+        setattr(module, attr, value)
+
+
+def load_stage_modules(overrides=None):
+    """
+    加载（或重新加载）配置模块和各阶段模块，返回 {模块名: 模块}
+
+    参数:
+        overrides (dict): {模块名: {属性: 值}}，模块加载后覆盖其中的配置（如批量模式下的月份），
+            配置模块的覆盖先于阶段模块加载，阶段模块导入时即可读到覆盖后的值
+    """
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+
+    for name in CONFIG_MODULES:
+        if name in sys.modules:
+            module = importlib.reload(sys.modules[name])
+        else:
+            module = importlib.import_module(name)
+        _apply_overrides(module, overrides)
+
+    modules = {}
+    for name, _, _ in STAGES + INCREMENTAL_STAGES:
+        if name in modules:
+            continue
+        if name in sys.modules:
+            modules[name] = importlib.reload(sys.modules[name])
+        else:
+            modules[name] = importlib.import_module(name)
+        _apply_overrides(modules[name], overrides)
+    return modules
+
+
+def _new_record(name, title, deps):
+    return {
+        'stage': name,
+        'title': title,
+        'depends_on': list(deps),
+        'status': 'pending',
+        'start_time': None,
+        'end_time': None,
+        'elapsed': None,
+        'error': None,
+    }
+
+
+def _run_stage(module, record, output=None):
+    """
+    执行单个阶段并记录耗时；main() 抛出异常时记为 failed，返回 False 时记为 fallback（需要全量重建）
+
+    参数:
+        output (_TeeStream): 收集本次运行输出的流，阶段在工作线程中运行，输出按线程登记
+    """
+    with _capture(output), progress.stage(record['stage']):
+        record['status'] = 'running'
+        record['start_time'] = datetime.now().isoformat()
+        started = time.perf_counter()
+        progress.emit('stage_started', title=record['title'])
+        print(f"\n{'=' * 42}\n▶️ 开始: {record['title']} ({record['stage']})\n{'=' * 42}", flush=True)
+        try:
+            outcome = module.main()
+            record['status'] = 'fallback' if outcome is False else 'success'
+        except BaseException as e:  # 阶段内的 sys.exit 也视为失败，不能让它结束整个进程
+            record['status'] = 'failed'
+            record['error'] = f"{type(e).__name__}: {e}"
+            print(f"❌ {record['title']} 执行失败: {record['error']}", flush=True)
+        finally:
+            record['elapsed'] = round(time.perf_counter() - started, 3)
+            record['end_time'] = datetime.now().isoformat()
+            if record['status'] == 'success':
+                print(f"✅ {record['title']} 完成，耗时 {record['elapsed']:.2f}s", flush=True)
+            elif record['status'] == 'fallback':
+                print(f"↩️ {record['title']} 无法增量处理，改为全量重建", flush=True)
+            progress.emit('stage_finished', title=record['title'], status=record['status'],
+                          elapsed_ms=round(record['elapsed'] * 1000), rows=progress.stage_rows(),
+                          error=record['error'])
+    return record
+
+
+def _run_stages(stages, modules, records, max_workers, output=None):
+    """按依赖关系并发运行一组阶段，某个阶段失败后不再调度新的阶段"""
+    pending = {name: set(deps) for name, _, deps in stages}
+    done = set()
+    failed = False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            if not failed:
+                ready = [name for name, deps in pending.items() if deps <= done]
+                for name in ready:
+                    del pending[name]
+                    future = executor.submit(_run_stage, modules[name], records[name], output)
+                    running[future] = name
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if records[name]['status'] == 'success':
+                    done.add(name)
+                else:
+                    failed = True
+
+    # 失败后未调度的阶段标记为跳过
+    for name in pending:
+        records[name]['status'] = 'skipped'
+        progress.emit('stage_skipped', title=records[name]['title'])
+
+
+class _StageFailed(Exception):
+    """有阶段失败，流水线事务需要回滚"""
+
+
+def run_pipeline(max_workers=MAX_WORKERS, capture_output=True, incremental=False, transaction=False, backend=None,
+                 overrides=None, on_event=None):
+    """
+    在当前进程内运行完整的考勤处理流程
+
+    参数:
+        max_workers (int): 同时运行的阶段数上限
+        capture_output (bool): 是否收集运行期间的输出
+        incremental (bool): 是否只重算审批记录变化涉及的单元格
+        transaction (bool): 是否在同一个数据库事务中串行运行所有阶段，任一阶段失败时整体回滚
+        backend (str): 存储后端 postgres / sqlite，None 时使用 config.DB_BACKEND
+        overrides (dict): {模块名: {属性: 值}}，本次运行覆盖的模块配置（见 load_stage_modules）
+        on_event (callable): 运行期间接收进度事件的函数（见 progress.py），在各阶段的线程中调用
+
+    返回:
+        dict: success / stages(每个阶段的状态与耗时) / elapsed / sql(语句数与耗时) / output
+    """
+    # 只收集本次运行的线程的输出，同一进程中其他线程的输出照常写入原输出流
+    tee = _TeeStream(_thread_output().stream) if capture_output else None
+    with _run_lock, progress.listening(on_event), _capture(tee):
+        previous_cwd = os.getcwd()
+        started = time.perf_counter()
+        stages = INCREMENTAL_STAGES if incremental else STAGES
+        records = [_new_record(*stage) for stage in stages]
+        # 考勤状态矩阵只在本次运行内有效，由基础考勤阶段重新登记
+        day_status.reset()
+        db.reset_statement_stats()
+        rolled_back = False
+
+        try:
+            # 各阶段使用相对路径读取 ../data 和写入 output，统一在 work 目录下运行
+            os.chdir(BASE_DIR)
+            mode = "增量" if incremental else "完整"
+            progress.emit('pipeline_started', incremental=incremental, transaction=transaction,
+                          stages=[name for name, _, _ in stages])
+            print(f"🚀 开始执行{mode}数据处理流程，共 {len(stages)} 个阶段", flush=True)
+            modules = load_stage_modules(overrides)
+            if backend is not None:
+                config.DB_BACKEND = backend
+            # 共享连接（事务模式或本地 SQLite）不能被多个阶段同时使用
+            if transaction or db.is_embedded():
+                max_workers = 1
+
+            try:
+                with db.transaction() if transaction else contextlib.nullcontext():
+                    _run_stages(stages, modules, {r['stage']: r for r in records}, max_workers, tee)
+
+                    # 增量阶段无法处理时，汇总阶段尚未运行，改为执行完整流程（已完成的阶段不再重复）
+                    by_name = {r['stage']: r for r in records}
+                    if incremental and by_name['incremental']['status'] == 'fallback':
+                        finished = {name for name, r in by_name.items() if r['status'] == 'success'}
+                        remaining = [
+                            (name, title, tuple(dep for dep in deps if dep not in finished))
+                            for name, title, deps in STAGES if name not in finished
+                        ]
+                        full_records = [_new_record(*stage) for stage in remaining]
+                        progress.emit('pipeline_fallback', stages=[name for name, _, _ in remaining])
+                        records = [r for r in records if r['status'] != 'skipped'] + full_records
+                        _run_stages(remaining, modules, {r['stage']: r for r in full_records}, max_workers, tee)
+
+                    if transaction and not all(r['status'] in ('success', 'fallback') for r in records):
+                        raise _StageFailed()
+            except Exception as e:
+                if not transaction:
+                    raise
+                rolled_back = True
+                if not isinstance(e, _StageFailed):
+                    print(f"❌ 流水线事务失败: {e}", flush=True)
+        finally:
+            result = {
+                'success': not rolled_back and all(r['status'] in ('success', 'fallback') for r in records),
+                'stages': records,
+                'elapsed': round(time.perf_counter() - started, 3),
+                'sql': db.statement_stats(),
+                'output': '',
+            }
+            print_timing(result)
+            progress.emit('pipeline_finished', success=result['success'],
+                          elapsed_ms=round(result['elapsed'] * 1000), sql=result['sql'])
+            os.chdir(previous_cwd)
+            if tee is not None:
+                result['output'] = tee.getvalue()
+
+        return result
+
+
+def print_timing(result):
+    """打印各阶段耗时"""
+    print(f"\n📋 执行摘要 (总耗时 {result['elapsed']:.2f}s):")
+    for record in result['stages']:
+        elapsed = f"{record['elapsed']:.2f}s" if record['elapsed'] is not None else '-'
+        print(f"- {record['title']:<12} {record['status']:<8} {elapsed}")
+    print(f"🗄️ 数据库语句 {result['sql']['statements']} 条，累计耗时 {result['sql']['seconds']:.2f}s")
+    sys.stdout.flush()
+
+
+def main():
+    incremental = "--incremental" in sys.argv[1:]
+    transaction = "--transaction" in sys.argv[1:]
+    backend = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--backend=")), None)
+    result = run_pipeline(capture_output=False, incremental=incremental, transaction=transaction, backend=backend)
+    if result['success']:
+        print("🎉 所有阶段执行成功!")
+        return 0
+    print("❌ 部分阶段执行失败")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+运行进度事件
+流水线运行期间，各阶段的开始、结束、写入行数和输出行以结构化事件的形式发给注册的监听函数
+（如 API 把事件推送给客户端，见 download_api.py），没有监听函数时不产生任何开销。
+
+事件为 dict: event(事件类型) / time / stage(当前阶段，阶段之外为 None) 加上各类型自己的字段
+"""
+
+import contextlib
+import threading
+from datetime import datetime
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+# 当前线程正在运行的阶段及其写入的行数（各阶段在各自的工作线程中运行）
+_current = threading.local()
+
+def add_listener(callback):
+    with _listeners_lock:
+        _listeners.append(callback)
+
+def remove_listener(callback):
+    with _listeners_lock:
+        if callback in _listeners:
+            _listeners.remove(callback)
+
+@contextlib.contextmanager
+def listening(callback):
+    """在 with 块内把事件发给 callback，callback 为 None 时什么也不做"""
+    if callback is None:
+        yield
+        return
+    add_listener(callback)
+    try:
+        yield
+    finally:
+        remove_listener(callback)
+
+def emit(event, **fields):
+    """发出一个事件，监听函数中的异常不影响流水线"""
+    if not _listeners:
+        return
+    record = {
+        'event': event,
+        'time': datetime.now().isoformat(),
+        'stage': getattr(_current, 'stage', None),
+        **fields,
+    }
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(record)
+        except Exception:
+            pass
+
+@contextlib.contextmanager
+def stage(name):
+    """把当前线程标记为正在运行阶段 name，期间 rows() 的行数计入该阶段"""
+    previous = getattr(_current, 'stage', None), getattr(_current, 'rows', 0)
+    _current.stage, _current.rows = name, 0
+    try:
+        yield
+    finally:
+        _current.stage, _current.rows = previous
+
+def stage_rows():
+    """当前阶段累计写入的行数"""
+    return getattr(_current, 'rows', 0)
+
+def rows(table, count, **fields):
+    """记录写入 table 的行数，并发出 rows 事件"""
+    _current.rows = getattr(_current, 'rows', 0) + count
+    emit('rows', table=table, rows=count, stage_rows=_current.rows, **fields)
@@ -0,0 +1,148 @@
+"""
+发布结果到 Postgres
+使用本地 SQLite 运行时，把结果表整体复制到 DB_CONFIG 指定的 Postgres：
+表结构（列类型、主键、索引）按本地表重建，所有表在同一个事务中替换，远程读者不会看到发布了一半的数据。
+本地历史库（history.py）的各月份在同一个事务中按月替换到 Postgres 历史库对应的分区，只写入有变化的行
+"""
+
+import sys
+import time
+
+import pandas as pd
+from psycopg2 import sql
+
+import config
+import db
+import history
+from bulk_load import bulk_insert
+from sqlite_backend import table_columns, table_indexes
+
+# 发布的表，按依赖顺序排列（删除时逆序）
+PUBLISH_TABLES = [
+    "basic",
+    "business",
+    "freework",
+    "overwork",
+    "employee",
+    "employee_alias",
+    "attendance_result",
+]
+
+# 强制刷新输出缓冲区
+def flush_print(*args, **kwargs):
+    """带缓冲刷新的print函数"""
+    print(*args, **kwargs)
+    sys.stdout.flush()
+
+def create_remote_table(cursor, table, columns):
+    """按本地表的列类型和主键在 Postgres 上建表"""
+    primary_key = [name for name, _, pk in sorted(columns, key=lambda c: c[2]) if pk]
+    parts = [
+        sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(column_type))
+        for name, column_type, _ in columns
+    ]
+    if primary_key:
+        parts.append(sql.SQL("PRIMARY KEY ({})").format(sql.SQL(', ').join(map(sql.Identifier, primary_key))))
+    cursor.execute(sql.SQL("CREATE TABLE {} ({})").format(sql.Identifier(table), sql.SQL(', ').join(parts)))
+
+def publish_tables(local, remote):
+    """把本地结果表复制到 Postgres，返回 {表名: 行数}"""
+    counts = {}
+    cursor = remote.cursor()
+    local_cursor = local.cursor()
+    try:
+        for table in reversed(PUBLISH_TABLES):
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(sql.Identifier(table)))
+
+        for table in PUBLISH_TABLES:
+            if not db.table_exists(local_cursor, table):
+                flush_print(f"⚠️ 本地数据库中没有 {table} 表，跳过")
+                continue
+            columns = table_columns(local, table)
+            create_remote_table(cursor, table, columns)
+
+            names = [name for name, _, _ in columns]
+            local_cursor.execute(sql.SQL("SELECT {} FROM {}").format(
+                sql.SQL(', ').join(map(sql.Identifier, names)), sql.Identifier(table)
+            ))
+            counts[table] = bulk_insert(remote, table, names, iter(local_cursor), verbatim=True)
+
+            for index_name, index_columns in table_indexes(local, table):
+                cursor.execute(sql.SQL("CREATE INDEX {} ON {} ({})").format(
+                    sql.Identifier(index_name), sql.Identifier(table),
+                    sql.SQL(', ').join(map(sql.Identifier, index_columns))
+                ))
+        counts.update(publish_history(local, remote))
+        remote.commit()
+    except Exception:
+        remote.rollback()
+        raise
+    finally:
+        cursor.close()
+        local_cursor.close()
+    return counts
+
+def history_months(local_cursor):
+    """本地历史库中有数据的月份 [(年, 月)]"""
+    months = set()
+    for table in history.TABLES:
+        local_cursor.execute(sql.SQL("SELECT DISTINCT substr({}, 1, 7) FROM {}").format(
+            sql.Identifier("日期"), sql.Identifier(config.HISTORY_SCHEMA, table)
+        ))
+        months.update(row[0] for row in local_cursor.fetchall() if row[0])
+    return sorted((int(month[:4]), int(month[5:7])) for month in months)
+
+def publish_history(local, remote):
+    """
+    把本地历史库的各月份按月替换到 Postgres 的历史库（不提交事务）
+
+    返回:
+        dict: {'history.表名': 行数}
+    """
+    counts = {}
+    history.create_tables(local, [])
+    local_cursor = local.cursor()
+    try:
+        months = history_months(local_cursor)
+        if not months:
+            return counts
+        history.create_tables(remote, months)
+        for table, (columns, _) in history.TABLES.items():
+            names = [name for name, _ in columns]
+            published = f"{config.HISTORY_SCHEMA}.{table}"
+            counts[published] = 0
+            for year, month in months:
+                first, last = history.month_bounds(year, month)
+                local_cursor.execute(sql.SQL("SELECT {} FROM {} WHERE {} >= %s AND {} < %s").format(
+                    sql.SQL(', ').join(map(sql.Identifier, names)),
+                    sql.Identifier(config.HISTORY_SCHEMA, table),
+                    sql.Identifier("日期"), sql.Identifier("日期"),
+                ), (first.isoformat(), last.isoformat()))
+                frame = pd.DataFrame(local_cursor.fetchall(), columns=names)
+                history.replace_month(remote, table, frame, year, month)
+                counts[published] += len(frame)
+    finally:
+        local_cursor.close()
+    return counts
+
+def main():
+    if not db.is_embedded():
+        flush_print("⏭️ 中间表已在 Postgres 中，无需发布")
+        return
+    if not config.PUBLISH_TO_POSTGRES:
+        flush_print("⏭️ 未启用发布到 Postgres（PUBLISH_TO_POSTGRES = False）")
+        return
+
+    started = time.perf_counter()
+    local = db.get_connection()
+    remote = db.postgres_connection()
+    try:
+        counts = publish_tables(local, remote)
+        total = sum(counts.values())
+        flush_print(f"✅ 已发布 {len(counts)} 张表共 {total} 行到 Postgres，耗时 {time.perf_counter() - started:.2f}s")
+    finally:
+        remote.close()
+        local.close()
+
+if __name__ == "__main__":
+    main()
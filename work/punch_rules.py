@@ -0,0 +1,258 @@
+"""
+打卡规则向量化计算
+把整块日期列转换为每格的首次/末次打卡分钟数，用数组比较判定迟到、早退、旷工，
+最后统一生成与 basic_combined.analyze_day 完全一致的状态文本
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# 打卡时间格式 HH:MM 的长度
+TIME_LENGTH = 5
+# 拼接单元格时使用的分隔符，不会与打卡时间相连
+CELL_SEPARATOR = '\x00'
+
+# 下午的起点（分钟），末次打卡早于此时间不判早退
+NOON = 12 * 60
+
+# 状态编码
+CODE_BLANK = 0        # 休息日无打卡，输出空字符串
+CODE_RAW = 1          # 休息日有打卡，原样输出单元格内容
+CODE_MISSING = 2      # 缺卡(1天)，单元格有其他内容时追加原文
+CODE_ABSENT_FULL = 3  # 旷工1天
+CODE_ABSENT_HALF = 4  # 旷工0.5天
+CODE_NORMAL = 5       # 正常
+CODE_LATE = 6         # 迟到
+CODE_EARLY = 7        # 早退
+CODE_LATE_EARLY = 8   # 迟到+早退
+
+# 带打卡时间的状态及其文本前缀
+TIMED_LABELS = {
+    CODE_ABSENT_FULL: "旷工1天",
+    CODE_ABSENT_HALF: "旷工0.5天",
+    CODE_NORMAL: "正常",
+    CODE_LATE: "迟到",
+    CODE_EARLY: "早退",
+    CODE_LATE_EARLY: "迟到+早退",
+}
+
+# 分钟数 → 'HH:MM' 文本的查找表（时、分均为两位数字）
+MINUTE_LABELS = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(99 * 60 + 100)], dtype=object)
+
+# 与 analyze_day 一致：这些单元格内容在缺卡时不追加原文
+HIDDEN_CELL_TEXTS = ('', 'nan', 'None')
+
+
+def to_minutes(value):
+    """将 datetime（取时分）或 timedelta 转换为整数分钟"""
+    if isinstance(value, timedelta):
+        return int(value.total_seconds() // 60)
+    if isinstance(value, datetime):
+        return value.hour * 60 + value.minute
+    return int(value)
+
+
+def _find_times(chars):
+    """
+    在码点数组中查找 HH:MM 的起始位置，结果与 re.findall(r"\\d{2}:\\d{2}") 从左到右、
+    互不重叠的匹配一致
+    """
+    if len(chars) < TIME_LENGTH:
+        return np.empty(0, dtype=np.int64)
+    is_digit = (chars >= ord('0')) & (chars <= ord('9'))
+    is_colon = chars == ord(':')
+    candidates = np.flatnonzero(
+        is_digit[:-4] & is_digit[1:-3] & is_colon[2:-2] & is_digit[3:-1] & is_digit[4:]
+    )
+    # 形如 08:30:00 的连续时间会产生重叠的候选位置，按正则的扫描顺序逐个取舍
+    if len(candidates) > 1 and (np.diff(candidates) < TIME_LENGTH).any():
+        accepted = []
+        next_start = 0
+        for start in candidates.tolist():
+            if start >= next_start:
+                accepted.append(start)
+                next_start = start + TIME_LENGTH
+        candidates = np.array(accepted, dtype=np.int64)
+    return candidates
+
+
+def extract_punches(block):
+    """
+    从日期列块中提取每格的首次/末次打卡时间
+
+    所有单元格以 \x00 分隔拼接成一个字符串并转为码点数组，用数组运算查找 HH:MM，
+    匹配位置通过偏移量映射回单元格，时分由码点直接计算
+
+    参数:
+        block (pd.DataFrame): 员工 × 日期 的原始打卡单元格
+
+    返回:
+        tuple: (values, texts, first, last, count)
+            values 为原始单元格，texts 为 str(单元格)，均为二维对象数组；
+            first/last 为分钟数（无打卡为 -1），count 为匹配到的时间个数
+    """
+    n_rows, n_days = block.shape
+    n_cells = n_rows * n_days
+    values = block.to_numpy(dtype=object)
+    texts = block.astype(str).to_numpy(dtype=object)
+
+    first = np.full(n_cells, -1, dtype=np.int16)
+    last = np.full(n_cells, -1, dtype=np.int16)
+    count = np.zeros(n_cells, dtype=np.int16)
+
+    # None 与 analyze_day 中的 `if not cell` 一致，视为没有打卡
+    scan_texts = texts.ravel().copy()
+    scan_texts[(values == None).ravel()] = ''  # noqa: E711  逐元素比较
+    joined = CELL_SEPARATOR.join(scan_texts)
+    chars = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32)
+    starts = _find_times(chars)
+
+    if len(starts):
+        # 每个单元格在拼接串中的起始位置（分隔符之后）
+        offsets = np.concatenate(([0], np.flatnonzero(chars == ord(CELL_SEPARATOR)) + 1))
+        cells = np.searchsorted(offsets, starts, side='right') - 1
+
+        digits = chars.astype(np.int32) - ord('0')
+        minutes = ((digits[starts] * 10 + digits[starts + 1]) * 60
+                   + digits[starts + 3] * 10 + digits[starts + 4])
+
+        # 匹配结果按位置有序，同一单元格的匹配连续排列
+        boundaries = np.flatnonzero(np.diff(cells, prepend=-1))
+        matched = cells[boundaries]
+        first[matched] = np.minimum.reduceat(minutes, boundaries)
+        last[matched] = np.maximum.reduceat(minutes, boundaries)
+        count[matched] = np.diff(np.append(boundaries, len(cells)))
+
+    shape = (n_rows, n_days)
+    return values, texts, first.reshape(shape), last.reshape(shape), count.reshape(shape)
+
+
+def classify(first, last, count, holiday_mask, morning_limit, evening_limit,
+             half_day_absent, full_day_absent, early_leave_threshold):
+    """
+    按打卡规则计算状态编码
+
+    参数:
+        first, last, count (np.ndarray): extract_punches 的结果
+        holiday_mask (np.ndarray): 休息日标记，可按日期列 (n_days,) 或按单元格 (n_rows, n_days) 广播
+        其余参数: 以分钟表示的阈值，可为标量或可广播的数组
+    """
+    first = first.astype(np.int32)
+    last = last.astype(np.int32)
+
+    late = np.where(first > morning_limit, first - morning_limit, 0)
+    afternoon = last >= NOON
+    early = np.where(afternoon & (last < evening_limit), evening_limit - last, 0)
+
+    is_late = late > 0
+    is_early = afternoon & (early >= early_leave_threshold)
+
+    codes = np.select(
+        [
+            late >= full_day_absent,
+            late >= half_day_absent,
+            is_late & is_early,
+            is_late,
+            is_early,
+        ],
+        [CODE_ABSENT_FULL, CODE_ABSENT_HALF, CODE_LATE_EARLY, CODE_LATE, CODE_EARLY],
+        default=CODE_NORMAL,
+    )
+    codes = np.where(count < 2, CODE_MISSING, codes)
+
+    holiday = np.broadcast_to(np.asarray(holiday_mask, dtype=bool), codes.shape)
+    codes = np.where(holiday, np.where(count == 0, CODE_BLANK, CODE_RAW), codes)
+    return codes.astype(np.int8)
+
+
+def _format_minutes(minutes):
+    """分钟数组 → 'HH:MM' 字符串数组"""
+    return MINUTE_LABELS[minutes]
+
+
+def shown_missing_text(codes, values, texts):
+    """
+    缺卡单元格是否追加原文：单元格为 None/空字符串/'nan'/'None' 字符串时只输出缺卡，否则追加原文
+    （NaN 单元格 str 后为 'nan'，但它不等于字符串 'nan'，按原规则仍会追加）
+    """
+    hidden = np.isin(texts, HIDDEN_CELL_TEXTS) & ~(pd.isna(values) & (values != None))  # noqa: E711
+    return (codes == CODE_MISSING) & ~hidden
+
+
+def render_codes(codes, first, last, texts, shown):
+    """
+    根据状态编码统一生成状态文本
+
+    参数:
+        texts: 单元格原文，只用到休息日有打卡和需要追加原文的缺卡单元格
+        shown: 需要追加原文的缺卡单元格（shown_missing_text 的结果）
+    """
+    result = np.full(codes.shape, '', dtype=object)
+
+    # 休息日有打卡：原样输出
+    raw = codes == CODE_RAW
+    result[raw] = texts[raw]
+
+    missing = (codes == CODE_MISSING)
+    result[missing & ~shown] = "缺卡(1天)"
+    if shown.any():
+        result[shown] = "缺卡(1天) " + pd.Series(texts[shown]).to_numpy(dtype=object)
+
+    timed = codes >= CODE_ABSENT_FULL
+    if timed.any():
+        labels = np.array([TIMED_LABELS.get(code, '') for code in range(CODE_LATE_EARLY + 1)], dtype=object)
+        times_str = ("(" + _format_minutes(first[timed]) + ", " + _format_minutes(last[timed]) + ")")
+        result[timed] = labels[codes[timed]] + times_str
+    return result
+
+
+def render(codes, values, texts, first, last):
+    """根据状态编码统一生成状态文本"""
+    return render_codes(codes, first, last, texts, shown_missing_text(codes, values, texts))
+
+
+def _threshold(value):
+    """阈值统一为分钟数；数组按员工排列，扩展一维以便与日期列广播"""
+    if isinstance(value, np.ndarray):
+        return value.reshape(-1, 1) if value.ndim == 1 else value
+    return to_minutes(value)
+
+
+def evaluate_codes(block, holiday_mask, morning_limit, evening_limit,
+                   half_day_absent, full_day_absent, early_leave_threshold):
+    """
+    对整块日期列计算状态编码，参数同 evaluate_block
+
+    返回:
+        tuple: (values, texts, first, last, codes)
+    """
+    values, texts, first, last, count = extract_punches(block)
+    codes = classify(
+        first, last, count, holiday_mask,
+        _threshold(morning_limit), _threshold(evening_limit),
+        _threshold(half_day_absent), _threshold(full_day_absent),
+        _threshold(early_leave_threshold),
+    )
+    return values, texts, first, last, codes
+
+
+def evaluate_block(block, holiday_mask, morning_limit, evening_limit,
+                   half_day_absent, full_day_absent, early_leave_threshold):
+    """
+    对整块日期列计算考勤状态文本
+
+    参数:
+        block (pd.DataFrame): 员工 × 日期 的原始打卡单元格
+        holiday_mask: 休息日标记，按日期列 (n_days,) 或按单元格 (n_rows, n_days)
+        其余参数: 阈值，可为 datetime/timedelta/分钟数，或按员工广播的分钟数组
+
+    返回:
+        np.ndarray: 与 block 同形状的状态文本数组
+    """
+    values, texts, first, last, codes = evaluate_codes(
+        block, holiday_mask, morning_limit, evening_limit,
+        half_day_absent, full_day_absent, early_leave_threshold,
+    )
+    return render(codes, values, texts, first, last)
@@ -40,6 +40,7 @@ required_files=(
     "freework_chage.py"
     "overwork_chage.py"
     "attendance_summary.py"
+    "pipeline.py"
     "config.py"
     "holidays.py"
     "../data/original/basic.xlsx"
@@ -95,90 +96,19 @@ log_file="$log_dir/complete_run_${timestamp}.log"
 echo "📝 日志文件: $log_file"
 echo ""
 
-# 定义脚本执行函数
-run_script() {
-    local script_name=$1
-    local script_file=$2
-    local step_number=$3
-    local total_steps=$4
-    
-    echo "=========================================="
-    echo "步骤 $step_number/$total_steps: 执行 $script_name"
-    echo "开始时间: $(date '+%H:%M:%S')"
-    echo "=========================================="
-    
-    # 创建单独的日志文件
-    local script_log="$log_dir/${script_name}_${timestamp}.log"
-    
-    # 执行脚本并记录日志
-    python3 "$script_file" 2>&1 | tee "$script_log"
-    
-    local exit_code=${PIPESTATUS[0]}
-    
-    echo ""
-    echo "步骤 $step_number/$total_steps 完成时间: $(date '+%H:%M:%S')"
-    
-    if [ $exit_code -eq 0 ]; then
-        echo "✅ $script_name 执行成功!"
-    else
-        echo "❌ $script_name 执行失败 (退出代码: $exit_code)"
-        echo "📋 请查看日志文件: $script_log"
-        return $exit_code
-    fi
-    
-    echo ""
-    return 0
-}
-
-# 定义脚本列表
-declare -a scripts=(
-    "basic_combined.py:基础数据合并"
-    "business_combine.py:业务数据合并"
-    "freework_combine.py:自由工作数据合并"
-    "overwork_combine.py:加班数据合并"
-    "business_chage.py:业务数据变更"
-    "freework_chage.py:自由工作数据变更"
-    "overwork_chage.py:加班数据变更"
-    "attendance_summary.py:考勤汇总"
-)
-
-total_steps=${#scripts[@]}
-current_step=0
-overall_success=true
-
+# 在同一个 Python 进程内按依赖关系运行全部阶段（见 pipeline.py）
 echo "🚀 开始执行完整数据处理流程..."
-echo "总共 $total_steps 个步骤"
 echo ""
 
-# 执行所有脚本
-for script_info in "${scripts[@]}"; do
-    current_step=$((current_step + 1))
-    
-    # 解析脚本信息
-    script_file=$(echo "$script_info" | cut -d':' -f1)
-    script_name=$(echo "$script_info" | cut -d':' -f2)
-    
-    # 执行脚本
-    if ! run_script "$script_name" "$script_file" "$current_step" "$total_steps"; then
-        overall_success=false
-        echo "❌ 在第 $current_step 步失败，停止执行"
-        break
-    fi
-    
-    # 在步骤之间添加短暂延迟
-    if [ $current_step -lt $total_steps ]; then
-        echo "⏳ 等待 2 秒后继续下一个步骤..."
-        sleep 2
-        echo ""
-    fi
-done
+python3 pipeline.py 2>&1 | tee "$log_file"
+exit_code=${PIPESTATUS[0]}
 
 echo ""
 echo "=========================================="
 echo "完整流程执行完成时间: $(date '+%Y-%m-%d %H:%M:%S')"
 
 # 检查整体执行结果
-if [ "$overall_success" = true ]; then
+if [ $exit_code -eq 0 ]; then
     echo "🎉 所有脚本执行成功!"
     echo "📊 考勤分析完整流程已完成"
     echo "✅ 数据已成功处理并保存到数据库"
@@ -189,15 +119,7 @@ fi
 
 echo ""
 echo "📋 执行摘要:"
-echo "- 总步骤数: $total_steps"
-echo "- 成功步骤: $current_step"
 echo "- 主日志文件: $log_file"
-echo "- 各步骤日志: $log_dir/*_${timestamp}.log"
 echo "=========================================="
 
-# 返回适当的退出代码
-if [ "$overall_success" = true ]; then
-    exit 0
-else
-    exit 1
-fi 
\ No newline at end of file
+exit $exit_code
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+考勤分析合并服务
+在一个进程中挂载运行与下载（download_api）、文件上传（simple_upload_api）和休息日配置（holiday_chage_api）三组接口。
+上传的文件保存后立即在后台解析，解析结果登记到 ingest_cache 并写入解析缓存，
+之后运行流水线时解析阶段直接使用这些结果，只做分析和导出
+
+用法:
+    python3 service.py                                   # 监听 8900 端口
+    uvicorn service:app --host 0.0.0.0 --port 8900
+"""
+
+import contextlib
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any
+from fastapi import FastAPI
+import uvicorn
+
+import download_api
+import holiday_chage_api
+import parallel_ingest
+import simple_upload_api
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 上传文件的预解析状态 {文件名: 状态}
+_preparse = {}
+_preparse_lock = threading.Lock()
+
+def _set_status(paths, **fields):
+    with _preparse_lock:
+        for path in paths:
+            _preparse.setdefault(os.path.basename(path), {'filename': os.path.basename(path)}).update(fields)
+
+def preparse(paths):
+    """在任务工作线程中解析上传的文件，与流水线任务按提交顺序执行"""
+    _set_status(paths, state='parsing', start_time=datetime.now().isoformat())
+    started = time.perf_counter()
+    try:
+        counts = parallel_ingest.ingest_files(paths)
+    except Exception as e:
+        _set_status(paths, state='failed', error=str(e), end_time=datetime.now().isoformat())
+        return
+    
+    elapsed = round(time.perf_counter() - started, 3)
+    for path in paths:
+        rows = counts.get(path)
+        if path not in counts:
+            state, error = 'skipped', '不是流水线的源文件'
+        elif rows is None:
+            state, error = 'failed', '解析失败，运行时由对应阶段重新解析'
+        else:
+            state, error = 'ready', None
+        _set_status([path], state=state, rows=rows, elapsed=elapsed, error=error,
+                    end_time=datetime.now().isoformat())
+
+def schedule_preparse(paths):
+    """上传完成后把预解析排入任务队列，之后提交的流水线任务会在预解析完成后开始"""
+    _set_status(paths, state='queued', rows=None, elapsed=None, error=None,
+                uploaded_time=datetime.now().isoformat(), start_time=None, end_time=None)
+    download_api.submit_background(preparse, paths)
+
+simple_upload_api.add_upload_listener(schedule_preparse)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """启动时切换到 work 目录：各接口使用相对它的路径（../data/original、各阶段的源文件路径等）"""
+    os.chdir(BASE_DIR)
+    yield
+
+app = FastAPI(
+    title="考勤分析系统",
+    description="运行考勤分析、下载报表、上传源文件和配置休息日",
+    version="1.0.0",
+    lifespan=lifespan
+)
+app.add_middleware(download_api.SelectiveGZipMiddleware, **download_api.GZIP_OPTIONS)
+app.include_router(download_api.router)
+app.include_router(simple_upload_api.router)
+app.include_router(holiday_chage_api.router)
+
+@app.get("/api/preparse-status")
+async def get_preparse_status() -> Dict[str, Any]:
+    """获取上传文件的预解析状态（queued / parsing / ready / failed）"""
+    with _preparse_lock:
+        files = [dict(status) for status in _preparse.values()]
+    return {
+        "success": True,
+        "files": files,
+        "ready": bool(files) and all(status["state"] == "ready" for status in files)
+    }
+
+@app.get("/")
+async def root():
+    """根路径，返回API信息"""
+    return {
+        "message": "考勤分析系统",
+        "version": "1.0.0",
+        "endpoints": {
+            **download_api.ENDPOINTS,
+            "POST /upload": "上传7个源文件，保存后在后台预解析",
+            "GET /api/preparse-status": "获取上传文件的预解析状态",
+            "POST /update_config": "更新休息日配置",
+            "GET /calendar/{year}/{month}": "查询某月的工作日历"
+        }
+    }
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8900)
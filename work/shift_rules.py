@@ -0,0 +1,82 @@
+"""
+考勤组班次规则
+每个考勤组的迟到、早退判定时间和旷工阈值；未列出的考勤组以及规则中未填写的项使用 DEFAULT_RULE。
+规则表在导入时编译为按考勤组排列的阈值数组，thresholds() 按每行的考勤组下标取出逐行阈值，
+打卡规则（punch_rules）对整块日期列一次计算，不按员工或考勤组分支
+"""
+
+import numpy as np
+import pandas as pd
+
+# 默认规则
+DEFAULT_RULE = {
+    'morning_limit': "08:33",   # 上班打卡晚于此时间记为迟到；None 表示不判迟到（弹性班次）
+    'evening_limit': "18:00",   # 下午的下班打卡早于此时间时按早退判断；None 表示不判早退
+    'early_leave': 30,          # 早于下班时间达到该分钟数才记为早退
+    'half_day_absent': 30,      # 迟到达到该分钟数记旷工0.5天
+    'full_day_absent': 180,     # 迟到达到该分钟数记旷工1天
+}
+
+# 各考勤组的规则（按考勤组名称精确匹配），只需填写与默认规则不同的项，例如:
+#     "CDTL-冬令时": {'evening_limit': "17:30"},
+#     "弹性班次": {'morning_limit': None, 'evening_limit': None},
+GROUP_RULES = {}
+
+THRESHOLD_FIELDS = tuple(DEFAULT_RULE)
+
+# 不判迟到 / 早退时使用的阈值（分钟）：打卡时间不会晚于 99:59，也不会早于 00:00
+NEVER_LATE = 100 * 60
+NEVER_EARLY = 0
+
+def _to_minutes(field, value):
+    if field in ('morning_limit', 'evening_limit'):
+        if value is None:
+            return NEVER_LATE if field == 'morning_limit' else NEVER_EARLY
+        hour, _, minute = str(value).partition(':')
+        if not (hour.isdigit() and minute.isdigit() and int(minute) < 60):
+            raise ValueError(f"无效的时间: {field}={value!r}（格式如 08:30）")
+        return int(hour) * 60 + int(minute)
+    return int(value)
+
+def rule_for(group):
+    """考勤组的完整规则（默认规则加上该组的设置）"""
+    return {**DEFAULT_RULE, **GROUP_RULES.get(group, {})}
+
+def compile_rules(group_rules=None):
+    """
+    把规则表编译为阈值数组
+
+    返回:
+        tuple: ({考勤组: 下标}, {阈值名: 按下标排列的分钟数组})，下标 0 为默认规则
+    """
+    group_rules = GROUP_RULES if group_rules is None else group_rules
+    unknown = {field for rule in group_rules.values() for field in rule} - set(THRESHOLD_FIELDS)
+    if unknown:
+        raise ValueError(f"未知的班次规则项: {sorted(unknown)}")
+
+    groups = list(group_rules)
+    rules = [DEFAULT_RULE] + [{**DEFAULT_RULE, **group_rules[group]} for group in groups]
+    table = {
+        field: np.array([_to_minutes(field, rule[field]) for rule in rules], dtype=np.int32)
+        for field in THRESHOLD_FIELDS
+    }
+    return {group: i + 1 for i, group in enumerate(groups)}, table
+
+COMPILED = compile_rules()
+
+def thresholds(groups, compiled=None):
+    """
+    按每行的考勤组取出逐行阈值
+
+    参数:
+        groups: 每行的考勤组名称（Series 或列表）
+        compiled: compile_rules() 的结果，默认使用 GROUP_RULES 编译的结果
+
+    返回:
+        dict: {阈值名: (行数,) 的分钟数组}
+    """
+    index, table = compiled or COMPILED
+    # 先把考勤组名称编码为唯一值下标，再映射到规则下标，不在规则表中的考勤组（含空值）使用默认规则
+    codes, uniques = pd.factorize(pd.Series(groups, dtype=object))
+    rule_index = np.array([index.get(group, 0) for group in uniques] + [0], dtype=np.intp)[codes]
+    return {field: table[field][rule_index] for field in THRESHOLD_FIELDS}
@@ -2,18 +2,107 @@
 # -*- coding: utf-8 -*-
 """
 简单的文件上传API - 7个参数对应7个文件
+各文件按固定大小分块写入临时文件，边写边计算 SHA-256，7 个文件同时写入；
+写完后原子替换 data/original 中的同名文件，内容与原文件相同时保留原文件。
+保存完成后通知登记的回调（如 service.py 在后台预先解析上传的文件）
 """
 
+import asyncio
+import hashlib
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import stat
+import tempfile
+from fastapi import APIRouter, FastAPI, UploadFile, File, HTTPException
 import uvicorn
 
-app = FastAPI(title="简单文件上传API", version="1.0.0")
+import ingest_cache
+
+# 上传接口路由，由本模块的 app 和 service.py 的合并服务共同挂载
+router = APIRouter()
 
 # 目标目录
 UPLOAD_DIR = "../data/original"
 
-@app.post("/upload")
+# 上传完成后调用的回调 callback(已保存文件的路径列表)，在事件循环中调用，不能阻塞
+_upload_listeners = []
+
+def add_upload_listener(callback):
+    _upload_listeners.append(callback)
+
+# 每次读取和写入的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 进程的 umask（os.umask 只能在设置的同时读取，启动时读取一次）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _write_chunk(f, digest, chunk):
+    f.write(chunk)
+    digest.update(chunk)
+
+def _target_mode(file_path):
+    """替换后的文件权限：沿用原文件的权限，原文件不存在时与普通新建的文件一致（mkstemp 建立的临时文件为 0600）"""
+    try:
+        return stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+def _finish(f, file_path):
+    """临时文件落盘并关闭，返回目标位置原文件的 SHA-256（原文件不存在时为 None）"""
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    return ingest_cache.file_digest(file_path) if os.path.exists(file_path) else None
+
+async def save_upload(file, filename):
+    """
+    把上传的文件分块写入目标目录下的临时文件，完成后原子替换目标文件
+
+    返回:
+        dict: filename / size_mb / sha256 / changed(内容是否与原文件不同)
+    """
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    # 临时文件与目标文件在同一目录，os.replace 才是原子的
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=f".{filename}.", suffix=".part")
+    f = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            await asyncio.to_thread(_write_chunk, f, digest, chunk)
+        
+        sha256 = digest.hexdigest()
+        previous = await asyncio.to_thread(_finish, f, file_path)
+        changed = previous != sha256
+        # 内容与原文件相同时保留原文件及其修改时间
+        if changed:
+            os.chmod(tmp_path, _target_mode(file_path))
+            os.replace(tmp_path, file_path)
+            # 流水线读取该文件时直接使用这里算好的哈希；原文件的预解析结果已过期，立即释放
+            ingest_cache.remember_digest(file_path, sha256)
+            ingest_cache.discard_preloaded(file_path)
+        else:
+            os.remove(tmp_path)
+    except BaseException:
+        f.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        await file.close()
+    
+    return {
+        "filename": filename,
+        "size_mb": round(size / (1024 * 1024), 2),
+        "sha256": sha256,
+        "changed": changed
+    }
+
+@router.post("/upload")
 async def upload_files(
     basic: UploadFile = File(...),
     business01: UploadFile = File(...),
@@ -23,7 +112,7 @@ async def upload_files(
     overwork01: UploadFile = File(...),
     overwork02: UploadFile = File(...)
 ):
-    """上传7个文件，每个参数对应一个文件"""
+    """上传7个文件，每个参数对应一个文件；返回每个文件的 SHA-256 以及内容是否有变化"""
     
     # 确保上传目录存在
     os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -42,40 +131,46 @@ async def upload_files(
     uploaded = []
     errors = []
     
+    # 检查文件扩展名
+    accepted = {}
     for filename, file in files.items():
-        try:
-            # 检查文件扩展名
-            if not file.filename.lower().endswith('.xlsx'):
-                errors.append(f"{filename}: 不是Excel文件")
-                continue
-            
-            # 保存文件
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            content = await file.read()
-            
-            with open(file_path, "wb") as f:
-                f.write(content)
-            
-            uploaded.append({
-                "filename": filename,
-                "size_mb": round(len(content) / (1024 * 1024), 2)
-            })
-            
-        except Exception as e:
-            errors.append(f"{filename}: {str(e)}")
+        if not file.filename.lower().endswith('.xlsx'):
+            errors.append(f"{filename}: 不是Excel文件")
+        else:
+            accepted[filename] = file
+    
+    # 同时保存各文件，单个文件失败不影响其他文件
+    results = await asyncio.gather(
+        *(save_upload(file, filename) for filename, file in accepted.items()),
+        return_exceptions=True
+    )
+    for filename, result in zip(accepted, results):
+        if isinstance(result, Exception):
+            errors.append(f"{filename}: {str(result)}")
+        else:
+            uploaded.append(result)
+    
+    if uploaded:
+        paths = [os.path.abspath(os.path.join(UPLOAD_DIR, item["filename"])) for item in uploaded]
+        for callback in _upload_listeners:
+            callback(paths)
     
     return {
         "success": len(errors) == 0,
         "uploaded": uploaded,
         "errors": errors,
         "total_uploaded": len(uploaded),
-        "total_errors": len(errors)
+        "total_errors": len(errors),
+        "changed": [item["filename"] for item in uploaded if item["changed"]]
     }
 
+app = FastAPI(title="简单文件上传API", version="1.0.0")
+app.include_router(router)
+
 @app.get("/")
 async def root():
     """根路径"""
     return {"message": "简单文件上传API", "endpoint": "/upload"}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8901) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8901)
@@ -0,0 +1,168 @@
+"""
+SQLite 本地存储
+把 sqlite3 连接包装成与 psycopg2 连接相同的用法：接受 psycopg2.sql 组合的语句和 %s 占位符，
+第一条语句自动开始事务，commit()/rollback() 结束事务。
+中间表每次运行都会重建，放在本地文件或内存中可以省去访问远程数据库的网络往返
+"""
+
+import os
+import re
+import sqlite3
+
+import numpy as np
+from psycopg2 import sql
+
+# numpy 数值按 Python 数值写入
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+sqlite3.register_adapter(np.float64, float)
+
+_PARAM_PATTERN = re.compile(r'%(s|%)')
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+def render(query):
+    """把 psycopg2.sql 组合的语句转换为字符串（占位符保持 %s）"""
+    if isinstance(query, sql.Composed):
+        return ''.join(render(part) for part in query.seq)
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return '.'.join(_quote(part) for part in query.strings)
+    if isinstance(query, sql.Placeholder):
+        if query.name:
+            raise ValueError("SQLite 后端不支持命名占位符")
+        return '%s'
+    if isinstance(query, sql.Composable):
+        raise ValueError(f"SQLite 后端不支持的语句片段: {query!r}")
+    return query
+
+def _translate(query, has_params):
+    """psycopg2 只在带参数时解析 %s / %%，这里保持一致"""
+    text = render(query)
+    if has_params:
+        text = _PARAM_PATTERN.sub(lambda m: '?' if m.group(1) == 's' else '%', text)
+    return text
+
+def _split_part(text, delimiter, index):
+    """Postgres split_part(): 按分隔符切分后取第 index 段（从 1 开始），不足时返回空字符串"""
+    if text is None:
+        return None
+    parts = text.split(delimiter)
+    return parts[index - 1] if 0 < index <= len(parts) else ''
+
+class SQLiteCursor:
+    """psycopg2 风格的游标"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+
+    def _begin(self):
+        if not self.connection.raw.in_transaction:
+            # 立即取得写锁，避免两个连接都先读后写时互相等待
+            self._cursor.execute("BEGIN IMMEDIATE")
+
+    def execute(self, query, vars=None):
+        self._begin()
+        self._cursor.execute(_translate(query, vars is not None), () if vars is None else vars)
+        return None
+
+    def executemany(self, query, vars_list):
+        self._begin()
+        self._cursor.executemany(_translate(query, True), vars_list)
+        return None
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size if size is not None else self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SQLiteConnection:
+    """
+    psycopg2 风格的 SQLite 连接
+
+    参数:
+        path (str): 数据库文件路径，":memory:" 为纯内存数据库
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 事务由 SQLiteCursor 显式开始，关闭 sqlite3 模块自带的隐式事务
+        self.raw = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.raw.execute("PRAGMA journal_mode=WAL" if path != ':memory:' else "PRAGMA journal_mode=MEMORY")
+        self.raw.execute("PRAGMA synchronous=OFF")
+        self.raw.execute("PRAGMA foreign_keys=ON")
+        self.raw.create_function("split_part", 3, _split_part, deterministic=True)
+
+    @property
+    def closed(self):
+        return self.raw is None
+
+    def attach(self, name, path):
+        """附加另一个数据库文件，表名以 name. 限定（对应 Postgres 的 schema）"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.raw.execute(f"ATTACH DATABASE ? AS {_quote(name)}", (path,))
+        self.raw.execute(f"PRAGMA {_quote(name)}.journal_mode=WAL")
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    def close(self):
+        if self.raw is not None:
+            self.rollback()
+            self.raw.close()
+            self.raw = None
+
+def table_columns(conn, table):
+    """返回 [(列名, 声明类型, 主键序号)]，不属于主键的列序号为 0"""
+    cursor = conn.raw.execute(f"PRAGMA table_info({_quote(table)})")
+    return [(row[1], row[2] or 'TEXT', row[5]) for row in cursor.fetchall()]
+
+def table_indexes(conn, table):
+    """用 CREATE INDEX 建立的索引: [(索引名, [列名])]"""
+    indexes = []
+    for row in conn.raw.execute(f"PRAGMA index_list({_quote(table)})").fetchall():
+        name, origin = row[1], row[3]
+        if origin != 'c':
+            continue
+        columns = [info[2] for info in conn.raw.execute(f"PRAGMA index_info({_quote(name)})").fetchall()]
+        indexes.append((name, columns))
+    return indexes
@@ -0,0 +1,82 @@
+"""
+增量重算的回归测试：删除一条审批记录后，增量模式的考勤结果应与全量重建一致
+
+在本地 SQLite 上运行流水线（数据库放在临时目录中），使用 data/original 中的样例数据
+"""
+
+import os
+import sys
+
+import pytest
+
+WORK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WORK_DIR not in sys.path:
+    sys.path.insert(0, WORK_DIR)
+
+import business_combine
+import db
+import pipeline
+from attendance_merge import DAY_FIELDS
+from employees import EMPLOYEE_KEY
+
+# 要删除的出差记录：尹娜 5 月 20 日至 24 日，24 日为休息日且没有打卡，删除后该单元格应为空
+REMOVED_TRIP = ('尹娜', '2025-05-20 上午')
+
+# 流水线每次运行都会重新加载阶段模块；函数的 globals 即模块的字典，重新加载后原函数仍可调用
+_load_combined_data = business_combine.load_combined_data
+
+def load_without_trip():
+    """business_combine.load_combined_data 的替代：去掉 REMOVED_TRIP 这条记录"""
+    df = _load_combined_data()
+    removed = (df['姓名'] == REMOVED_TRIP[0]) & (df['开始时间'] == REMOVED_TRIP[1])
+    assert removed.sum() == 1
+    return df[~removed]
+
+def run(tmp_path, name, incremental=False, remove_trip=False):
+    overrides = {'config': {
+        'SQLITE_PATH': str(tmp_path / f'{name}.db'),
+        'HISTORY_SQLITE_PATH': str(tmp_path / f'{name}_history.db'),
+        'PUBLISH_TO_POSTGRES': False,
+    }}
+    if remove_trip:
+        overrides['business_combine'] = {'load_combined_data': load_without_trip}
+    result = pipeline.run_pipeline(capture_output=False, incremental=incremental, backend='sqlite',
+                                   overrides=overrides)
+    assert result['success'], [(r['stage'], r['status']) for r in result['stages']]
+    return {r['stage']: r['status'] for r in result['stages']}
+
+def day_cells():
+    """{员工ID: (姓名, 第1天, …, 第31天)}"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'SELECT "{EMPLOYEE_KEY}", 姓名, {", ".join(DAY_FIELDS)} FROM attendance_result')
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+@pytest.fixture(autouse=True)
+def restore_modules():
+    """运行结束后按默认配置重新加载各模块，并断开临时目录中的数据库"""
+    yield
+    pipeline.load_stage_modules()
+    db.close_pool()
+
+def test_removed_approval_matches_full_rebuild(tmp_path):
+    # 原始数据全量运行后删除一条出差记录，增量重算
+    run(tmp_path, 'incremental')
+    before = day_cells()
+    statuses = run(tmp_path, 'incremental', incremental=True, remove_trip=True)
+    assert statuses['incremental'] == 'success'
+    incremental = day_cells()
+
+    # 同样的数据全量重建
+    run(tmp_path, 'full', remove_trip=True)
+    full = day_cells()
+
+    assert incremental == full
+    employee_id = next(i for i, cells in full.items() if cells[0] == REMOVED_TRIP[0])
+    day = DAY_FIELDS.index('第24天') + 1
+    assert before[employee_id][day].startswith('出差')
+    assert full[employee_id][day] == ''
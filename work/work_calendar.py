@@ -0,0 +1,158 @@
+"""
+工作日历
+按月份保存休息日，可以覆盖任意多个年月：配置过的月份列出该月全部休息日，未配置的月份按周六、周日休息。
+每个日期的标记为 工作日 / 休息日 / 调休上班（周六、周日但不休息）。
+
+日历保存在 config.CALENDAR_FILE（JSON）中，由休息日配置接口（holiday_chage_api.py）写入；
+各月份的休息日在首次读取时转换为 NumPy 布尔数组并缓存，按日期下标直接查询。
+文件被修改后（包括其他进程写入），下次读取时自动重新加载，运行中的服务不需要重启
+"""
+
+import calendar
+import json
+import os
+import threading
+from datetime import date
+
+import numpy as np
+
+from config import CALENDAR_FILE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CALENDAR_PATH = os.path.join(BASE_DIR, CALENDAR_FILE)
+
+# 日期标记
+WORKDAY = 0
+REST_DAY = 1
+MAKEUP_DAY = 2
+FLAG_NAMES = {WORKDAY: "工作日", REST_DAY: "休息日", MAKEUP_DAY: "调休上班"}
+
+# 已加载的日历: 文件 mtime、内容及按月份缓存的休息日数组
+_state = {'mtime_ns': None, 'data': None, 'masks': {}}
+_lock = threading.Lock()
+
+def month_key(year, month):
+    return f"{int(year)}-{int(month):02d}"
+
+def _read():
+    try:
+        with open(CALENDAR_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    data.setdefault('current', None)
+    data.setdefault('months', {})
+    return data
+
+def _mtime():
+    try:
+        return os.stat(CALENDAR_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _loaded():
+    """当前日历内容（调用方持有 _lock），文件修改过时重新加载并清空缓存"""
+    mtime_ns = _mtime()
+    if _state['data'] is None or _state['mtime_ns'] != mtime_ns:
+        _state.update(mtime_ns=mtime_ns, data=_read(), masks={})
+    return _state['data']
+
+def reload():
+    """丢弃缓存，下次读取时重新加载日历文件"""
+    with _lock:
+        _state['data'] = None
+
+def months():
+    """配置过休息日的月份 [(年, 月)]，按时间排序"""
+    with _lock:
+        keys = sorted(_loaded()['months'])
+    return [(int(key[:4]), int(key[5:])) for key in keys]
+
+def is_configured(year, month):
+    with _lock:
+        return month_key(year, month) in _loaded()['months']
+
+def current_month():
+    """当前处理的月份 (年, 月)：最近一次设为当前的月份，没有时为最新配置的月份，再没有时为本月"""
+    with _lock:
+        data = _loaded()
+        key = data['current'] or max(data['months'], default=None)
+    if key is None:
+        today = date.today()
+        return today.year, today.month
+    return int(key[:4]), int(key[5:])
+
+def rest_mask(year, month):
+    """该月每天是否休息（长度为当月天数的只读布尔数组，下标 0 为 1 日）"""
+    key = month_key(year, month)
+    with _lock:
+        data = _loaded()
+        mask = _state['masks'].get(key)
+        if mask is None:
+            n_days = calendar.monthrange(int(year), int(month))[1]
+            configured = data['months'].get(key)
+            if configured is None:
+                mask = np.array([calendar.weekday(int(year), int(month), day) >= 5
+                                 for day in range(1, n_days + 1)], dtype=bool)
+            else:
+                mask = np.zeros(n_days, dtype=bool)
+                mask[[int(day) - 1 for day in configured]] = True
+            mask.setflags(write=False)
+            _state['masks'][key] = mask
+    return mask
+
+def rest_by_day(year, month):
+    """按日期下标的休息日标记（长度 32，下标即日期，0 和超出月末的日期为 False），用于 REST_DAYS[day] 查询"""
+    by_day = np.zeros(32, dtype=bool)
+    mask = rest_mask(year, month)
+    by_day[1:len(mask) + 1] = mask
+    by_day.setflags(write=False)
+    return by_day
+
+def day_flags(year, month):
+    """该月每天的标记数组（WORKDAY / REST_DAY / MAKEUP_DAY），下标 0 为 1 日"""
+    mask = rest_mask(year, month)
+    weekend = np.array([calendar.weekday(int(year), int(month), day) >= 5
+                        for day in range(1, len(mask) + 1)], dtype=bool)
+    return np.where(mask, REST_DAY, np.where(weekend, MAKEUP_DAY, WORKDAY)).astype(np.int8)
+
+def rest_days(year, month):
+    """该月的休息日列表（"DD" 格式）"""
+    return [f"{day:02d}" for day in np.flatnonzero(rest_mask(year, month)) + 1]
+
+def working_days(year, month):
+    """应出勤天数（当月天数减去休息日）"""
+    mask = rest_mask(year, month)
+    return int(len(mask) - mask.sum())
+
+def set_month(year, month, days, make_current=True):
+    """
+    保存一个月的全部休息日（覆盖该月原有配置），先写临时文件再原子替换日历文件
+
+    参数:
+        days (list): 休息日，"DD" 字符串或整数
+        make_current (bool): 是否同时设为当前处理的月份
+    """
+    year, month = int(year), int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f"无效的月份: {month}")
+    n_days = calendar.monthrange(year, month)[1]
+    normalized = sorted({int(day) for day in days})
+    invalid = [day for day in normalized if not 1 <= day <= n_days]
+    if invalid:
+        raise ValueError(f"{month_key(year, month)} 没有这些日期: {invalid}")
+
+    with _lock:
+        data = _loaded()
+        data['months'][month_key(year, month)] = [f"{day:02d}" for day in normalized]
+        if make_current:
+            data['current'] = month_key(year, month)
+        data['months'] = dict(sorted(data['months'].items()))
+
+        os.makedirs(os.path.dirname(CALENDAR_PATH), exist_ok=True)
+        tmp_path = f"{CALENDAR_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        os.replace(tmp_path, CALENDAR_PATH)
+        _state.update(mtime_ns=_mtime(), data=data, masks={})